@@ -1,9 +1,12 @@
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
 from dotenv import load_dotenv
+import asyncio
+import logging
 import os
 import json
 from agents.prompt_library import router_knowledge_instructions
+from agents.registry import bind_agent, register_agent
 
 # Import specialized agents (or their factories)
 from agents.content_agent import get_content_agent
@@ -13,62 +16,156 @@ from agents.static_ad_agent import get_static_ad_agent
 from agents.email_agent import get_email_agent
 from agents.message_agent import get_message_agent
 from knowledge_base import get_knowledge_base
+from resilience import arun_agent_with_resilience, current_request_id, hop_timeout
 
 load_dotenv()
 
-def get_agent(user_id: str = "default"):
+logger = logging.getLogger(__name__)
+
+# Shared deadline for one parallel dispatch; keep below AI_TIMEOUT_SECONDS so the
+# router still has time to compose its answer from partial results.
+ROUTER_DISPATCH_TIMEOUT_SECONDS = float(os.getenv("ROUTER_DISPATCH_TIMEOUT_SECONDS", "35"))
+ROUTER_MAX_PARALLEL_TASKS = int(os.getenv("ROUTER_MAX_PARALLEL_TASKS", "6"))
+
+# Specialist name -> factory(user_id); the agents come from the shared template registry.
+SPECIALISTS = {
+    "content": lambda user_id: get_content_agent(user_id=user_id),
+    "analytics": lambda user_id: get_analytics_agent(),
+    "ugc": lambda user_id: get_ugc_agent(),
+    "static_ad": lambda user_id: get_static_ad_agent(),
+    "email": lambda user_id: get_email_agent(),
+    "message": lambda user_id: get_message_agent(),
+}
+
+
+async def run_specialist(name: str, prompt: str, user_id: str) -> str:
+    """Run one specialist through the resilience layer, bounded by the router's remaining budget."""
+    agent = SPECIALISTS[name](user_id)
+    if agent is None:
+        raise RuntimeError(f"agent {name} unavailable")
+    response = await arun_agent_with_resilience(
+        agent_name=name,
+        prompt=prompt,
+        request_id=current_request_id(),
+        run_agent=lambda p: agent.arun(p),
+    )
+    return response.content
+
+
+async def _run_specialist_tool(name: str, prompt: str, user_id: str) -> str:
+    # A failed specialist becomes a tool result, so the router can still answer in time.
+    try:
+        return await run_specialist(name, prompt, user_id)
+    except Exception as exc:
+        logger.warning("router_specialist_failed agent=%s error=%s", name, exc)
+        return f"Erro: o agente {name} não respondeu a tempo ({type(exc).__name__})."
+
+
+async def dispatch_specialist_tasks(
+    tasks: list[dict],
+    user_id: str,
+    timeout_seconds: float | None = None,
+) -> list[dict]:
+    """Run specialist tasks concurrently under one shared deadline.
+
+    Every task gets an entry in the result, in input order: status "ok" with
+    the content, "timeout" if it missed the deadline, or "error". Tasks past
+    ROUTER_MAX_PARALLEL_TASKS are not run and come back as errors.
     """
-    Returns the Interceptor Agent (Router) for the Umbra AI platform.
+    if timeout_seconds is None:
+        timeout_seconds = min(ROUTER_DISPATCH_TIMEOUT_SECONDS, hop_timeout())
+    timeout_seconds = max(timeout_seconds, 0)
+    results: list[dict] = []
+    running: dict[int, asyncio.Task] = {}
+    for index, task in enumerate(tasks):
+        name = str(task.get("agent", "")).strip().lower()
+        prompt = str(task.get("prompt", "")).strip()
+        results.append({"agent": name, "status": "error", "content": None})
+        if index >= ROUTER_MAX_PARALLEL_TASKS:
+            results[index]["error"] = f"not run: at most {ROUTER_MAX_PARALLEL_TASKS} tasks per call"
+        elif name not in SPECIALISTS:
+            results[index]["error"] = f"unknown agent; use one of: {', '.join(SPECIALISTS)}"
+        elif not prompt:
+            results[index]["error"] = "prompt empty"
+        else:
+            running[index] = asyncio.create_task(run_specialist(name, prompt, user_id))
+
+    if running:
+        _, pending = await asyncio.wait(running.values(), timeout=timeout_seconds)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    for index, task in running.items():
+        if task.cancelled():
+            results[index]["status"] = "timeout"
+            results[index]["error"] = f"no answer within {timeout_seconds:g}s"
+        elif task.exception() is not None:
+            logger.warning("router_dispatch_failed agent=%s error=%s", results[index]["agent"], task.exception())
+            results[index]["error"] = type(task.exception()).__name__
+        else:
+            results[index]["status"] = "ok"
+            results[index]["content"] = task.result()
+    return results
+
+
+def _caller(agent: Agent) -> str:
+    return agent.user_id or "default"
+
+
+# Router tools. agno injects the running ``agent``, so the tools read the user it
+# was bound to instead of closing over it, and one router template serves every user.
+async def run_content_agent(prompt: str, agent: Agent) -> str:
+    """Call this to generate social media posts, captions, or articles."""
+    # We run the specialist agent and return its response string
+    return await _run_specialist_tool("content", prompt, _caller(agent))
+
+
+async def run_analytics_agent(prompt: str, agent: Agent) -> str:
+    """Call this to perform web searches or analyze market data."""
+    return await _run_specialist_tool("analytics", prompt, _caller(agent))
+
+
+async def run_ugc_agent(prompt: str, agent: Agent) -> str:
+    """Call this to generate UGC video scripts (TikTok/Reels)."""
+    return await _run_specialist_tool("ugc", prompt, _caller(agent))
+
+
+async def run_static_ad_agent(prompt: str, agent: Agent) -> str:
+    """Call this to generate static ad copy and visual briefing."""
+    return await _run_specialist_tool("static_ad", prompt, _caller(agent))
+
+
+async def run_email_agent(prompt: str, agent: Agent) -> str:
+    """Call this to generate email marketing content."""
+    return await _run_specialist_tool("email", prompt, _caller(agent))
+
+
+async def run_message_agent(prompt: str, agent: Agent) -> str:
+    """Call this to generate direct message scripts for WhatsApp/DM/SMS."""
+    return await _run_specialist_tool("message", prompt, _caller(agent))
+
+
+async def dispatch_specialists(tasks: list[dict[str, str]], agent: Agent) -> str:
+    """Call this when the user asks for several pieces at once (e.g. a post, an email and an ad).
+
+    tasks: list of {"agent": "content" | "analytics" | "ugc" | "static_ad" | "email" | "message", "prompt": "..."}.
+    The specialists run in parallel; the result is a JSON list with one entry per task
+    (status "ok", "timeout" or "error"). Use whatever came back even if some tasks failed.
+    """
+    results = await dispatch_specialist_tasks(tasks, user_id=_caller(agent))
+    return json.dumps(results, ensure_ascii=False)
+
+
+def _build_router_agent():
+    """
+    Builds the Interceptor Agent (Router) template for the Umbra AI platform.
     This agent acts as the main entry point for the chat interface.
     """
-    
-    # 1. Platform knowledge and routing instructions
-    platform_knowledge = "\n".join(router_knowledge_instructions())
-
-    # 2. Tool Definitions
-    # Wrappers around other agents to allow the Router to call them
-    def run_content_agent(prompt: str) -> str:
-        """Call this to generate social media posts, captions, or articles."""
-        agent = get_content_agent(user_id=user_id)
-        # We run the specialist agent and return its response string
-        response = agent.run(prompt)
-        return response.content
-
-    def run_analytics_agent(prompt: str) -> str:
-        """Call this to perform web searches or analyze market data."""
-        agent = get_analytics_agent()
-        response = agent.run(prompt)
-        return response.content
-    
-    def run_ugc_agent(prompt: str) -> str:
-        """Call this to generate UGC video scripts (TikTok/Reels)."""
-        agent = get_ugc_agent()
-        response = agent.run(prompt)
-        return response.content
-
-    def run_static_ad_agent(prompt: str) -> str:
-        """Call this to generate static ad copy and visual briefing."""
-        agent = get_static_ad_agent()
-        response = agent.run(prompt)
-        return response.content
-
-    def run_email_agent(prompt: str) -> str:
-        """Call this to generate email marketing content."""
-        agent = get_email_agent()
-        response = agent.run(prompt)
-        return response.content
-
-    def run_message_agent(prompt: str) -> str:
-        """Call this to generate direct message scripts for WhatsApp/DM/SMS."""
-        agent = get_message_agent()
-        response = agent.run(prompt)
-        return response.content
-
-    # 3. Initialize the Router Agent
-    agent = Agent(
+    return Agent(
         model=OpenAIChat(id="gpt-4o"), # Recommend GPT-4o for routing intelligence
         description="Você é o Agente Interceptador e Router da Umbra AI.",
-        instructions=[platform_knowledge],
+        instructions=["\n".join(router_knowledge_instructions())],
         tools=[
             run_content_agent,
             run_analytics_agent,
@@ -76,8 +173,17 @@ def get_agent(user_id: str = "default"):
             run_static_ad_agent,
             run_email_agent,
             run_message_agent,
+            dispatch_specialists,
         ],
         markdown=True
     )
-    
-    return agent
+
+
+register_agent("router", _build_router_agent)
+
+
+def get_agent(user_id: str = "default"):
+    """
+    Returns the Router bound to ``user_id``; its tools run the specialists for that user.
+    """
+    return bind_agent("router", user_id=user_id)
@@ -3,20 +3,37 @@ from agno.models.openai import OpenAIChat
 from agno.tools.duckduckgo import DuckDuckGoTools
 from datetime import datetime
 from agents.prompt_library import analytics_agent_instructions
-from agents.research_tools import search_web, discover_copy_trends, benchmark_angle_scan
+from agents.registry import bind_agent, register_agent
+from agents.research_tools import search_web, search_web_multi, discover_copy_trends, benchmark_angle_scan
 
-def get_analytics_agent():
+
+def _current_date() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def _build_analytics_agent():
     """
-    Returns the Analytics Agent specialized in research and data analysis.
+    Builds the Analytics Agent template specialized in research and data analysis.
     """
     # Get current date for context
-    current_date = datetime.now().strftime("%Y-%m-%d")
+    current_date = _current_date()
     
     agent = Agent(
         model=OpenAIChat(id="gpt-4o"), # Upgraded to gpt-4o for better research capabilities
         description="Você é um Analista de Dados e Pesquisador de Mercado Senior.",
         instructions=analytics_agent_instructions(current_date=current_date),
-        tools=[DuckDuckGoTools(), search_web, discover_copy_trends, benchmark_angle_scan],
+        tools=[DuckDuckGoTools(), search_web, search_web_multi, discover_copy_trends, benchmark_angle_scan],
         markdown=True
     )
     return agent
+
+
+# The reference date is baked into the instructions, so rebuild once per day.
+register_agent("analytics", _build_analytics_agent, cache_key=_current_date)
+
+
+def get_analytics_agent():
+    """
+    Returns the Analytics Agent specialized in research and data analysis.
+    """
+    return bind_agent("analytics")
@@ -3,25 +3,38 @@ from agno.models.openai import OpenAIChat
 from agno.tools.duckduckgo import DuckDuckGoTools
 from knowledge_base import get_knowledge_base
 from agents.prompt_library import content_agent_instructions
-from agents.research_tools import search_web, discover_copy_trends, benchmark_angle_scan
+from agents.registry import bind_agent, register_agent
+from agents.research_tools import search_web, search_web_multi, discover_copy_trends, benchmark_angle_scan
 
-def get_content_agent(user_id: str = "default"):
+def _build_content_agent():
     """
-    Returns the Content Agent specialized in writing and editing.
+    Builds the Content Agent template specialized in writing and editing.
     It uses the Knowledge Base to retrieve user style/voice.
     """
     kb = get_knowledge_base()
     
     agent = Agent(
         model=OpenAIChat(id="gpt-4o-mini"),
-        user_id=user_id,
         description="Você é um Editor e Criador de Conteúdo de IA especialista.",
         instructions=content_agent_instructions(),
-        tools=[DuckDuckGoTools(), search_web, discover_copy_trends, benchmark_angle_scan],
+        tools=[DuckDuckGoTools(), search_web, search_web_multi, discover_copy_trends, benchmark_angle_scan],
         knowledge=kb,
-        knowledge_filters={"user_id": user_id} if kb is not None else None,
         search_knowledge=kb is not None, # Only enable if KB is valid
         markdown=True,
         show_tool_calls=False,
     )
     return agent
+
+
+# Rebuild the template if the knowledge base becomes available (or is replaced).
+register_agent("content", _build_content_agent, cache_key=lambda: id(get_knowledge_base()))
+
+
+def get_content_agent(user_id: str = "default"):
+    """
+    Returns the Content Agent bound to ``user_id`` (user-scoped knowledge filters).
+    """
+    agent = bind_agent("content", user_id=user_id)
+    if agent.knowledge is not None:
+        agent.knowledge_filters = {"user_id": user_id}
+    return agent
@@ -3,11 +3,12 @@ from agno.models.openai import OpenAIChat
 from dotenv import load_dotenv
 import os
 from agents.prompt_library import message_agent_instructions
-from agents.research_tools import search_web, discover_copy_trends, benchmark_angle_scan
+from agents.registry import bind_agent, register_agent
+from agents.research_tools import search_web, search_web_multi, discover_copy_trends, benchmark_angle_scan
 
 load_dotenv()
 
-def get_message_agent():
+def _build_message_agent():
     """
     Returns an Agent specialized in short Direct Messages and WhatsApp scripts.
     """
@@ -15,6 +16,14 @@ def get_message_agent():
         model=OpenAIChat(id="gpt-4o"),
         description="Você é um especialista em Marketing de Conversação e Scripts de Vendas.",
         instructions=message_agent_instructions(),
-        tools=[search_web, discover_copy_trends, benchmark_angle_scan],
+        tools=[search_web, search_web_multi, discover_copy_trends, benchmark_angle_scan],
         markdown=False,
     )
+
+
+register_agent("message", _build_message_agent)
+
+
+def get_message_agent():
+    """Returns a per-request clone of the cached message agent template."""
+    return bind_agent("message")
@@ -10,6 +10,7 @@ def _common_quality_rules() -> list[str]:
     return [
         "Escreva em portugues do Brasil, salvo pedido explicito em outro idioma.",
         "Nao invente fatos. Quando depender de dado atual ou tendencia recente, use as tools de pesquisa.",
+        "Para varias buscas de uma vez (concorrentes, angulos, tendencias), prefira search_web_multi a chamar search_web repetidamente.",
         "Se houver incerteza relevante, explicite a incerteza e siga com a melhor recomendacao pratica.",
         "Evite respostas vagas. Traga recomendacoes acionaveis, com passos claros e prioridade.",
     ]
@@ -108,6 +109,7 @@ def router_knowledge_instructions() -> list[str]:
         "Fluxo de decisao:",
         "1) Se for duvida de produto/plataforma, responda diretamente.",
         "2) Se for tarefa curta, delegue para o agente especialista correto via tool.",
+        "Se o pedido tiver varias pecas curtas (ex.: post + email + anuncio), delegue todas de uma vez com dispatch_specialists.",
         "3) Se for tarefa longa/complexa (projeto completo, multiplas pecas, processo extenso), retorne acao de navegacao.",
         "Quando redirecionar, responda apenas JSON valido com este formato:",
         '{"type":"action","action":"navigate","path":"/dashboard/caminho","message":"Explicacao curta"}.',
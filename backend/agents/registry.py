@@ -0,0 +1,97 @@
+"""Process-wide registry of specialist agent templates.
+
+Each agent is built once (model client, tools, instructions) and reused.
+Requests receive a copy made with agno's ``Agent.deep_copy``, with their own
+per-request fields bound. The copy shares the model client and knowledge base
+with the template, so building ``OpenAIChat`` clients stays off the hot path.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Hashable
+
+from agno.agent import Agent
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_builders: dict[str, tuple[Callable[[], Agent | None], Callable[[], Hashable] | None]] = {}
+_templates: dict[str, tuple[Hashable, Agent | None]] = {}
+
+
+def register_agent(
+    name: str,
+    builder: Callable[[], Agent | None],
+    cache_key: Callable[[], Hashable] | None = None,
+) -> None:
+    """Register a template builder.
+
+    cache_key: optional callable whose value invalidates the template when it
+    changes (e.g. current date baked into instructions, knowledge base instance).
+    """
+    with _lock:
+        _builders[name] = (builder, cache_key)
+        _templates.pop(name, None)
+
+
+def get_template(name: str) -> Agent | None:
+    """Return the cached template for ``name``, (re)building it if needed."""
+    builder, cache_key = _builders[name]
+    key = cache_key() if cache_key else None
+
+    cached = _templates.get(name)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    with _lock:
+        cached = _templates.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        template = builder()
+        _templates[name] = (key, template)
+        logger.info("agent_template_built agent=%s", name)
+        return template
+
+
+def bind_agent(name: str, **overrides: Any) -> Agent | None:
+    """Return a per-request copy of the ``name`` template with ``overrides`` applied."""
+    template = get_template(name)
+    if template is None:
+        return None
+    return template.deep_copy(update=overrides)
+
+
+def template_version(name: str) -> str:
+    """Short hash of what shapes the template's output (model, description, instructions, tools).
+
+    Changes whenever the prompt library or agent definition changes, so it can
+    be part of cache keys for generated responses.
+    """
+    template = get_template(name)
+    if template is None:
+        return ""
+    model = getattr(template, "model", None)
+    instructions = template.instructions
+    if callable(instructions):
+        instructions = "<callable>"
+    tools = [getattr(tool, "__name__", type(tool).__name__) for tool in template.tools or []]
+    material = repr((getattr(model, "id", None), template.description, instructions, tools))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+def warm_agents(names: list[str] | None = None) -> None:
+    """Build templates ahead of the first request (called at startup)."""
+    for name in names or list(_builders):
+        try:
+            get_template(name)
+        except Exception:
+            logger.exception("Falha ao pré-carregar agente %s", name)
+
+
+def clear_agent_cache() -> None:
+    with _lock:
+        _templates.clear()
@@ -5,14 +5,33 @@ Tools return JSON strings to maximize compatibility with LLM tool-calling output
 
 from __future__ import annotations
 
+import contextvars
 import json
 import logging
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from typing import Any
+from urllib.parse import urlsplit, urlunsplit
 
 from ddgs import DDGS
 
+from agents.search_cache import get_search_cache, search_cache_key, search_cache_ttl
+from tracing import span
+
 logger = logging.getLogger(__name__)
 
+RESEARCH_MAX_PARALLEL_SEARCHES = int(os.getenv("RESEARCH_MAX_PARALLEL_SEARCHES", "4"))
+RESEARCH_QUERY_TIMEOUT_SECONDS = float(os.getenv("RESEARCH_QUERY_TIMEOUT_SECONDS", "10"))
+RESEARCH_MAX_QUERIES = 8
+
+# Shared by every multi-query call so concurrent agents cannot multiply search sessions.
+_search_pool = ThreadPoolExecutor(
+    max_workers=max(RESEARCH_MAX_PARALLEL_SEARCHES, 1),
+    thread_name_prefix="research-search",
+)
+
 _RECENCY_MAP = {
     "day": "d",
     "week": "w",
@@ -31,7 +50,8 @@ def _normalize_limit(max_results: int, default: int = 6) -> int:
 def _run_search(query: str, max_results: int, recency: str, region: str) -> list[dict[str, Any]]:
     time_limit = _RECENCY_MAP.get(recency.lower(), "m")
 
-    with DDGS() as ddgs:
+    # DDGS enforces the timeout on its HTTP calls, so a hung search frees its pool thread.
+    with DDGS(timeout=max(math.ceil(RESEARCH_QUERY_TIMEOUT_SECONDS), 1)) as ddgs:
         raw_results = list(
             ddgs.text(
                 keywords=query,
@@ -55,6 +75,19 @@ def _run_search(query: str, max_results: int, recency: str, region: str) -> list
     return normalized
 
 
+def _cached_search(query: str, max_results: int, recency: str, region: str) -> list[dict[str, Any]]:
+    with span("search_web.query", recency=recency, max_results=max_results) as search_span:
+        cache = get_search_cache()
+        key = search_cache_key(query, recency, region, max_results)
+        results = cache.get(key)
+        search_span.set_attribute("cache_hit", results is not None)
+        if results is None:
+            results = _run_search(query=query, max_results=max_results, recency=recency, region=region)
+            cache.set(key, results, search_cache_ttl(recency))
+        search_span.set_attribute("results", len(results))
+        return results
+
+
 def search_web(
     query: str,
     max_results: int = 6,
@@ -71,7 +104,7 @@ def search_web(
 
     limit = _normalize_limit(max_results)
     try:
-        results = _run_search(query=query.strip(), max_results=limit, recency=recency, region=region)
+        results = _cached_search(query=query.strip(), max_results=limit, recency=recency, region=region)
         return json.dumps(
             {
                 "ok": True,
@@ -90,6 +123,108 @@ def search_web(
         )
 
 
+def _url_identity(url: str) -> str:
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), parts.query, ""))
+
+
+def _wait_per_query(futures: dict[str, Future], started: dict[str, float]) -> set[str]:
+    """Wait until every query finished or ran for RESEARCH_QUERY_TIMEOUT_SECONDS; return the timed-out ones.
+
+    A query's clock starts when a pool thread picks it up, so queries queued
+    behind a slow one keep their full timeout. Queries still queued once the
+    pool had time for every wave are cancelled and reported as timed out too.
+    """
+    timeout = RESEARCH_QUERY_TIMEOUT_SECONDS
+    waves = math.ceil(len(futures) / max(RESEARCH_MAX_PARALLEL_SEARCHES, 1))
+    give_up_at = time.monotonic() + timeout * (waves + 1)
+    pending = dict(futures)
+    timed_out: set[str] = set()
+
+    while True:
+        now = time.monotonic()
+        for query in [q for q, future in pending.items() if future.done()]:
+            del pending[query]
+        for query in [q for q in pending if q in started and now - started[q] >= timeout]:
+            timed_out.add(query)
+            del pending[query]
+        if not pending:
+            return timed_out
+        if now >= give_up_at:
+            for query, future in pending.items():
+                future.cancel()
+                timed_out.add(query)
+            return timed_out
+        next_check = min((started[q] + timeout for q in pending if q in started), default=now + timeout)
+        wait(pending.values(), timeout=min(next_check, give_up_at) - now, return_when=FIRST_COMPLETED)
+
+
+def search_web_multi(
+    queries: list[str],
+    max_results: int = 4,
+    recency: str = "month",
+    region: str = "wt-wt",
+) -> str:
+    """Run several web searches at once and return one merged JSON payload.
+
+    Prefer this over repeated search_web calls when you need a broad scan
+    (competitors, angles, trends from different sides). Up to 8 queries;
+    results are deduplicated by URL and list which queries found them.
+    recency: day, week, month, year, all.
+    """
+    cleaned = list(dict.fromkeys(q.strip() for q in queries or [] if isinstance(q, str) and q.strip()))
+    if not cleaned:
+        return json.dumps({"ok": False, "error": "queries empty", "results": []}, ensure_ascii=False)
+    cleaned = cleaned[:RESEARCH_MAX_QUERIES]
+
+    limit = _normalize_limit(max_results, default=4)
+    started: dict[str, float] = {}
+
+    def timed_search(query: str) -> list[dict[str, Any]]:
+        started[query] = time.monotonic()
+        return _cached_search(query=query, max_results=limit, recency=recency, region=region)
+
+    with span("search_web_multi", queries=len(cleaned)):
+        # Each search runs in a copy of this context, so its span nests under this one.
+        futures = {
+            query: _search_pool.submit(contextvars.copy_context().run, timed_search, query)
+            for query in cleaned
+        }
+        timed_out = _wait_per_query(futures, started)
+
+    statuses: list[dict[str, Any]] = []
+    merged: dict[str, dict[str, Any]] = {}
+    for query, future in futures.items():
+        if query in timed_out:
+            statuses.append({"query": query, "ok": False, "error": "timeout"})
+            continue
+        exc = future.exception()
+        if exc is not None:
+            logger.warning("search_web_multi query failed query=%s error=%s", query, exc)
+            statuses.append({"query": query, "ok": False, "error": f"search failed: {type(exc).__name__}"})
+            continue
+
+        results = future.result()
+        statuses.append({"query": query, "ok": True, "count": len(results)})
+        for item in results:
+            identity = _url_identity(item["url"]) if item.get("url") else f"{query}:{item.get('title')}"
+            if identity in merged:
+                merged[identity]["queries"].append(query)
+            else:
+                merged[identity] = {**item, "queries": [query]}
+
+    return json.dumps(
+        {
+            "ok": any(status["ok"] for status in statuses),
+            "recency": recency,
+            "region": region,
+            "queries": statuses,
+            "results": list(merged.values()),
+        },
+        ensure_ascii=False,
+    )
+
+
 def discover_copy_trends(
     niche: str,
     platform: str = "instagram",
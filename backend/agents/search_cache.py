@@ -0,0 +1,165 @@
+"""
+Result cache for the web-search research tools.
+
+Normalized search results are kept in a size-bounded in-process LRU with a
+TTL that depends on the search recency (a "day" search goes stale much sooner
+than a "year" one). An optional SQLite tier (SEARCH_CACHE_PATH) shares results
+across workers and restarts.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))
+# Empty value disables the shared SQLite tier.
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "")
+
+SEARCH_CACHE_TTL_SECONDS = {
+    "day": 15 * 60,
+    "week": 60 * 60,
+    "month": 6 * 60 * 60,
+    "year": 24 * 60 * 60,
+    "all": 24 * 60 * 60,
+}
+
+SEARCH_CACHE_LOOKUPS_TOTAL = Counter(
+    "umbra_search_cache_lookups_total",
+    "Web search cache lookups by tier and result",
+    ["tier", "result"],
+)
+
+SearchKey = tuple[str, str, str, int]
+
+
+def search_cache_key(query: str, recency: str, region: str, max_results: int) -> SearchKey:
+    return (" ".join(query.lower().split()), recency.lower(), region.lower(), max_results)
+
+
+def search_cache_ttl(recency: str) -> float:
+    return SEARCH_CACHE_TTL_SECONDS.get(recency.lower(), SEARCH_CACHE_TTL_SECONDS["month"])
+
+
+class _DiskTier:
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_results "
+                "(key TEXT PRIMARY KEY, results TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> tuple[list[dict[str, Any]], float] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT results, expires_at FROM search_results WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1] - time.time()
+
+    def set(self, key: str, results: list[dict[str, Any]], ttl: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_results (key, results, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(results, ensure_ascii=False), time.time() + ttl),
+            )
+            self._conn.execute("DELETE FROM search_results WHERE expires_at <= ?", (time.time(),))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SearchCache:
+    def __init__(self, max_entries: int = SEARCH_CACHE_MAX_ENTRIES, path: str = SEARCH_CACHE_PATH):
+        self.max_entries = max(max_entries, 1)
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[SearchKey, tuple[float, list[dict[str, Any]]]] = OrderedDict()
+        self._disk: _DiskTier | None = None
+        if path:
+            try:
+                self._disk = _DiskTier(path)
+            except Exception:
+                logger.exception("Não foi possível abrir o cache de buscas em %s", path)
+
+    def get(self, key: SearchKey) -> list[dict[str, Any]] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                SEARCH_CACHE_LOOKUPS_TOTAL.labels(tier="memory", result="hit").inc()
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+        SEARCH_CACHE_LOOKUPS_TOTAL.labels(tier="memory", result="miss").inc()
+
+        if self._disk is None:
+            return None
+        try:
+            stored = self._disk.get(json.dumps(key))
+        except Exception:
+            logger.exception("Falha ao ler cache de buscas")
+            stored = None
+        if stored is None:
+            SEARCH_CACHE_LOOKUPS_TOTAL.labels(tier="disk", result="miss").inc()
+            return None
+
+        SEARCH_CACHE_LOOKUPS_TOTAL.labels(tier="disk", result="hit").inc()
+        results, remaining_ttl = stored
+        self._remember(key, results, remaining_ttl)
+        return results
+
+    def set(self, key: SearchKey, results: list[dict[str, Any]], ttl: float) -> None:
+        self._remember(key, results, ttl)
+        if self._disk is not None:
+            try:
+                self._disk.set(json.dumps(key), results, ttl)
+            except Exception:
+                logger.exception("Falha ao gravar cache de buscas")
+
+    def _remember(self, key: SearchKey, results: list[dict[str, Any]], ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+
+_cache_lock = threading.Lock()
+_search_cache: SearchCache | None = None
+
+
+def get_search_cache() -> SearchCache:
+    global _search_cache
+
+    if _search_cache is None:
+        with _cache_lock:
+            if _search_cache is None:
+                _search_cache = SearchCache()
+    return _search_cache
@@ -3,11 +3,12 @@ from agno.models.openai import OpenAIChat
 from dotenv import load_dotenv
 import os
 from agents.prompt_library import static_ad_agent_instructions
-from agents.research_tools import search_web, discover_copy_trends, benchmark_angle_scan
+from agents.registry import bind_agent, register_agent
+from agents.research_tools import search_web, search_web_multi, discover_copy_trends, benchmark_angle_scan
 
 load_dotenv()
 
-def get_static_ad_agent():
+def _build_static_ad_agent():
     """
     Returns an Agent specialized in creating copy for Static Ads (Facebook/Instagram/Display).
     """
@@ -15,6 +16,14 @@ def get_static_ad_agent():
         model=OpenAIChat(id="gpt-4o"),
         description="Você é um Copywriter de Anúncios Estáticos de Alta Conversão.",
         instructions=static_ad_agent_instructions(),
-        tools=[search_web, discover_copy_trends, benchmark_angle_scan],
+        tools=[search_web, search_web_multi, discover_copy_trends, benchmark_angle_scan],
         markdown=False,
     )
+
+
+register_agent("static_ad", _build_static_ad_agent)
+
+
+def get_static_ad_agent():
+    """Returns a per-request clone of the cached static ad agent template."""
+    return bind_agent("static_ad")
@@ -3,11 +3,12 @@ from agno.models.openai import OpenAIChat
 from dotenv import load_dotenv
 import os
 from agents.prompt_library import ugc_agent_instructions
-from agents.research_tools import search_web, discover_copy_trends, benchmark_angle_scan
+from agents.registry import bind_agent, register_agent
+from agents.research_tools import search_web, search_web_multi, discover_copy_trends, benchmark_angle_scan
 
 load_dotenv()
 
-def get_ugc_agent():
+def _build_ugc_agent():
     """
     Returns an Agent specialized in creating viral video scripts (UGC).
     """
@@ -15,6 +16,14 @@ def get_ugc_agent():
         model=OpenAIChat(id="gpt-4o"),
         description="Você é um Roteirista Viral de classe mundial para TikTok e Reels.",
         instructions=ugc_agent_instructions(),
-        tools=[search_web, discover_copy_trends, benchmark_angle_scan],
+        tools=[search_web, search_web_multi, discover_copy_trends, benchmark_angle_scan],
         markdown=False,
     )
+
+
+register_agent("ugc", _build_ugc_agent)
+
+
+def get_ugc_agent():
+    """Returns a per-request clone of the cached UGC agent template."""
+    return bind_agent("ugc")
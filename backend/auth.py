@@ -1,18 +1,31 @@
 """
 JWT authentication dependency for FastAPI.
 
-Validates Supabase access tokens using the project's JWT secret.
-Requires SUPABASE_JWT_SECRET environment variable.
+Validates Supabase access tokens: HS256 tokens with the project's JWT secret
+(SUPABASE_JWT_SECRET) and RS256/ES256 tokens against the project's JWKS
+(SUPABASE_JWKS_URL, see jwks.py). At least one of the two must be configured.
+
+Verified payloads are kept in a small LRU keyed by a hash of the token, so a
+client sending the same bearer token on every call pays for signature
+verification once per AUTH_TOKEN_CACHE_TTL_SECONDS at most (never past the
+token's exp). Rotating the secret or the key set drops every cached payload.
 """
 
+import hashlib
 import os
 import logging
+import threading
+import time
+from collections import OrderedDict
 from typing import Optional
 
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from dotenv import load_dotenv
+from prometheus_client import Counter
+
+from jwks import JWKS_ALGORITHMS, get_jwks
 
 load_dotenv()
 
@@ -31,22 +44,120 @@ SUPER_ADMIN_ROLES = {
     for role in os.getenv("SUPER_ADMIN_ROLES", "super_admin,admin,owner").split(",")
     if role.strip()
 }
+AUTH_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", "4096"))
+# Upper bound on how long a verified token is trusted without re-checking; 0 disables the cache.
+AUTH_TOKEN_CACHE_TTL_SECONDS = float(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", "300"))
+
+AUTH_TOKEN_CACHE_LOOKUPS_TOTAL = Counter(
+    "umbra_auth_token_cache_lookups_total",
+    "Verified-JWT cache lookups by result",
+    ["result"],
+)
+
+
+class VerifiedTokenCache:
+    """LRU of verified JWT payloads, bound to the keys that verified them."""
+
+    def __init__(
+        self,
+        max_entries: int = AUTH_TOKEN_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = AUTH_TOKEN_CACHE_TTL_SECONDS,
+    ):
+        self.max_entries = max(max_entries, 1)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._verifier_fingerprint = ""
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _fingerprint(secret: str) -> str:
+        return hashlib.sha256(secret.encode("utf-8")).hexdigest()
+
+    def _check_verifier(self, verifier: str) -> None:
+        # Caller holds the lock.
+        fingerprint = self._fingerprint(verifier)
+        if fingerprint != self._verifier_fingerprint:
+            self._entries.clear()
+            self._verifier_fingerprint = fingerprint
+
+    def get(self, token: str, verifier: str) -> dict | None:
+        if self.ttl_seconds <= 0:
+            return None
+        key = self._key(token)
+        with self._lock:
+            self._check_verifier(verifier)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                AUTH_TOKEN_CACHE_LOOKUPS_TOTAL.labels(result="hit").inc()
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+        AUTH_TOKEN_CACHE_LOOKUPS_TOTAL.labels(result="miss").inc()
+        return None
+
+    def set(self, token: str, verifier: str, payload: dict) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, float(exp))
+        key = self._key(token)
+        with self._lock:
+            self._check_verifier(verifier)
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_token_cache = VerifiedTokenCache()
+
+
+def _verification_key(token: str, key_set) -> tuple[object, str]:
+    """Key and algorithm for ``token``, picked from its header; never fetches anything."""
+    header = jwt.get_unverified_header(token)
+    algorithm = header.get("alg")
+    if algorithm in JWKS_ALGORITHMS:
+        key = key_set.get(header.get("kid")) if key_set is not None else None
+        if key is None or key.algorithm_name != algorithm:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        return key.key, algorithm
+    if algorithm == "HS256" and SUPABASE_JWT_SECRET:
+        return SUPABASE_JWT_SECRET, algorithm
+    raise jwt.InvalidAlgorithmError(f"Unsupported algorithm {algorithm}")
 
 
 def _decode_token(token: str) -> dict:
     """Decode and verify a Supabase JWT. Returns the payload dict."""
-    if not SUPABASE_JWT_SECRET:
+    key_set = get_jwks()
+    if not SUPABASE_JWT_SECRET and key_set is None:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Auth not configured",
         )
+    verifier = f"{SUPABASE_JWT_SECRET}:{key_set.fingerprint if key_set else ''}"
+    cached = _token_cache.get(token, verifier)
+    if cached is not None:
+        return cached
     try:
+        key, algorithm = _verification_key(token, key_set)
         payload = jwt.decode(
             token,
-            SUPABASE_JWT_SECRET,
-            algorithms=["HS256"],
+            key,
+            algorithms=[algorithm],
             audience="authenticated",
         )
+        _token_cache.set(token, verifier, payload)
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -60,13 +171,19 @@ def _decode_token(token: str) -> dict:
         )
 
 
-async def get_current_user(
+async def get_current_user_payload(
+    request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer_scheme),
-) -> str:
-    """
-    FastAPI dependency that extracts and validates the Supabase JWT.
-    Returns the user ID (sub claim).
+) -> dict:
+    """FastAPI dependency that validates Supabase JWT and returns payload.
+
+    The payload is verified once per request and kept on request.state, so
+    every dependency that needs it shares the same result.
     """
+    payload = getattr(request.state, "auth_payload", None)
+    if payload is not None:
+        return payload
+
     if credentials is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -74,6 +191,18 @@ async def get_current_user(
         )
 
     payload = _decode_token(credentials.credentials)
+    request.state.auth_payload = payload
+    return payload
+
+
+async def get_current_user(
+    request: Request,
+    payload: dict = Depends(get_current_user_payload),
+) -> str:
+    """
+    FastAPI dependency that extracts and validates the Supabase JWT.
+    Returns the user ID (sub claim), also kept on request.state for rate-limit keys.
+    """
     user_id: Optional[str] = payload.get("sub")
 
     if not user_id:
@@ -82,22 +211,10 @@ async def get_current_user(
             detail="Invalid token payload",
         )
 
+    request.state.user_id = user_id
     return user_id
 
 
-async def get_current_user_payload(
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer_scheme),
-) -> dict:
-    """FastAPI dependency that validates Supabase JWT and returns payload."""
-    if credentials is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing authorization header",
-        )
-
-    return _decode_token(credentials.credentials)
-
-
 def _extract_user_role(payload: dict) -> str:
     """Extract role from common JWT claim locations used with Supabase."""
     app_metadata = payload.get("app_metadata") or {}
@@ -117,18 +234,23 @@ def _extract_user_role(payload: dict) -> str:
     return ""
 
 
-async def require_super_admin(
+async def get_current_user_role(
+    request: Request,
     payload: dict = Depends(get_current_user_payload),
 ) -> str:
-    """Allow access only to super-admin users via role claims or explicit allowlist."""
-    user_id: Optional[str] = payload.get("sub")
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token payload",
-        )
+    """FastAPI dependency returning the caller's role, extracted once per request."""
+    role = getattr(request.state, "user_role", None)
+    if role is None:
+        role = _extract_user_role(payload)
+        request.state.user_role = role
+    return role
+
 
-    user_role = _extract_user_role(payload)
+async def require_super_admin(
+    user_id: str = Depends(get_current_user),
+    user_role: str = Depends(get_current_user_role),
+) -> str:
+    """Allow access only to super-admin users via role claims or explicit allowlist."""
     if user_role in SUPER_ADMIN_ROLES or user_id in SUPER_ADMIN_USER_IDS:
         return user_id
 
@@ -0,0 +1,149 @@
+"""
+Signing keys for asymmetric Supabase access tokens (RS256 / ES256).
+
+The JWKS document is read from SUPABASE_JWKS_URL (an https:// URL, a file://
+URL or a plain path) at startup and then refreshed by a background task every
+JWKS_REFRESH_SECONDS, plus or minus a random jitter so workers do not all hit
+the endpoint at once. Token verification only looks keys up by ``kid`` in the
+in-memory set; it never fetches. A failed refresh keeps the previous keys.
+While no key set has loaded yet, failed fetches are retried after
+JWKS_RETRY_BASE_SECONDS, doubling up to the normal refresh interval.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import urllib.request
+from typing import Any
+
+import jwt
+
+logger = logging.getLogger(__name__)
+
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL", "")
+JWKS_REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+JWKS_REFRESH_JITTER_SECONDS = float(os.getenv("JWKS_REFRESH_JITTER_SECONDS", "60"))
+JWKS_FETCH_TIMEOUT_SECONDS = float(os.getenv("JWKS_FETCH_TIMEOUT_SECONDS", "5"))
+JWKS_RETRY_BASE_SECONDS = float(os.getenv("JWKS_RETRY_BASE_SECONDS", "2"))
+
+JWKS_ALGORITHMS = ("RS256", "ES256")
+
+
+class JwksKeySet:
+    def __init__(
+        self,
+        source: str,
+        refresh_seconds: float = JWKS_REFRESH_SECONDS,
+        jitter_seconds: float = JWKS_REFRESH_JITTER_SECONDS,
+        fetch_timeout_seconds: float = JWKS_FETCH_TIMEOUT_SECONDS,
+        retry_base_seconds: float = JWKS_RETRY_BASE_SECONDS,
+    ):
+        self.source = source
+        self.refresh_seconds = refresh_seconds
+        self.jitter_seconds = jitter_seconds
+        self.fetch_timeout_seconds = fetch_timeout_seconds
+        self.retry_base_seconds = retry_base_seconds
+        self._lock = threading.Lock()
+        self._keys: dict[str, jwt.PyJWK] = {}
+        self._fingerprint = ""
+        self._task: asyncio.Task | None = None
+
+    @property
+    def fingerprint(self) -> str:
+        """Changes whenever the loaded key set does; empty until the first load."""
+        return self._fingerprint
+
+    def get(self, kid: str | None) -> jwt.PyJWK | None:
+        if not kid:
+            return None
+        return self._keys.get(kid)
+
+    def _read_document(self) -> bytes:
+        if "://" not in self.source:
+            with open(self.source, "rb") as handle:
+                return handle.read()
+        with urllib.request.urlopen(self.source, timeout=self.fetch_timeout_seconds) as response:
+            return response.read()
+
+    @staticmethod
+    def _parse_keys(document: dict[str, Any]) -> dict[str, jwt.PyJWK]:
+        keys = {}
+        for key_data in document.get("keys", []):
+            kid = key_data.get("kid")
+            if not kid or key_data.get("use", "sig") != "sig":
+                continue
+            try:
+                key = jwt.PyJWK(key_data)
+            except jwt.PyJWTError as exc:
+                logger.warning("Chave JWKS ignorada kid=%s: %s", kid, exc)
+                continue
+            if key.algorithm_name in JWKS_ALGORITHMS:
+                keys[kid] = key
+        return keys
+
+    def load(self) -> None:
+        """Fetch and parse the key set, replacing the current keys only on success."""
+        raw = self._read_document()
+        keys = self._parse_keys(json.loads(raw))
+        if not keys:
+            raise ValueError(f"JWKS em {self.source} não tem chaves RS256/ES256 utilizáveis")
+        with self._lock:
+            self._keys = keys
+            self._fingerprint = hashlib.sha256(raw).hexdigest()
+        logger.info("jwks_loaded source=%s kids=%s", self.source, ",".join(sorted(keys)))
+
+    def next_refresh_delay(self, failures: int = 0) -> float:
+        """Regular refresh interval with jitter, or a short backoff while no keys are loaded."""
+        if failures and not self._keys:
+            backoff = min(self.retry_base_seconds * 2 ** (failures - 1), self.refresh_seconds)
+            return random.uniform(backoff / 2, backoff)
+        jitter = min(self.jitter_seconds, self.refresh_seconds / 2)
+        return self.refresh_seconds + random.uniform(-jitter, jitter)
+
+    async def _refresh_loop(self, failures: int = 0) -> None:
+        while True:
+            await asyncio.sleep(self.next_refresh_delay(failures))
+            try:
+                await asyncio.to_thread(self.load)
+                failures = 0
+            except Exception:
+                failures += 1
+                logger.exception("Falha ao atualizar JWKS de %s; mantendo as chaves atuais", self.source)
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        failures = 0
+        try:
+            await asyncio.to_thread(self.load)
+        except Exception:
+            # Asymmetric tokens are rejected until a retry succeeds; HS256 keeps working.
+            failures = 1
+            logger.exception("Falha ao carregar JWKS de %s", self.source)
+        self._task = asyncio.create_task(self._refresh_loop(failures))
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+_jwks_lock = threading.Lock()
+_jwks: JwksKeySet | None = None
+
+
+def get_jwks() -> JwksKeySet | None:
+    """Shared key set, or None when SUPABASE_JWKS_URL is not configured."""
+    global _jwks
+
+    if _jwks is None and SUPABASE_JWKS_URL:
+        with _jwks_lock:
+            if _jwks is None:
+                _jwks = JwksKeySet(SUPABASE_JWKS_URL)
+    return _jwks
@@ -1 +1 @@
-from .core import get_knowledge_base
+from .core import close_knowledge_base, get_knowledge_base
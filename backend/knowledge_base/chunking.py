@@ -0,0 +1,207 @@
+"""
+Chunking for document ingestion.
+
+Splits extracted text into overlapping chunks before embedding, so long
+documents become many focused vectors instead of one oversized embedding.
+Offsets always refer to the full extracted text of the document.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+
+KB_CHUNK_SIZE = int(os.getenv("KB_CHUNK_SIZE", "1500"))
+KB_CHUNK_OVERLAP = int(os.getenv("KB_CHUNK_OVERLAP", "200"))
+# "auto" picks per file type (pages for PDF, headings/paragraphs for md/docx);
+# "fixed" forces fixed-size windows for every type.
+KB_CHUNK_STRATEGY = os.getenv("KB_CHUNK_STRATEGY", "auto").lower()
+
+_HEADING_RE = re.compile(r"^#{1,6}\s+(.+?)\s*$")
+_PARAGRAPH_BREAK_RE = re.compile(r"\n\s*\n")
+
+
+@dataclass
+class Chunk:
+    text: str
+    start: int
+    end: int
+    page: int | None = None
+    section: str | None = None
+
+    def meta_data(self) -> dict:
+        meta = {"start_offset": self.start, "end_offset": self.end}
+        if self.page is not None:
+            meta["page"] = self.page
+        if self.section:
+            meta["section"] = self.section
+        return meta
+
+
+def _window_end(text: str, start: int, size: int) -> int:
+    """End of a window starting at ``start``, pulled back to whitespace when possible."""
+    end = min(start + size, len(text))
+    if end >= len(text):
+        return end
+
+    # Avoid cutting words in half; only look back over the last 20% of the window.
+    floor = start + int(size * 0.8)
+    cut = max(text.rfind("\n", floor, end), text.rfind(" ", floor, end))
+    return cut if cut > start else end
+
+
+def chunk_fixed(
+    text: str,
+    size: int = KB_CHUNK_SIZE,
+    overlap: int = KB_CHUNK_OVERLAP,
+    base_offset: int = 0,
+    page: int | None = None,
+    section: str | None = None,
+) -> list[Chunk]:
+    """Fixed-size windows with ``overlap`` characters shared between neighbours."""
+    if size <= 0:
+        raise ValueError("chunk size must be positive")
+    overlap = max(0, min(overlap, size // 2))
+
+    chunks: list[Chunk] = []
+    start = 0
+    while start < len(text):
+        end = _window_end(text, start, size)
+        piece = text[start:end]
+        if piece.strip():
+            chunks.append(
+                Chunk(
+                    text=piece.strip(),
+                    start=base_offset + start,
+                    end=base_offset + end,
+                    page=page,
+                    section=section,
+                )
+            )
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def _split_sections(text: str) -> list[tuple[int, int, str | None]]:
+    """Split markdown-style text at headings. Returns (start, end, heading) spans."""
+    spans: list[tuple[int, int, str | None]] = []
+    section_start = 0
+    heading: str | None = None
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        match = _HEADING_RE.match(line.rstrip("\n"))
+        if match and offset > section_start:
+            spans.append((section_start, offset, heading))
+            section_start = offset
+        if match:
+            heading = match.group(1)
+        offset += len(line)
+    if section_start < len(text):
+        spans.append((section_start, len(text), heading))
+    return spans
+
+
+def chunk_structured(
+    text: str,
+    size: int = KB_CHUNK_SIZE,
+    overlap: int = KB_CHUNK_OVERLAP,
+    base_offset: int = 0,
+    page: int | None = None,
+) -> list[Chunk]:
+    """Heading- and paragraph-aware chunking for markdown and DOCX text.
+
+    Paragraphs are packed into chunks up to ``size`` without crossing a heading;
+    a paragraph longer than ``size`` falls back to fixed windows.
+    """
+    chunks: list[Chunk] = []
+    for section_start, section_end, heading in _split_sections(text):
+        section = text[section_start:section_end]
+
+        paragraphs: list[tuple[int, int]] = []
+        cursor = 0
+        for match in _PARAGRAPH_BREAK_RE.finditer(section):
+            paragraphs.append((cursor, match.start()))
+            cursor = match.end()
+        paragraphs.append((cursor, len(section)))
+
+        pack_start: int | None = None
+        pack_end = 0
+        for para_start, para_end in paragraphs:
+            if not section[para_start:para_end].strip():
+                continue
+
+            if para_end - para_start > size:
+                if pack_start is not None:
+                    chunks.append(_span_chunk(text, section_start + pack_start, section_start + pack_end, base_offset, page, heading))
+                    pack_start = None
+                chunks.extend(
+                    chunk_fixed(
+                        section[para_start:para_end],
+                        size=size,
+                        overlap=overlap,
+                        base_offset=base_offset + section_start + para_start,
+                        page=page,
+                        section=heading,
+                    )
+                )
+                continue
+
+            if pack_start is not None and para_end - pack_start > size:
+                chunks.append(_span_chunk(text, section_start + pack_start, section_start + pack_end, base_offset, page, heading))
+                pack_start = None
+
+            if pack_start is None:
+                pack_start = para_start
+            pack_end = para_end
+
+        if pack_start is not None:
+            chunks.append(_span_chunk(text, section_start + pack_start, section_start + pack_end, base_offset, page, heading))
+
+    return chunks
+
+
+def _span_chunk(text: str, start: int, end: int, base_offset: int, page: int | None, section: str | None) -> Chunk:
+    return Chunk(
+        text=text[start:end].strip(),
+        start=base_offset + start,
+        end=base_offset + end,
+        page=page,
+        section=section,
+    )
+
+
+def chunk_pages(
+    pages: list[str],
+    size: int = KB_CHUNK_SIZE,
+    overlap: int = KB_CHUNK_OVERLAP,
+    separator: str = "\n",
+) -> list[Chunk]:
+    """Page-aware chunking: chunks never span pages and carry a 1-based page number.
+
+    Offsets match ``separator.join(pages)``.
+    """
+    chunks: list[Chunk] = []
+    offset = 0
+    for page_number, page_text in enumerate(pages, start=1):
+        chunks.extend(chunk_structured(page_text, size=size, overlap=overlap, base_offset=offset, page=page_number))
+        offset += len(page_text) + len(separator)
+    return chunks
+
+
+def chunk_document(
+    content: str,
+    file_type: str,
+    pages: list[str] | None = None,
+    size: int = KB_CHUNK_SIZE,
+    overlap: int = KB_CHUNK_OVERLAP,
+    strategy: str = KB_CHUNK_STRATEGY,
+) -> list[Chunk]:
+    """Pick the chunker for ``file_type`` according to ``strategy``."""
+    if strategy == "fixed":
+        return chunk_fixed(content, size=size, overlap=overlap)
+    if file_type == "pdf" and pages is not None:
+        return chunk_pages(pages, size=size, overlap=overlap)
+    if file_type in ("md", "doc", "docx"):
+        return chunk_structured(content, size=size, overlap=overlap)
+    return chunk_fixed(content, size=size, overlap=overlap)
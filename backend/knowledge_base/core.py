@@ -2,34 +2,140 @@ from agno.knowledge import Knowledge as AgentKnowledge
 from agno.vectordb.pgvector import PgVector
 from agno.knowledge.embedder.openai import OpenAIEmbedder
 from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from dataclasses import dataclass
 import logging
 import os
+import threading
+import time
+
+from tracing import span
+from usage import record_embedding_usage
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# ---------------------------------------------------------------------------
+# Connection pool — shared by every request in this process
+# ---------------------------------------------------------------------------
+KB_POOL_SIZE = int(os.getenv("KB_POOL_SIZE", "5"))
+KB_MAX_OVERFLOW = int(os.getenv("KB_MAX_OVERFLOW", "5"))
+KB_POOL_TIMEOUT_SECONDS = float(os.getenv("KB_POOL_TIMEOUT_SECONDS", "10"))
+KB_POOL_RECYCLE_SECONDS = int(os.getenv("KB_POOL_RECYCLE_SECONDS", "1800"))
+KB_RECONNECT_COOLDOWN_SECONDS = float(os.getenv("KB_RECONNECT_COOLDOWN_SECONDS", "30"))
+KB_EMBED_BATCH_SIZE = int(os.getenv("KB_EMBED_BATCH_SIZE", "100"))
+
+
+# ---------------------------------------------------------------------------
+# Tracing — embedding da consulta e busca vetorial aparecem no trace da request
+# ---------------------------------------------------------------------------
+@dataclass
+class TracedOpenAIEmbedder(OpenAIEmbedder):
+    """OpenAIEmbedder que registra o embedding da consulta como span do trace da request
+    e contabiliza seus tokens para o usuário da request, como na ingestão.
+    """
+
+    def get_embedding(self, text: str):
+        with span("embedding.query", model=self.id, chars=len(text)):
+            embedding, usage = super().get_embedding_and_usage(text)
+        try:
+            record_embedding_usage(self.id, [usage])
+        except Exception:
+            logger.exception("Falha ao registrar uso do embedding da consulta")
+        return embedding
+
+
+class TracedPgVector(PgVector):
+    """PgVector que registra cada busca (embedding da consulta + SQL) como span.
+
+    async_search roda search numa thread com o contexto copiado, então os dois caminhos passam aqui.
+    """
+
+    def search(self, query, limit=5, filters=None, user_id=None):
+        with span("kb.vector_search", table=self.table_name, limit=limit) as search_span:
+            documents = super().search(query, limit=limit, filters=filters, user_id=user_id)
+            search_span.set_attribute("results", len(documents))
+            return documents
+
+
+_kb_lock = threading.Lock()
+_kb = None
+_engine = None
+_last_failure_at: float | None = None
+
+
+def _build_knowledge_base(db_url: str):
+    """Cria engine com pool limitado, PgVector e Knowledge. Chamado uma vez por processo."""
+    engine = create_engine(
+        db_url,
+        pool_size=KB_POOL_SIZE,
+        max_overflow=KB_MAX_OVERFLOW,
+        pool_timeout=KB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=KB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+    )
+    # Configuração do PgVector storage (Supabase)
+    vector_db = TracedPgVector(
+        db_engine=engine,
+        table_name="agent_knowledge",
+        embedder=TracedOpenAIEmbedder(id="text-embedding-3-small", batch_size=KB_EMBED_BATCH_SIZE),
+    )
+    return engine, AgentKnowledge(vector_db=vector_db)
+
+
 def get_knowledge_base():
     """
     Retorna a Knowledge Base configurada com Supabase (Postgres) e Embeddings OpenAI.
+
+    A instância é criada uma única vez por processo e reutilizada entre requests.
+    Se a inicialização falhar, novas tentativas só ocorrem após
+    KB_RECONNECT_COOLDOWN_SECONDS, evitando martelar o banco a cada request.
     """
+    global _kb, _engine, _last_failure_at
+
+    if _kb is not None:
+        return _kb
+
     db_url = os.getenv("DATABASE_URL")
     if not db_url:
         logger.warning("DATABASE_URL não configurado — Knowledge Base desabilitada.")
         return None
 
-    try:
-        # Configuração do PgVector storage (Supabase)
-        vector_db = PgVector(
-            db_url=db_url,
-            table_name="agent_knowledge",
-            embedder=OpenAIEmbedder(id="text-embedding-3-small"),
-        )
-    
-        kb = AgentKnowledge(
-            vector_db=vector_db,
-        )
-        return kb
-    except Exception:
-        logger.exception("Erro ao inicializar Base de Conhecimento")
-        return None
+    with _kb_lock:
+        if _kb is not None:
+            return _kb
+
+        if (
+            _last_failure_at is not None
+            and time.monotonic() - _last_failure_at < KB_RECONNECT_COOLDOWN_SECONDS
+        ):
+            return None
+
+        try:
+            _engine, _kb = _build_knowledge_base(db_url)
+            _last_failure_at = None
+            logger.info(
+                "knowledge_base_ready pool_size=%s max_overflow=%s",
+                KB_POOL_SIZE,
+                KB_MAX_OVERFLOW,
+            )
+            return _kb
+        except Exception:
+            _last_failure_at = time.monotonic()
+            logger.exception("Erro ao inicializar Base de Conhecimento")
+            return None
+
+
+def close_knowledge_base() -> None:
+    """Fecha o pool de conexões e descarta a instância compartilhada (shutdown)."""
+    global _kb, _engine, _last_failure_at
+
+    with _kb_lock:
+        engine = _engine
+        _kb = None
+        _engine = None
+        _last_failure_at = None
+
+    if engine is not None:
+        engine.dispose()
@@ -0,0 +1,195 @@
+"""
+Content-addressed embedding cache.
+
+Embeddings are keyed by sha256(normalized chunk text + embedder model id) and
+kept in a local SQLite file, so re-uploading a document only sends new or
+changed chunks to the embedder. The same file stores a per-document
+fingerprint used to skip re-ingesting an unchanged upload entirely. Other
+users of embeddings (the response cache's request vectors) pass their own
+file, so they never grow or churn the knowledge-base one.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from array import array
+
+from prometheus_client import Counter
+
+from tracing import span
+from usage import record_embedding_usage
+
+logger = logging.getLogger(__name__)
+
+# Empty value disables the cache.
+KB_EMBEDDING_CACHE_PATH = os.getenv("KB_EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+
+EMBEDDING_CACHE_LOOKUPS_TOTAL = Counter(
+    "umbra_embedding_cache_lookups_total",
+    "Embedding cache lookups by result",
+    ["result"],
+)
+EMBEDDING_CACHE_SAVED_CHARS_TOTAL = Counter(
+    "umbra_embedding_cache_saved_chars_total",
+    "Characters served from the embedding cache instead of the embedder",
+)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def embedding_key(text: str, model_id: str) -> str:
+    return hashlib.sha256(f"{model_id}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def embedder_model_id(embedder) -> str:
+    return str(getattr(embedder, "id", "") or type(embedder).__name__)
+
+
+def document_fingerprint(chunk_keys: list[str]) -> str:
+    return hashlib.sha256("\n".join(chunk_keys).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents (content_hash TEXT PRIMARY KEY, fingerprint TEXT NOT NULL)"
+            )
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        found: dict[str, list[float]] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit.
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" for _ in batch)
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: dict[str, list[float]]) -> None:
+        if not items:
+            return
+        rows = [(key, array("f", vector).tobytes()) for key, vector in items.items()]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+
+    def get_fingerprint(self, content_hash: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint FROM documents WHERE content_hash = ?",
+                (content_hash,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_fingerprint(self, content_hash: str, fingerprint: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (content_hash, fingerprint) VALUES (?, ?)",
+                (content_hash, fingerprint),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_cache_lock = threading.Lock()
+_caches: dict[str, EmbeddingCache] = {}
+
+
+def get_embedding_cache(path: str | None = None) -> EmbeddingCache | None:
+    """Process-wide cache for ``path`` (KB_EMBEDDING_CACHE_PATH by default), or None when disabled/unavailable."""
+    path = KB_EMBEDDING_CACHE_PATH if path is None else path
+    if not path:
+        return None
+    cache = _caches.get(path)
+    if cache is not None:
+        return cache
+
+    with _cache_lock:
+        if path in _caches:
+            return _caches[path]
+        try:
+            _caches[path] = EmbeddingCache(path)
+        except Exception:
+            logger.exception("Não foi possível abrir o cache de embeddings em %s", path)
+            return None
+        return _caches[path]
+
+
+async def embed_with_cache(
+    embedder,
+    texts: list[str],
+    cache_path: str | None = None,
+) -> tuple[list[list[float] | None], list[dict | None]]:
+    """Embed ``texts`` with batched calls, serving unchanged texts from the cache at ``cache_path``
+    (the knowledge-base cache by default).
+
+    Returns embeddings and usage aligned with ``texts``; usage is None for cache hits.
+    SQLite reads and writes run in a worker thread, off the event loop.
+    """
+    with span("embedding.batch", texts=len(texts)) as embed_span:
+        cache = await asyncio.to_thread(get_embedding_cache, cache_path)
+        model_id = embedder_model_id(embedder)
+        embed_span.set_attribute("model", model_id)
+        keys = [embedding_key(text, model_id) for text in texts]
+
+        cached: dict[str, list[float]] = {}
+        if cache is not None:
+            try:
+                cached = await asyncio.to_thread(cache.get_many, keys)
+            except sqlite3.Error:
+                # A locked or corrupt cache only costs the embedder calls it would have saved.
+                logger.exception("Falha ao ler cache de embeddings; embedding todos os textos")
+        embeddings: list[list[float] | None] = [cached.get(key) for key in keys]
+        usages: list[dict | None] = [None] * len(texts)
+
+        miss_indexes = [index for index, embedding in enumerate(embeddings) if embedding is None]
+        hits = len(texts) - len(miss_indexes)
+        embed_span.set_attribute("cache_hits", hits)
+        if hits:
+            EMBEDDING_CACHE_LOOKUPS_TOTAL.labels(result="hit").inc(hits)
+            EMBEDDING_CACHE_SAVED_CHARS_TOTAL.inc(
+                sum(len(texts[index]) for index, embedding in enumerate(embeddings) if embedding is not None)
+            )
+        if not miss_indexes:
+            return embeddings, usages
+
+        EMBEDDING_CACHE_LOOKUPS_TOTAL.labels(result="miss").inc(len(miss_indexes))
+        fresh, fresh_usage = await embedder.async_get_embeddings_batch_and_usage([texts[i] for i in miss_indexes])
+        record_embedding_usage(model_id, fresh_usage)
+
+        to_store: dict[str, list[float]] = {}
+        for index, embedding, usage in zip(miss_indexes, fresh, fresh_usage):
+            embeddings[index] = embedding or None
+            usages[index] = usage
+            if embedding:
+                to_store[keys[index]] = embedding
+
+        if cache is not None:
+            try:
+                await asyncio.to_thread(cache.put_many, to_store)
+            except Exception:
+                logger.exception("Falha ao gravar cache de embeddings")
+
+        return embeddings, usages
@@ -0,0 +1,174 @@
+"""
+File validation and text extraction for knowledge-base uploads.
+
+Parsing is CPU-bound, so it never runs on the event loop: extract_file sends
+it to a shared process pool (one process per core by default) and splits large
+PDFs into page ranges parsed in parallel. The worker functions are plain,
+picklable module-level callables.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Awaitable, Callable
+
+import docx
+import pypdf
+from prometheus_client import Counter, Histogram
+
+# Allowed file extensions and their magic-byte signatures
+ALLOWED_TYPES = {
+    "pdf": b"%PDF",
+    "docx": b"PK",      # OOXML is a ZIP
+    "doc": b"\xd0\xcf",  # OLE2 compound document
+    "txt": None,          # No magic bytes for plain text
+    "md": None,
+}
+
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+
+# 0 parses in a single thread instead of processes (useful for tests and tiny deployments).
+KB_PARSE_PROCESSES = int(os.getenv("KB_PARSE_PROCESSES", str(os.cpu_count() or 1)))
+KB_PDF_PAGES_PER_SHARD = int(os.getenv("KB_PDF_PAGES_PER_SHARD", "25"))
+
+DOCUMENT_EXTRACTION_DURATION_SECONDS = Histogram(
+    "umbra_document_extraction_duration_seconds",
+    "Text extraction time per document",
+    ["file_type"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+DOCUMENT_EXTRACTION_PAGES_TOTAL = Counter(
+    "umbra_document_extraction_pages_total",
+    "PDF pages extracted",
+)
+
+
+def validate_file(filename: str, head: bytes, size: int | None = None) -> str:
+    """Validate file extension and magic bytes. Returns the file type or raises ValueError.
+
+    Only the first bytes of the file (``head``) are needed; pass the full
+    ``size`` when ``head`` is not the whole file.
+    """
+    if not filename or "." not in filename:
+        raise ValueError("Nome de arquivo inválido.")
+
+    file_type = filename.rsplit(".", 1)[-1].lower()
+
+    if file_type not in ALLOWED_TYPES:
+        raise ValueError(f"Tipo de arquivo não suportado: .{file_type}")
+
+    if (len(head) if size is None else size) > MAX_FILE_SIZE:
+        raise ValueError(f"Arquivo excede o limite de {MAX_FILE_SIZE // (1024*1024)}MB.")
+
+    # Validate magic bytes for binary formats
+    expected_magic = ALLOWED_TYPES[file_type]
+    if expected_magic and not head[:len(expected_magic)].startswith(expected_magic):
+        raise ValueError(f"Conteúdo do arquivo não corresponde à extensão .{file_type}")
+
+    return file_type
+
+
+def _docx_paragraph_text(para) -> str:
+    """Paragraph text, with Word headings rendered as markdown so chunking can follow them."""
+    style_name = (para.style.name if para.style is not None else "") or ""
+    if style_name.lower().startswith("heading") and para.text.strip():
+        level = style_name[len("heading"):].strip()
+        depth = int(level) if level.isdigit() else 1
+        return f"{'#' * min(max(depth, 1), 6)} {para.text}"
+    return para.text
+
+
+def extract_text(file_type: str, path: str) -> tuple[str, list[str] | None]:
+    """Return the document text and, for PDFs, the text of each page."""
+    if file_type == "pdf":
+        pages = extract_pdf_pages(path, 0, None)
+        return "\n".join(pages), pages
+
+    if file_type in ("doc", "docx"):
+        doc = docx.Document(path)
+        return "\n\n".join(_docx_paragraph_text(para) for para in doc.paragraphs), None
+
+    if file_type in ("txt", "md"):
+        with open(path, encoding="utf-8") as handle:
+            return handle.read(), None
+
+    return "", None
+
+
+def pdf_page_count(path: str) -> int:
+    return len(pypdf.PdfReader(path).pages)
+
+
+def extract_pdf_pages(path: str, start: int, end: int | None) -> list[str]:
+    """Text of pages [start, end) — one shard of a PDF."""
+    reader = pypdf.PdfReader(path)
+    pages = reader.pages[start:end]
+    return [page.extract_text() or "" for page in pages]
+
+
+_pool_lock = threading.Lock()
+_extraction_pool: Executor | None = None
+
+
+def get_extraction_pool() -> Executor:
+    global _extraction_pool
+
+    if _extraction_pool is None:
+        with _pool_lock:
+            if _extraction_pool is None:
+                if KB_PARSE_PROCESSES > 0:
+                    _extraction_pool = ProcessPoolExecutor(max_workers=KB_PARSE_PROCESSES)
+                else:
+                    _extraction_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="extract")
+    return _extraction_pool
+
+
+def shutdown_extraction_pool() -> None:
+    global _extraction_pool
+
+    with _pool_lock:
+        pool = _extraction_pool
+        _extraction_pool = None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def extract_file(
+    file_type: str,
+    path: str,
+    on_progress: Callable[[int, int], Awaitable[None]] | None = None,
+) -> tuple[str, list[str] | None]:
+    """Extract text off the event loop; PDFs are parsed in parallel page-range shards.
+
+    ``on_progress(pages_parsed, pages_total)`` is awaited as PDF shards complete.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_extraction_pool()
+    started_at = time.perf_counter()
+    try:
+        if file_type != "pdf":
+            return await loop.run_in_executor(pool, extract_text, file_type, path)
+
+        page_count = await loop.run_in_executor(pool, pdf_page_count, path)
+        shard_size = max(KB_PDF_PAGES_PER_SHARD, 1)
+        parsed = 0
+        if on_progress is not None:
+            await on_progress(0, page_count)
+
+        async def run_shard(start: int) -> list[str]:
+            nonlocal parsed
+            end = min(start + shard_size, page_count)
+            shard = await loop.run_in_executor(pool, extract_pdf_pages, path, start, end)
+            parsed += end - start
+            if on_progress is not None:
+                await on_progress(parsed, page_count)
+            return shard
+
+        shards = await asyncio.gather(*(run_shard(start) for start in range(0, page_count, shard_size)))
+        pages = [page for shard in shards for page in shard]
+        DOCUMENT_EXTRACTION_PAGES_TOTAL.inc(len(pages))
+        return "\n".join(pages), pages
+    finally:
+        DOCUMENT_EXTRACTION_DURATION_SECONDS.labels(file_type=file_type).observe(time.perf_counter() - started_at)
@@ -0,0 +1,116 @@
+"""
+Chunk → embed → store pipeline used by the background ingestion jobs.
+"""
+
+import hashlib
+import logging
+import sqlite3
+from typing import Awaitable, Callable
+
+from agno.knowledge.document import Document
+
+from .chunking import chunk_document
+from .core import KB_EMBED_BATCH_SIZE
+from .embedding_cache import (
+    document_fingerprint,
+    embed_with_cache,
+    embedder_model_id,
+    embedding_key,
+    get_embedding_cache,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def document_content_hash(user_id: str, filename: str) -> str:
+    """Rows of one user's file share this hash, so a new version replaces the old one."""
+    return hashlib.sha256(f"{user_id}:{filename}".encode("utf-8")).hexdigest()
+
+
+def build_documents(
+    content: str,
+    file_type: str,
+    pages: list[str] | None,
+    filename: str,
+    user_id: str,
+) -> list[Document]:
+    chunks = chunk_document(content, file_type, pages=pages)
+    return [
+        Document(
+            content=chunk.text,
+            meta_data={
+                "source": filename,
+                "user_id": user_id,
+                "type": file_type,
+                "chunk_index": index,
+                "chunk_count": len(chunks),
+                **chunk.meta_data(),
+            },
+        )
+        for index, chunk in enumerate(chunks)
+    ]
+
+
+async def embed_documents(
+    embedder,
+    documents: list[Document],
+    on_progress: Callable[[int], Awaitable[None]] | None = None,
+) -> None:
+    """Embed all chunks with batched embedder calls (KB_EMBED_BATCH_SIZE texts per request).
+
+    Chunks already in the embedding cache are not sent to the embedder again.
+    ``on_progress`` is awaited with the number of chunks embedded so far after each batch.
+    """
+    if embedder is None or not documents:
+        return
+
+    batch_size = max(KB_EMBED_BATCH_SIZE, 1)
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        embeddings, usages = await embed_with_cache(embedder, [document.content for document in batch])
+        for document, embedding, usage in zip(batch, embeddings, usages):
+            document.embedding = embedding or None
+            document.usage = usage
+        if on_progress is not None:
+            await on_progress(start + len(batch))
+
+
+def _content_hash_exists(vector_db, content_hash: str) -> bool:
+    exists = getattr(vector_db, "content_hash_exists", None)
+    return bool(exists and exists(content_hash))
+
+
+def documents_fingerprint(kb, documents: list[Document]) -> str:
+    embedder = getattr(kb.vector_db, "embedder", None)
+    return document_fingerprint(
+        [embedding_key(document.content, embedder_model_id(embedder)) for document in documents]
+    )
+
+
+def is_unchanged(kb, content_hash: str, fingerprint: str) -> bool:
+    """True when the stored version of this file already has exactly these chunks.
+
+    Only whole files are skipped: a changed file still replaces all of its rows,
+    though its unchanged chunks are served from the embedding cache.
+    """
+    cache = get_embedding_cache()
+    if cache is None:
+        return False
+    try:
+        stored = cache.get_fingerprint(content_hash)
+    except sqlite3.Error:
+        logger.exception("Falha ao ler fingerprint do documento; reprocessando")
+        return False
+    return stored == fingerprint and _content_hash_exists(kb.vector_db, content_hash)
+
+
+def store_documents(kb, content_hash: str, documents: list[Document], fingerprint: str) -> None:
+    kb.vector_db.upsert(content_hash=content_hash, documents=documents)
+    cache = get_embedding_cache()
+    if cache is None:
+        return
+    try:
+        cache.set_fingerprint(content_hash, fingerprint)
+    except sqlite3.Error:
+        logger.exception("Falha ao gravar fingerprint do documento")
+
@@ -0,0 +1,411 @@
+"""
+Background ingestion jobs for knowledge-base uploads.
+
+Uploads are spooled to disk and recorded in a SQLite job table, then processed
+by async workers in three stages: parse (CPU-bound, runs in the shared
+extraction process pool, see extraction.extract_file), embed and store. Progress and failures are
+persisted per stage, so a failed job resumes from the stage that failed and
+unfinished jobs are picked up again after a restart. Store calls run in worker
+threads, off the event loop.
+
+A failed job keeps its spool and extracted files so it can be retried; after
+KB_JOBS_FAILED_TTL_SECONDS without a retry, a periodic sweep deletes the job
+together with its files.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from usage import bill_to
+
+from .core import get_knowledge_base
+from .extraction import extract_file
+from .ingestion import (
+    build_documents,
+    document_content_hash,
+    documents_fingerprint,
+    embed_documents,
+    is_unchanged,
+    store_documents,
+)
+
+logger = logging.getLogger(__name__)
+
+KB_JOBS_DB_PATH = os.getenv("KB_JOBS_DB_PATH", ".cache/ingestion_jobs.sqlite3")
+KB_JOBS_SPOOL_DIR = os.getenv("KB_JOBS_SPOOL_DIR", ".cache/uploads")
+KB_INGEST_WORKERS = int(os.getenv("KB_INGEST_WORKERS", "2"))
+KB_INGEST_MAX_ATTEMPTS = int(os.getenv("KB_INGEST_MAX_ATTEMPTS", "3"))
+KB_INGEST_RETRY_DELAY_SECONDS = float(os.getenv("KB_INGEST_RETRY_DELAY_SECONDS", "2"))
+# A running job with no progress for this long is considered orphaned by a dead worker.
+KB_INGEST_STALE_SECONDS = float(os.getenv("KB_INGEST_STALE_SECONDS", "300"))
+KB_JOBS_FAILED_TTL_SECONDS = float(os.getenv("KB_JOBS_FAILED_TTL_SECONDS", "604800"))
+_SWEEP_INTERVAL_SECONDS = 3600
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+STAGE_PARSE = "parse"
+STAGE_EMBED = "embed"
+STAGE_STORE = "store"
+STAGE_DONE = "done"
+
+_COLUMNS = (
+    "id", "user_id", "filename", "file_type", "file_path", "status", "stage", "attempts",
+    "pages_total", "pages_parsed", "chunks_total", "chunks_embedded", "error", "result",
+    "created_at", "updated_at",
+)
+
+
+class JobStore:
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    file_type TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    pages_total INTEGER NOT NULL DEFAULT 0,
+                    pages_parsed INTEGER NOT NULL DEFAULT 0,
+                    chunks_total INTEGER NOT NULL DEFAULT 0,
+                    chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    def create(self, user_id: str, filename: str, file_type: str, file_path: str, job_id: str) -> dict:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO ingestion_jobs (id, user_id, filename, file_type, file_path, status, stage, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, user_id, filename, file_type, file_path, STATUS_QUEUED, STAGE_PARSE, now, now),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM ingestion_jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def update(self, job_id: str, **fields) -> None:
+        fields.setdefault("updated_at", time.time())
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE ingestion_jobs SET {assignments} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+
+    def claim(self, job_id: str, attempts: int) -> bool:
+        """Atomically move a queued job to running; False if another worker got it first."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE ingestion_jobs SET status = ?, attempts = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (STATUS_RUNNING, attempts, time.time(), job_id, STATUS_QUEUED),
+            )
+        return cursor.rowcount == 1
+
+    def recover_unfinished(self, stale_after_seconds: float) -> list[str]:
+        """Re-queue orphaned running jobs and return the ids of all queued jobs."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE ingestion_jobs SET status = ? WHERE status = ? AND updated_at < ?",
+                (STATUS_QUEUED, STATUS_RUNNING, time.time() - stale_after_seconds),
+            )
+            rows = self._conn.execute(
+                "SELECT id FROM ingestion_jobs WHERE status = ? ORDER BY created_at",
+                (STATUS_QUEUED,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def delete_failed(self, updated_before: float) -> list[str]:
+        """Delete failed jobs last touched before ``updated_before`` and return their spool paths."""
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT id, file_path FROM ingestion_jobs WHERE status = ? AND updated_at < ?",
+                (STATUS_FAILED, updated_before),
+            ).fetchall()
+            self._conn.executemany("DELETE FROM ingestion_jobs WHERE id = ?", [(row[0],) for row in rows])
+        return [row[1] for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def public_job(job: dict) -> dict:
+    """Job fields safe to return to the owner (no server paths)."""
+    return {
+        "job_id": job["id"],
+        "filename": job["filename"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "attempts": job["attempts"],
+        "progress": {
+            "pages_total": job["pages_total"],
+            "pages_parsed": job["pages_parsed"],
+            "chunks_total": job["chunks_total"],
+            "chunks_embedded": job["chunks_embedded"],
+        },
+        "error": job["error"],
+        "result": json.loads(job["result"]) if job["result"] else None,
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+def _extracted_path(file_path: str) -> str:
+    return f"{file_path}.extracted.json"
+
+
+def _write_extracted(file_path: str, content: str, pages: list[str] | None) -> None:
+    with open(_extracted_path(file_path), "w", encoding="utf-8") as handle:
+        json.dump({"content": content, "pages": pages}, handle, ensure_ascii=False)
+
+
+def _read_extracted(file_path: str) -> dict:
+    with open(_extracted_path(file_path), encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def _remove_job_files(file_paths: list[str]) -> None:
+    for file_path in file_paths:
+        for path in (file_path, _extracted_path(file_path)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class IngestionQueue:
+    def __init__(
+        self,
+        store: JobStore,
+        spool_dir: str,
+        workers: int = KB_INGEST_WORKERS,
+        max_attempts: int = KB_INGEST_MAX_ATTEMPTS,
+        retry_delay_seconds: float = KB_INGEST_RETRY_DELAY_SECONDS,
+        failed_ttl_seconds: float = KB_JOBS_FAILED_TTL_SECONDS,
+    ):
+        self.store = store
+        self.spool_dir = spool_dir
+        self.workers = max(workers, 1)
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_delay_seconds = retry_delay_seconds
+        self.failed_ttl_seconds = failed_ttl_seconds
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._pending_retries: set[asyncio.Task] = set()
+        os.makedirs(spool_dir, exist_ok=True)
+
+    async def start(self) -> None:
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep_loop()))
+
+        # Jobs left queued or interrupted mid-run by a restart resume from their stage.
+        for job_id in await asyncio.to_thread(self.store.recover_unfinished, KB_INGEST_STALE_SECONDS):
+            self._queue.put_nowait(job_id)
+
+    async def stop(self) -> None:
+        tasks = [*self._tasks, *self._pending_retries]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._pending_retries.clear()
+        self._queue = None
+
+    def reserve(self) -> tuple[str, str]:
+        """New job id and the spool path its upload should be written to."""
+        job_id = uuid.uuid4().hex
+        return job_id, os.path.join(self.spool_dir, job_id)
+
+    async def submit_spooled(self, job_id: str, user_id: str, filename: str, file_type: str, file_path: str) -> dict:
+        """Queue a job for an upload already written to ``file_path`` (see reserve)."""
+        job = await asyncio.to_thread(self.store.create, user_id, filename, file_type, file_path, job_id=job_id)
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+        return job
+
+    async def get_job(self, job_id: str, user_id: str) -> dict | None:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job["user_id"] != user_id:
+            return None
+        return job
+
+    async def retry(self, job_id: str, user_id: str) -> dict | None:
+        """Re-queue a failed job from the stage where it stopped."""
+        job = await self.get_job(job_id, user_id)
+        if job is None or job["status"] != STATUS_FAILED:
+            return None
+        await self._update(job_id, status=STATUS_QUEUED, attempts=0, error=None)
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def sweep_failed(self) -> int:
+        """Delete failed jobs not retried within failed_ttl_seconds, with their files."""
+        file_paths = await asyncio.to_thread(self.store.delete_failed, time.time() - self.failed_ttl_seconds)
+        if file_paths:
+            await asyncio.to_thread(_remove_job_files, file_paths)
+            logger.info("ingestion_jobs_swept count=%s", len(file_paths))
+        return len(file_paths)
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            try:
+                await self.sweep_failed()
+            except Exception:
+                logger.exception("ingestion_sweep_failed")
+            await asyncio.sleep(_SWEEP_INTERVAL_SECONDS)
+
+    async def _update(self, job_id: str, **fields) -> None:
+        await asyncio.to_thread(self.store.update, job_id, **fields)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self.run_job(job_id)
+            except Exception:
+                logger.exception("ingestion_job_crashed job_id=%s", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _requeue_later(self, job_id: str) -> None:
+        await asyncio.sleep(self.retry_delay_seconds)
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+
+    async def run_job(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None:
+            return
+
+        attempts = job["attempts"] + 1
+        if not await asyncio.to_thread(self.store.claim, job_id, attempts):
+            return
+        try:
+            if job["stage"] == STAGE_PARSE:
+                await self._parse(job)
+            await self._embed_and_store(job)
+        except Exception as exc:
+            failed_stage = (await asyncio.to_thread(self.store.get, job_id))["stage"]
+            retryable = not isinstance(exc, ValueError) and attempts < self.max_attempts
+            logger.warning(
+                "ingestion_job_failed job_id=%s stage=%s attempt=%s/%s retry=%s error=%s",
+                job_id,
+                failed_stage,
+                attempts,
+                self.max_attempts,
+                retryable,
+                exc,
+            )
+            if retryable:
+                await self._update(job_id, status=STATUS_QUEUED, error=str(exc))
+                task = asyncio.create_task(self._requeue_later(job_id))
+                self._pending_retries.add(task)
+                task.add_done_callback(self._pending_retries.discard)
+            else:
+                await self._update(job_id, status=STATUS_FAILED, error=str(exc))
+
+    async def _parse(self, job: dict) -> None:
+        async def on_progress(parsed: int, total: int) -> None:
+            await self._update(job["id"], pages_parsed=parsed, pages_total=total)
+
+        content, pages = await extract_file(job["file_type"], job["file_path"], on_progress=on_progress)
+        if not content.strip():
+            raise ValueError("Nenhum texto extraído do documento.")
+
+        await asyncio.to_thread(_write_extracted, job["file_path"], content, pages)
+
+        page_count = len(pages) if pages else 0
+        await self._update(job["id"], stage=STAGE_EMBED, pages_total=page_count, pages_parsed=page_count)
+
+    async def _embed_and_store(self, job: dict) -> None:
+        job_id = job["id"]
+        extracted = await asyncio.to_thread(_read_extracted, job["file_path"])
+
+        kb = await asyncio.to_thread(get_knowledge_base)
+        if not kb:
+            raise RuntimeError("Base de Conhecimento indisponível.")
+
+        documents = build_documents(
+            extracted["content"],
+            job["file_type"],
+            extracted["pages"],
+            filename=job["filename"],
+            user_id=job["user_id"],
+        )
+        content_hash = document_content_hash(job["user_id"], job["filename"])
+        fingerprint = documents_fingerprint(kb, documents)
+        await self._update(job_id, stage=STAGE_EMBED, chunks_total=len(documents), chunks_embedded=0)
+
+        if await asyncio.to_thread(is_unchanged, kb, content_hash, fingerprint):
+            await self._finish(job, {"chunks": len(documents), "unchanged": True}, chunks_embedded=len(documents))
+            return
+
+        async def on_progress(done: int) -> None:
+            await self._update(job_id, chunks_embedded=done)
+
+        with bill_to(job["user_id"]):
+            await embed_documents(getattr(kb.vector_db, "embedder", None), documents, on_progress=on_progress)
+        await self._update(job_id, stage=STAGE_STORE, chunks_embedded=len(documents))
+        await asyncio.to_thread(store_documents, kb, content_hash, documents, fingerprint)
+        await self._finish(job, {"chunks": len(documents), "unchanged": False})
+
+    async def _finish(self, job: dict, result: dict, **fields) -> None:
+        await self._update(
+            job["id"],
+            status=STATUS_SUCCEEDED,
+            stage=STAGE_DONE,
+            error=None,
+            result=json.dumps(result),
+            **fields,
+        )
+        await asyncio.to_thread(_remove_job_files, [job["file_path"]])
+
+
+_queue_lock = threading.Lock()
+_ingestion_queue: IngestionQueue | None = None
+
+
+def get_ingestion_queue() -> IngestionQueue:
+    """Process-wide ingestion queue backed by KB_JOBS_DB_PATH / KB_JOBS_SPOOL_DIR."""
+    global _ingestion_queue
+
+    if _ingestion_queue is None:
+        with _queue_lock:
+            if _ingestion_queue is None:
+                _ingestion_queue = IngestionQueue(JobStore(KB_JOBS_DB_PATH), KB_JOBS_SPOOL_DIR)
+    return _ingestion_queue
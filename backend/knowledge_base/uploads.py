@@ -0,0 +1,159 @@
+"""
+Streaming upload handling for knowledge-base files.
+
+The file is copied to a spool file on disk as it arrives, in fixed-size chunks,
+and the copy stops at the first byte past the size limit. Only the first few
+bytes are kept in memory, for the magic-byte check, so concurrent uploads do
+not add their file size to RSS.
+"""
+
+import asyncio
+import os
+from dataclasses import dataclass
+
+from fastapi import Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Enough for every signature in extraction.ALLOWED_TYPES.
+UPLOAD_HEAD_SIZE = 16
+# Multipart boundaries and part headers on top of the file itself.
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+
+class UploadTooLargeError(Exception):
+    def __init__(self, max_size: int):
+        super().__init__(f"Arquivo excede o limite de {max_size // (1024*1024)}MB.")
+        self.max_size = max_size
+
+
+@dataclass
+class SpooledUpload:
+    filename: str
+    path: str
+    size: int
+    head: bytes
+
+
+class _SpoolWriter:
+    """Counts and buffers file bytes inside the parser callbacks; the disk I/O runs in a worker thread."""
+
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self.size = 0
+        self.head = b""
+        self._buffer = bytearray()
+        self._handle = None
+
+    async def open(self) -> None:
+        self._handle = await asyncio.to_thread(open, self.path, "wb")
+
+    def write(self, data: bytes | memoryview) -> None:
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise UploadTooLargeError(self.max_size)
+        if len(self.head) < UPLOAD_HEAD_SIZE:
+            self.head += bytes(data[:UPLOAD_HEAD_SIZE - len(self.head)])
+        self._buffer.extend(data)
+
+    async def flush(self, force: bool = False) -> None:
+        if not self._buffer or (len(self._buffer) < UPLOAD_CHUNK_SIZE and not force):
+            return
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        await asyncio.to_thread(self._handle.write, data)
+
+    async def close(self) -> None:
+        if self._handle is not None:
+            await asyncio.to_thread(self._handle.close)
+
+
+def discard_spool(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def receive_upload(request: Request, path: str, max_size: int, field_name: str = "file") -> SpooledUpload:
+    """Parse a multipart request body as it streams in, writing the ``field_name`` file part to ``path``.
+
+    Raises UploadTooLargeError as soon as the file passes ``max_size`` and
+    ValueError for a malformed body or a missing file part. The caller owns
+    ``path`` and should discard_spool it unless the upload is handed on.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise ValueError("Envie o arquivo como multipart/form-data.")
+
+    declared_length = request.headers.get("content-length")
+    if declared_length and declared_length.isdigit() and int(declared_length) > max_size + MULTIPART_OVERHEAD_BYTES:
+        raise UploadTooLargeError(max_size)
+
+    writer = _SpoolWriter(path, max_size)
+    await writer.open()
+    header_field = bytearray()
+    header_value = bytearray()
+    part: dict = {}
+    found: dict = {}
+
+    def on_part_begin() -> None:
+        part.clear()
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        header_value.extend(data[start:end])
+
+    def on_header_end() -> None:
+        if header_field.lower() == b"content-disposition":
+            _, params = parse_options_header(bytes(header_value))
+            part["name"] = params.get(b"name", b"").decode("utf-8", "replace")
+            filename = params.get(b"filename")
+            part["filename"] = filename.decode("utf-8", "replace") if filename is not None else None
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished() -> None:
+        part["target"] = (
+            not found and part.get("name") == field_name and part.get("filename") is not None
+        )
+        if part["target"]:
+            found["filename"] = part["filename"]
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        if part.get("target"):
+            writer.write(memoryview(data)[start:end])
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+        },
+    )
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            await writer.flush()
+        parser.finalize()
+        await writer.flush(force=True)
+    except UploadTooLargeError:
+        raise
+    except Exception as exc:
+        raise ValueError("Corpo multipart inválido.") from exc
+    finally:
+        await writer.close()
+
+    if "filename" not in found:
+        raise ValueError("Nenhum arquivo enviado.")
+
+    return SpooledUpload(filename=found["filename"] or "unknown", path=path, size=writer.size, head=writer.head)
+
@@ -1,28 +1,52 @@
+import asyncio
 import json
 import logging
 import os
 import time
 import uuid
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
-from typing import Callable
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable
 
-from fastapi import FastAPI, HTTPException, UploadFile, Depends, Request, Response
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from fastapi.responses import JSONResponse, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST
 from pydantic import BaseModel, Field
 from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
 from auth import get_current_user, require_super_admin
+from jwks import get_jwks
 from agents.content_agent import get_content_agent
 from agents.analytics_agent import get_analytics_agent
 from agents.ugc_agent import get_ugc_agent
 from agents.static_ad_agent import get_static_ad_agent
 from agents.email_agent import get_email_agent
 from agents.message_agent import get_message_agent
-from agents.brain_agent import get_brain_agent, process_document
+from agents.brain_agent import get_brain_agent
+import agent as router_agent
+from agents.registry import template_version, warm_agents
+from knowledge_base import close_knowledge_base, get_knowledge_base
+from knowledge_base.extraction import shutdown_extraction_pool, validate_file
+from knowledge_base.jobs import get_ingestion_queue, public_job
+from knowledge_base.uploads import UploadTooLargeError, discard_spool, receive_upload
+from metrics_summary import alert_thresholds, get_metrics_aggregator
+from observability import (
+    bind_request,
+    mark_worker_dead,
+    metrics_payload,
+    observe_http_request,
+    route_label,
+    unbind_request,
+)
+from quotas import RATE_LIMIT_STORAGE_URI, rate_limit_key, require_token_budget
+from response_cache import get_response_cache, no_cache_requested
+from tracing import get_tracer, request_span, span
+from resilience import (
+    ExecutorSaturatedError,
+    arun_agent_with_resilience,
+    astream_agent_with_resilience,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -31,31 +55,37 @@ logging.basicConfig(
     format="%(asctime)s %(levelname)s %(name)s %(message)s",
 )
 
-limiter = Limiter(key_func=get_remote_address)
-app = FastAPI(title="Umbra AI Backend")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the shared knowledge base (engine + pool) and agent templates before serving traffic.
+    await asyncio.to_thread(get_knowledge_base)
+    await asyncio.to_thread(warm_agents)
+    ingestion_queue = get_ingestion_queue()
+    await ingestion_queue.start()
+    key_set = get_jwks()
+    if key_set is not None:
+        await key_set.start()
+    metrics_aggregator = get_metrics_aggregator()
+    await metrics_aggregator.start()
+    try:
+        yield
+    finally:
+        await metrics_aggregator.stop()
+        mark_worker_dead()
+        await asyncio.to_thread(get_tracer().shutdown)
+        if key_set is not None:
+            await key_set.stop()
+        await ingestion_queue.stop()
+        shutdown_extraction_pool()
+        close_knowledge_base()
+
+
+limiter = Limiter(key_func=rate_limit_key, storage_uri=RATE_LIMIT_STORAGE_URI)
+app = FastAPI(title="Umbra AI Backend", lifespan=lifespan)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-HTTP_REQUESTS_TOTAL = Counter(
-    "umbra_http_requests_total",
-    "Total HTTP requests",
-    ["method", "path", "status"],
-)
-HTTP_REQUEST_DURATION_SECONDS = Histogram(
-    "umbra_http_request_duration_seconds",
-    "HTTP request duration in seconds",
-    ["method", "path"],
-)
-AGENT_CALLS_TOTAL = Counter(
-    "umbra_agent_calls_total",
-    "Total calls to AI agents",
-    ["agent", "status"],
-)
-AGENT_CALL_DURATION_SECONDS = Histogram(
-    "umbra_agent_call_duration_seconds",
-    "Agent call duration in seconds",
-    ["agent"],
-)
 APP_STARTED_AT = time.time()
 
 # ---------------------------------------------------------------------------
@@ -69,24 +99,14 @@ app.add_middleware(
     ],
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization", "Accept"],
+    allow_headers=["Content-Type", "Authorization", "Accept", "Cache-Control"],
+    expose_headers=["X-Cache"],
 )
 
 # ---------------------------------------------------------------------------
 # Constants
 # ---------------------------------------------------------------------------
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10 MB
-AI_TIMEOUT_SECONDS = int(os.getenv("AI_TIMEOUT_SECONDS", "45"))
-AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
-AI_RETRY_BASE_DELAY_SECONDS = float(os.getenv("AI_RETRY_BASE_DELAY_SECONDS", "0.8"))
-HTTP_ERROR_RATE_WARNING = float(os.getenv("HTTP_ERROR_RATE_WARNING", "0.05"))
-HTTP_ERROR_RATE_CRITICAL = float(os.getenv("HTTP_ERROR_RATE_CRITICAL", "0.10"))
-HTTP_P95_WARNING_MS = float(os.getenv("HTTP_P95_WARNING_MS", "1200"))
-HTTP_P95_CRITICAL_MS = float(os.getenv("HTTP_P95_CRITICAL_MS", "2500"))
-AGENT_ERROR_RATE_WARNING = float(os.getenv("AGENT_ERROR_RATE_WARNING", "0.08"))
-AGENT_ERROR_RATE_CRITICAL = float(os.getenv("AGENT_ERROR_RATE_CRITICAL", "0.15"))
-AGENT_P95_WARNING_MS = float(os.getenv("AGENT_P95_WARNING_MS", "5000"))
-AGENT_P95_CRITICAL_MS = float(os.getenv("AGENT_P95_CRITICAL_MS", "9000"))
 
 # ---------------------------------------------------------------------------
 # Request models — with basic input length limits
@@ -123,96 +143,109 @@ class BrainQueryRequest(BaseModel):
 # ---------------------------------------------------------------------------
 def _safe_parse_json(raw: str) -> dict:
     """Parse AI response text as JSON, stripping markdown fences."""
-    cleaned = raw.replace("```json", "").replace("```", "").strip()
-    return json.loads(cleaned)
-
-
-def _is_retryable_error(exc: Exception) -> bool:
-    message = str(exc).lower()
-    retryable_markers = [
-        "timeout",
-        "timed out",
-        "rate limit",
-        "too many requests",
-        "temporarily",
-        "connection",
-        "unavailable",
-        "overloaded",
-        "429",
-        "502",
-        "503",
-        "504",
-    ]
-    return any(marker in message for marker in retryable_markers)
-
-
-def _run_with_timeout(func: Callable[[], object], timeout_seconds: int):
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        future = executor.submit(func)
-        try:
-            return future.result(timeout=timeout_seconds)
-        except FuturesTimeout as exc:
-            raise TimeoutError(f"Agent timeout after {timeout_seconds}s") from exc
+    with span("json.parse", chars=len(raw)):
+        cleaned = raw.replace("```json", "").replace("```", "").strip()
+        return json.loads(cleaned)
 
 
-def _run_agent_with_resilience(
+async def _cached_generation(
+    request: Request,
+    response: Response,
+    user_id: str,
+    agent_name: str,
+    body: BaseModel,
+    generate: Callable[[], Awaitable[dict]],
+) -> dict:
+    """Serve a structured generation from the per-user response cache, or generate and store it.
+
+    ``Cache-Control: no-cache`` forces a fresh generation. The outcome is
+    reported in the ``X-Cache`` response header.
+    """
+    result, outcome = await get_response_cache().get_or_generate(
+        user_id,
+        agent_name,
+        template_version(agent_name),
+        body,
+        generate,
+        bypass=no_cache_requested(request.headers.get("cache-control")),
+    )
+    response.headers["X-Cache"] = outcome.upper()
+    return result
+
+
+def _sse_event(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_agent_response(
+    request: Request,
     agent_name: str,
     prompt: str,
-    request_id: str,
-    run_agent: Callable[[str], object],
-):
-    attempts = AI_MAX_RETRIES + 1
-    for attempt in range(1, attempts + 1):
-        started_at = time.perf_counter()
-        try:
-            response = _run_with_timeout(lambda: run_agent(prompt), timeout_seconds=AI_TIMEOUT_SECONDS)
-            AGENT_CALLS_TOTAL.labels(agent=agent_name, status="success").inc()
-            AGENT_CALL_DURATION_SECONDS.labels(agent=agent_name).observe(time.perf_counter() - started_at)
-            return response
-        except Exception as exc:
-            AGENT_CALLS_TOTAL.labels(agent=agent_name, status="error").inc()
-            AGENT_CALL_DURATION_SECONDS.labels(agent=agent_name).observe(time.perf_counter() - started_at)
-
-            should_retry = attempt < attempts and _is_retryable_error(exc)
-            logger.warning(
-                "agent_call_failed request_id=%s agent=%s attempt=%s/%s retry=%s error=%s",
-                request_id,
-                agent_name,
-                attempt,
-                attempts,
-                should_retry,
-                exc,
-            )
-            if not should_retry:
-                raise
-
-            backoff_seconds = AI_RETRY_BASE_DELAY_SECONDS * (2 ** (attempt - 1))
-            time.sleep(backoff_seconds)
-
-    raise RuntimeError(f"{agent_name} failed after retries")
-
+    stream_agent: Callable[[str], AsyncIterator[object]],
+    error_detail: str,
+    parse_action: bool = False,
+) -> StreamingResponse:
+    """Serve an agent run as Server-Sent Events.
+
+    The first delta is awaited before the response starts, so failures before any
+    output still map to the usual 503/504/500 status codes. Later failures are
+    reported in-band as an ``error`` event.
+    """
+    request_id = request.state.request_id
+    deltas = astream_agent_with_resilience(
+        agent_name=agent_name,
+        prompt=prompt,
+        request_id=request_id,
+        stream_agent=stream_agent,
+        user_id=getattr(request.state, "user_id", None),
+    )
 
-def _histogram_quantile_upper_bound_seconds(buckets: dict[float, float], quantile: float) -> float | None:
-    """Return approximate quantile upper bound based on cumulative histogram buckets."""
-    if not buckets:
-        return None
-
-    finite_keys = [k for k in buckets.keys() if k != float("inf")]
-    if not finite_keys:
-        return None
-
-    total = buckets.get(float("inf"), 0.0)
-    if total <= 0:
-        total = max((buckets[k] for k in finite_keys), default=0.0)
-    if total <= 0:
-        return None
-
-    threshold = total * quantile
-    for le in sorted(finite_keys):
-        if buckets.get(le, 0.0) >= threshold:
-            return le
+    try:
+        first_chunk = await deltas.__anext__()
+    except StopAsyncIteration:
+        first_chunk = None
+    except ExecutorSaturatedError:
+        logger.warning("Agent executor saturated")
+        raise HTTPException(status_code=503, detail="Serviço sobrecarregado. Tente novamente em instantes.")
+    except TimeoutError:
+        logger.exception("%s agent stream timeout", agent_name)
+        raise HTTPException(status_code=504, detail="Tempo de resposta excedido. Tente novamente.")
+    except Exception:
+        logger.exception("%s agent stream error", agent_name)
+        raise HTTPException(status_code=500, detail=error_detail)
 
-    return max(finite_keys)
+    async def event_source():
+        parts: list[str] = []
+        try:
+            if first_chunk is not None:
+                parts.append(first_chunk)
+                yield _sse_event({"delta": first_chunk})
+            async for chunk in deltas:
+                parts.append(chunk)
+                yield _sse_event({"delta": chunk})
+        except Exception:
+            logger.exception("%s agent stream interrupted", agent_name)
+            yield _sse_event({"detail": error_detail, "request_id": request_id}, event="error")
+            return
+        finally:
+            await deltas.aclose()
+
+        done: dict = {"request_id": request_id}
+        if parse_action:
+            content = "".join(parts).strip()
+            if content.startswith("{") and content.endswith("}"):
+                try:
+                    done["action"] = json.loads(content)
+                except json.JSONDecodeError:
+                    pass
+        yield _sse_event(done, event="done")
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.middleware("http")
@@ -223,19 +256,25 @@ async def request_observability_middleware(request: Request, call_next):
     started_at = time.perf_counter()
     response = None
     status_code = 500
+    request_binding = bind_request(request)
 
     try:
-        response = await call_next(request)
-        status_code = response.status_code
-        return response
+        with request_span(
+            request_id,
+            traceparent=request.headers.get("traceparent"),
+            method=request.method,
+        ) as root_span:
+            try:
+                response = await call_next(request)
+                status_code = response.status_code
+                return response
+            finally:
+                root_span.set_attribute("route", route_label(request))
+                root_span.set_attribute("status_code", status_code)
     finally:
+        unbind_request(request_binding)
         duration = time.perf_counter() - started_at
-        HTTP_REQUESTS_TOTAL.labels(
-            method=request.method,
-            path=request.url.path,
-            status=str(status_code),
-        ).inc()
-        HTTP_REQUEST_DURATION_SECONDS.labels(method=request.method, path=request.url.path).observe(duration)
+        observe_http_request(request, status_code, duration)
 
         logger.info(
             "request_completed request_id=%s method=%s path=%s status=%s duration_ms=%.2f",
@@ -264,286 +303,19 @@ def health_check():
 
 @app.get("/metrics")
 def metrics():
-    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=metrics_payload(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/api/admin/metrics-summary")
 def admin_metrics_summary(request: Request, admin_user_id: str = Depends(require_super_admin)):
-    http_requests = defaultdict(int)
-    for metric in HTTP_REQUESTS_TOTAL.collect():
-        for sample in metric.samples:
-            if sample.name != "umbra_http_requests_total":
-                continue
-            key = (sample.labels.get("method"), sample.labels.get("path"), sample.labels.get("status"))
-            http_requests[key] += int(sample.value)
-
-    http_duration_acc = defaultdict(lambda: {"sum": 0.0, "count": 0.0})
-    http_duration_buckets = defaultdict(dict)
-    for metric in HTTP_REQUEST_DURATION_SECONDS.collect():
-        for sample in metric.samples:
-            if sample.name.endswith("_sum"):
-                key = (sample.labels.get("method"), sample.labels.get("path"))
-                http_duration_acc[key]["sum"] += float(sample.value)
-            elif sample.name.endswith("_count"):
-                key = (sample.labels.get("method"), sample.labels.get("path"))
-                http_duration_acc[key]["count"] += float(sample.value)
-            elif sample.name.endswith("_bucket"):
-                key = (sample.labels.get("method"), sample.labels.get("path"))
-                le_label = sample.labels.get("le")
-                if le_label is None:
-                    continue
-                le = float("inf") if le_label == "+Inf" else float(le_label)
-                http_duration_buckets[key][le] = float(sample.value)
-
-    agent_calls = defaultdict(int)
-    for metric in AGENT_CALLS_TOTAL.collect():
-        for sample in metric.samples:
-            if sample.name != "umbra_agent_calls_total":
-                continue
-            key = (sample.labels.get("agent"), sample.labels.get("status"))
-            agent_calls[key] += int(sample.value)
-
-    agent_duration_acc = defaultdict(lambda: {"sum": 0.0, "count": 0.0})
-    agent_duration_buckets = defaultdict(dict)
-    for metric in AGENT_CALL_DURATION_SECONDS.collect():
-        for sample in metric.samples:
-            if sample.name.endswith("_sum"):
-                key = sample.labels.get("agent")
-                agent_duration_acc[key]["sum"] += float(sample.value)
-            elif sample.name.endswith("_count"):
-                key = sample.labels.get("agent")
-                agent_duration_acc[key]["count"] += float(sample.value)
-            elif sample.name.endswith("_bucket"):
-                key = sample.labels.get("agent")
-                le_label = sample.labels.get("le")
-                if key is None or le_label is None:
-                    continue
-                le = float("inf") if le_label == "+Inf" else float(le_label)
-                agent_duration_buckets[key][le] = float(sample.value)
-
-    top_http_paths = sorted(http_requests.items(), key=lambda x: x[1], reverse=True)[:20]
-
-    http_duration_ms_avg = [
-        {
-            "method": method,
-            "path": path,
-            "avg_ms": round((vals["sum"] / vals["count"]) * 1000, 2),
-            "count": int(vals["count"]),
-        }
-        for (method, path), vals in http_duration_acc.items()
-        if vals["count"] > 0
-    ]
-
-    http_duration_ms_percentiles = [
-        {
-            "method": method,
-            "path": path,
-            "p95_ms": (
-                round(p95_seconds * 1000, 2)
-                if (p95_seconds := _histogram_quantile_upper_bound_seconds(http_duration_buckets[(method, path)], 0.95)) is not None
-                else None
-            ),
-            "p99_ms": (
-                round(p99_seconds * 1000, 2)
-                if (p99_seconds := _histogram_quantile_upper_bound_seconds(http_duration_buckets[(method, path)], 0.99)) is not None
-                else None
-            ),
-            "count": int(http_duration_acc[(method, path)]["count"]),
-        }
-        for (method, path), vals in http_duration_acc.items()
-        if vals["count"] > 0
-    ]
-
-    agent_calls_total = [
-        {
-            "agent": agent,
-            "status": status,
-            "count": count,
-        }
-        for (agent, status), count in sorted(agent_calls.items(), key=lambda x: x[1], reverse=True)
-    ]
-
-    agent_duration_ms_avg = [
-        {
-            "agent": agent,
-            "avg_ms": round((vals["sum"] / vals["count"]) * 1000, 2),
-            "count": int(vals["count"]),
-        }
-        for agent, vals in agent_duration_acc.items()
-        if vals["count"] > 0
-    ]
-
-    agent_duration_ms_percentiles = [
-        {
-            "agent": agent,
-            "p95_ms": (
-                round(p95_seconds * 1000, 2)
-                if (p95_seconds := _histogram_quantile_upper_bound_seconds(agent_duration_buckets[agent], 0.95)) is not None
-                else None
-            ),
-            "p99_ms": (
-                round(p99_seconds * 1000, 2)
-                if (p99_seconds := _histogram_quantile_upper_bound_seconds(agent_duration_buckets[agent], 0.99)) is not None
-                else None
-            ),
-            "count": int(agent_duration_acc[agent]["count"]),
-        }
-        for agent, vals in agent_duration_acc.items()
-        if vals["count"] > 0
-    ]
-
-    alerts = []
-
-    http_by_endpoint = defaultdict(lambda: {"total": 0, "errors": 0})
-    for (method, path, status), count in http_requests.items():
-        key = (method, path)
-        http_by_endpoint[key]["total"] += count
-        if str(status).startswith("5"):
-            http_by_endpoint[key]["errors"] += count
-
-    for (method, path), stats in http_by_endpoint.items():
-        total = stats["total"]
-        if total <= 0:
-            continue
-        error_rate = stats["errors"] / total
-        if error_rate >= HTTP_ERROR_RATE_CRITICAL:
-            severity = "critical"
-        elif error_rate >= HTTP_ERROR_RATE_WARNING:
-            severity = "warning"
-        else:
-            severity = None
-
-        if severity:
-            alerts.append(
-                {
-                    "category": "http_error_rate",
-                    "severity": severity,
-                    "target": {"method": method, "path": path},
-                    "value": round(error_rate, 4),
-                    "threshold": HTTP_ERROR_RATE_CRITICAL if severity == "critical" else HTTP_ERROR_RATE_WARNING,
-                    "message": f"Taxa de erro HTTP elevada em {method} {path}",
-                }
-            )
-
-    for item in http_duration_ms_percentiles:
-        p95 = item.get("p95_ms")
-        if p95 is None:
-            continue
-        if p95 >= HTTP_P95_CRITICAL_MS:
-            severity = "critical"
-        elif p95 >= HTTP_P95_WARNING_MS:
-            severity = "warning"
-        else:
-            severity = None
-
-        if severity:
-            alerts.append(
-                {
-                    "category": "http_latency_p95",
-                    "severity": severity,
-                    "target": {"method": item["method"], "path": item["path"]},
-                    "value": p95,
-                    "threshold": HTTP_P95_CRITICAL_MS if severity == "critical" else HTTP_P95_WARNING_MS,
-                    "message": f"Latência HTTP p95 elevada em {item['method']} {item['path']}",
-                }
-            )
-
-    agent_by_name = defaultdict(lambda: {"total": 0, "errors": 0})
-    for (agent, status), count in agent_calls.items():
-        if agent is None:
-            continue
-        agent_by_name[agent]["total"] += count
-        if status == "error":
-            agent_by_name[agent]["errors"] += count
-
-    for agent, stats in agent_by_name.items():
-        total = stats["total"]
-        if total <= 0:
-            continue
-        error_rate = stats["errors"] / total
-        if error_rate >= AGENT_ERROR_RATE_CRITICAL:
-            severity = "critical"
-        elif error_rate >= AGENT_ERROR_RATE_WARNING:
-            severity = "warning"
-        else:
-            severity = None
-
-        if severity:
-            alerts.append(
-                {
-                    "category": "agent_error_rate",
-                    "severity": severity,
-                    "target": {"agent": agent},
-                    "value": round(error_rate, 4),
-                    "threshold": AGENT_ERROR_RATE_CRITICAL if severity == "critical" else AGENT_ERROR_RATE_WARNING,
-                    "message": f"Taxa de erro elevada no agente {agent}",
-                }
-            )
-
-    for item in agent_duration_ms_percentiles:
-        p95 = item.get("p95_ms")
-        if p95 is None:
-            continue
-        if p95 >= AGENT_P95_CRITICAL_MS:
-            severity = "critical"
-        elif p95 >= AGENT_P95_WARNING_MS:
-            severity = "warning"
-        else:
-            severity = None
-
-        if severity:
-            alerts.append(
-                {
-                    "category": "agent_latency_p95",
-                    "severity": severity,
-                    "target": {"agent": item["agent"]},
-                    "value": p95,
-                    "threshold": AGENT_P95_CRITICAL_MS if severity == "critical" else AGENT_P95_WARNING_MS,
-                    "message": f"Latência p95 elevada no agente {item['agent']}",
-                }
-            )
-
-    alerts.sort(key=lambda item: (item["severity"] != "critical", item["category"], item["message"]))
-
+    # Prebuilt by the aggregator in the background; see metrics_summary.py.
+    snapshot = get_metrics_aggregator().snapshot()
     return {
         "admin_user_id": admin_user_id,
         "request_id": getattr(request.state, "request_id", None),
         "uptime_seconds": int(time.time() - APP_STARTED_AT),
-        "http_requests_total": [
-            {
-                "method": method,
-                "path": path,
-                "status": status,
-                "count": count,
-            }
-            for (method, path, status), count in top_http_paths
-        ],
-        "http_duration_ms_avg": [
-            *http_duration_ms_avg
-        ],
-        "http_duration_ms_percentiles": [
-            *http_duration_ms_percentiles
-        ],
-        "agent_calls_total": [
-            *agent_calls_total
-        ],
-        "agent_duration_ms_avg": [
-            *agent_duration_ms_avg
-        ],
-        "agent_duration_ms_percentiles": [
-            *agent_duration_ms_percentiles
-        ],
-        "alert_thresholds": {
-            "http_error_rate_warning": HTTP_ERROR_RATE_WARNING,
-            "http_error_rate_critical": HTTP_ERROR_RATE_CRITICAL,
-            "http_p95_warning_ms": HTTP_P95_WARNING_MS,
-            "http_p95_critical_ms": HTTP_P95_CRITICAL_MS,
-            "agent_error_rate_warning": AGENT_ERROR_RATE_WARNING,
-            "agent_error_rate_critical": AGENT_ERROR_RATE_CRITICAL,
-            "agent_p95_warning_ms": AGENT_P95_WARNING_MS,
-            "agent_p95_critical_ms": AGENT_P95_CRITICAL_MS,
-        },
-        "alerts": alerts,
+        **snapshot,
+        "alert_thresholds": alert_thresholds(),
     }
 
 
@@ -552,15 +324,19 @@ def admin_metrics_summary(request: Request, admin_user_id: str = Depends(require
 # ---------------------------------------------------------------------------
 @app.post("/api/content")
 @limiter.limit("20/minute")
-def generate_content(request: Request, body: AgentRequest, user_id: str = Depends(get_current_user)):
+async def generate_content(request: Request, body: AgentRequest, user_id: str = Depends(require_token_budget)):
     try:
-        response = _run_agent_with_resilience(
+        response = await arun_agent_with_resilience(
             agent_name="content",
             prompt=body.message,
             request_id=request.state.request_id,
-            run_agent=lambda prompt: get_content_agent(user_id=user_id).run(prompt),
+            user_id=user_id,
+            run_agent=lambda prompt: get_content_agent(user_id=user_id).arun(prompt),
         )
         return {"response": response.content}
+    except ExecutorSaturatedError:
+        logger.warning("Agent executor saturated")
+        raise HTTPException(status_code=503, detail="Serviço sobrecarregado. Tente novamente em instantes.")
     except TimeoutError:
         logger.exception("Content agent timeout")
         raise HTTPException(status_code=504, detail="Tempo de resposta excedido. Tente novamente.")
@@ -568,17 +344,34 @@ def generate_content(request: Request, body: AgentRequest, user_id: str = Depend
         logger.exception("Content agent error")
         raise HTTPException(status_code=500, detail="Erro ao gerar conteúdo. Tente novamente.")
 
+@app.post("/api/content/stream")
+@limiter.limit("20/minute")
+async def stream_content(request: Request, body: AgentRequest, user_id: str = Depends(require_token_budget)):
+    return await _stream_agent_response(
+        request,
+        agent_name="content",
+        prompt=body.message,
+        stream_agent=lambda prompt: get_content_agent(user_id=user_id).arun(
+            prompt, stream=True, yield_run_output=True
+        ),
+        error_detail="Erro ao gerar conteúdo. Tente novamente.",
+    )
+
 @app.post("/api/analytics")
 @limiter.limit("20/minute")
-def analyze_data(request: Request, body: AgentRequest, user_id: str = Depends(get_current_user)):
+async def analyze_data(request: Request, body: AgentRequest, user_id: str = Depends(require_token_budget)):
     try:
-        response = _run_agent_with_resilience(
+        response = await arun_agent_with_resilience(
             agent_name="analytics",
             prompt=body.message,
             request_id=request.state.request_id,
-            run_agent=lambda prompt: get_analytics_agent().run(prompt),
+            user_id=user_id,
+            run_agent=lambda prompt: get_analytics_agent().arun(prompt),
         )
         return {"response": response.content}
+    except ExecutorSaturatedError:
+        logger.warning("Agent executor saturated")
+        raise HTTPException(status_code=503, detail="Serviço sobrecarregado. Tente novamente em instantes.")
     except TimeoutError:
         logger.exception("Analytics agent timeout")
         raise HTTPException(status_code=504, detail="Tempo de resposta excedido. Tente novamente.")
@@ -588,7 +381,7 @@ def analyze_data(request: Request, body: AgentRequest, user_id: str = Depends(ge
 
 @app.post("/api/ugc")
 @limiter.limit("10/minute")
-def generate_ugc(request: Request, body: UGCRequest, user_id: str = Depends(get_current_user)):
+async def generate_ugc(request: Request, response: Response, body: UGCRequest, user_id: str = Depends(require_token_budget)):
     try:
         prompt = f"""
         Crie um roteiro de vídeo viral UGC.
@@ -597,16 +390,24 @@ def generate_ugc(request: Request, body: UGCRequest, user_id: str = Depends(get_
         Persona da Marca/Especialista: {body.expert_name}
         Estilo do Vídeo: {body.style}
         """
-        response = _run_agent_with_resilience(
-            agent_name="ugc",
-            prompt=prompt,
-            request_id=request.state.request_id,
-            run_agent=lambda prompt: get_ugc_agent().run(prompt),
-        )
-        return _safe_parse_json(response.content)
+
+        async def generate():
+            result = await arun_agent_with_resilience(
+                agent_name="ugc",
+                prompt=prompt,
+                request_id=request.state.request_id,
+                user_id=user_id,
+                run_agent=lambda prompt: get_ugc_agent().arun(prompt),
+            )
+            return _safe_parse_json(result.content)
+
+        return await _cached_generation(request, response, user_id, "ugc", body, generate)
     except json.JSONDecodeError:
         logger.exception("UGC agent returned invalid JSON")
         raise HTTPException(status_code=502, detail="Resposta inválida do agente de IA.")
+    except ExecutorSaturatedError:
+        logger.warning("Agent executor saturated")
+        raise HTTPException(status_code=503, detail="Serviço sobrecarregado. Tente novamente em instantes.")
     except TimeoutError:
         logger.exception("UGC agent timeout")
         raise HTTPException(status_code=504, detail="Tempo de resposta excedido. Tente novamente.")
@@ -616,19 +417,27 @@ def generate_ugc(request: Request, body: UGCRequest, user_id: str = Depends(get_
 
 @app.post("/api/static-ad")
 @limiter.limit("10/minute")
-def generate_static_ad(request: Request, body: StaticAdRequest, user_id: str = Depends(get_current_user)):
+async def generate_static_ad(request: Request, response: Response, body: StaticAdRequest, user_id: str = Depends(require_token_budget)):
     try:
         prompt = f"Produto: {body.product_name}\nPúblico: {body.audience_name}\nOferta/Objetivo: {body.offer}"
-        response = _run_agent_with_resilience(
-            agent_name="static_ad",
-            prompt=prompt,
-            request_id=request.state.request_id,
-            run_agent=lambda prompt: get_static_ad_agent().run(prompt),
-        )
-        return _safe_parse_json(response.content)
+
+        async def generate():
+            result = await arun_agent_with_resilience(
+                agent_name="static_ad",
+                prompt=prompt,
+                request_id=request.state.request_id,
+                user_id=user_id,
+                run_agent=lambda prompt: get_static_ad_agent().arun(prompt),
+            )
+            return _safe_parse_json(result.content)
+
+        return await _cached_generation(request, response, user_id, "static_ad", body, generate)
     except json.JSONDecodeError:
         logger.exception("Static ad agent returned invalid JSON")
         raise HTTPException(status_code=502, detail="Resposta inválida do agente de IA.")
+    except ExecutorSaturatedError:
+        logger.warning("Agent executor saturated")
+        raise HTTPException(status_code=503, detail="Serviço sobrecarregado. Tente novamente em instantes.")
     except TimeoutError:
         logger.exception("Static ad agent timeout")
         raise HTTPException(status_code=504, detail="Tempo de resposta excedido. Tente novamente.")
@@ -638,19 +447,27 @@ def generate_static_ad(request: Request, body: StaticAdRequest, user_id: str = D
 
 @app.post("/api/email")
 @limiter.limit("10/minute")
-def generate_email(request: Request, body: EmailRequest, user_id: str = Depends(get_current_user)):
+async def generate_email(request: Request, response: Response, body: EmailRequest, user_id: str = Depends(require_token_budget)):
     try:
         prompt = f"Produto: {body.product_name}\nPúblico: {body.audience_name}\nObjetivo: {body.objective}"
-        response = _run_agent_with_resilience(
-            agent_name="email",
-            prompt=prompt,
-            request_id=request.state.request_id,
-            run_agent=lambda prompt: get_email_agent().run(prompt),
-        )
-        return _safe_parse_json(response.content)
+
+        async def generate():
+            result = await arun_agent_with_resilience(
+                agent_name="email",
+                prompt=prompt,
+                request_id=request.state.request_id,
+                user_id=user_id,
+                run_agent=lambda prompt: get_email_agent().arun(prompt),
+            )
+            return _safe_parse_json(result.content)
+
+        return await _cached_generation(request, response, user_id, "email", body, generate)
     except json.JSONDecodeError:
         logger.exception("Email agent returned invalid JSON")
         raise HTTPException(status_code=502, detail="Resposta inválida do agente de IA.")
+    except ExecutorSaturatedError:
+        logger.warning("Agent executor saturated")
+        raise HTTPException(status_code=503, detail="Serviço sobrecarregado. Tente novamente em instantes.")
     except TimeoutError:
         logger.exception("Email agent timeout")
         raise HTTPException(status_code=504, detail="Tempo de resposta excedido. Tente novamente.")
@@ -660,19 +477,27 @@ def generate_email(request: Request, body: EmailRequest, user_id: str = Depends(
 
 @app.post("/api/message")
 @limiter.limit("10/minute")
-def generate_message(request: Request, body: MessageRequest, user_id: str = Depends(get_current_user)):
+async def generate_message(request: Request, response: Response, body: MessageRequest, user_id: str = Depends(require_token_budget)):
     try:
         prompt = f"Contexto: {body.context}\nTom de voz: {body.tone}"
-        response = _run_agent_with_resilience(
-            agent_name="message",
-            prompt=prompt,
-            request_id=request.state.request_id,
-            run_agent=lambda prompt: get_message_agent().run(prompt),
-        )
-        return _safe_parse_json(response.content)
+
+        async def generate():
+            result = await arun_agent_with_resilience(
+                agent_name="message",
+                prompt=prompt,
+                request_id=request.state.request_id,
+                user_id=user_id,
+                run_agent=lambda prompt: get_message_agent().arun(prompt),
+            )
+            return _safe_parse_json(result.content)
+
+        return await _cached_generation(request, response, user_id, "message", body, generate)
     except json.JSONDecodeError:
         logger.exception("Message agent returned invalid JSON")
         raise HTTPException(status_code=502, detail="Resposta inválida do agente de IA.")
+    except ExecutorSaturatedError:
+        logger.warning("Agent executor saturated")
+        raise HTTPException(status_code=503, detail="Serviço sobrecarregado. Tente novamente em instantes.")
     except TimeoutError:
         logger.exception("Message agent timeout")
         raise HTTPException(status_code=504, detail="Tempo de resposta excedido. Tente novamente.")
@@ -680,42 +505,94 @@ def generate_message(request: Request, body: MessageRequest, user_id: str = Depe
         logger.exception("Message agent error")
         raise HTTPException(status_code=500, detail="Erro ao gerar mensagem. Tente novamente.")
 
-@app.post("/api/brain/upload")
+@app.post(
+    "/api/brain/upload",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                        "required": ["file"],
+                    }
+                }
+            },
+        }
+    },
+)
 @limiter.limit("5/minute")
-async def upload_knowledge(request: Request, file: UploadFile, user_id: str = Depends(get_current_user)):
+async def upload_knowledge(request: Request, user_id: str = Depends(get_current_user)):
+    # The body is parsed as it streams in and written straight to the job's spool file,
+    # so an oversized upload is rejected at the first byte past MAX_UPLOAD_SIZE.
+    queue = get_ingestion_queue()
+    job_id, spool_path = queue.reserve()
     try:
-        # --- File size check ---
-        contents = await file.read()
-        if len(contents) > MAX_UPLOAD_SIZE:
-            raise HTTPException(
-                status_code=413,
-                detail=f"Arquivo excede o limite de {MAX_UPLOAD_SIZE // (1024*1024)}MB.",
-            )
-        await file.seek(0)
-
-        result = await process_document(file, user_id=user_id)
-        return result
+        try:
+            upload = await receive_upload(request, spool_path, MAX_UPLOAD_SIZE)
+            file_type = validate_file(upload.filename, upload.head, upload.size)
+        except UploadTooLargeError as e:
+            discard_spool(spool_path)
+            raise HTTPException(status_code=413, detail=str(e))
+        except ValueError as e:
+            discard_spool(spool_path)
+            return {"status": "error", "message": str(e)}
+
+        job = await queue.submit_spooled(job_id, user_id, upload.filename, file_type, upload.path)
+        return JSONResponse(
+            status_code=202,
+            content={
+                "status": "queued",
+                "job_id": job["id"],
+                "message": f"Documento recebido, processamento em andamento: {upload.filename}",
+            },
+        )
     except HTTPException:
         raise
     except Exception:
+        discard_spool(spool_path)
         logger.exception("Upload error")
         raise HTTPException(status_code=500, detail="Erro ao processar documento.")
 
+@app.get("/api/brain/jobs/{job_id}")
+async def get_ingestion_job(request: Request, job_id: str, user_id: str = Depends(get_current_user)):
+    job = await get_ingestion_queue().get_job(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    return public_job(job)
+
+@app.post("/api/brain/jobs/{job_id}/retry")
+@limiter.limit("10/minute")
+async def retry_ingestion_job(request: Request, job_id: str, user_id: str = Depends(get_current_user)):
+    queue = get_ingestion_queue()
+    if await queue.get_job(job_id, user_id) is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+
+    job = await queue.retry(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=409, detail="Apenas jobs com falha podem ser reprocessados.")
+    return public_job(job)
+
 @app.post("/api/brain/query")
 @limiter.limit("20/minute")
-def query_brain(request: Request, body: BrainQueryRequest, user_id: str = Depends(get_current_user)):
+async def query_brain(request: Request, body: BrainQueryRequest, user_id: str = Depends(require_token_budget)):
     try:
         agent = get_brain_agent(user_id=user_id)
         if not agent:
             return {"response": "Base de Conhecimento não configurada."}
 
-        response = _run_agent_with_resilience(
+        response = await arun_agent_with_resilience(
             agent_name="brain",
             prompt=body.query,
             request_id=request.state.request_id,
-            run_agent=lambda prompt: agent.run(prompt),
+            user_id=user_id,
+            run_agent=lambda prompt: agent.arun(prompt),
         )
         return {"response": response.content}
+    except ExecutorSaturatedError:
+        logger.warning("Agent executor saturated")
+        raise HTTPException(status_code=503, detail="Serviço sobrecarregado. Tente novamente em instantes.")
     except TimeoutError:
         logger.exception("Brain query timeout")
         raise HTTPException(status_code=504, detail="Tempo de resposta excedido. Tente novamente.")
@@ -723,16 +600,31 @@ def query_brain(request: Request, body: BrainQueryRequest, user_id: str = Depend
         logger.exception("Brain query error")
         raise HTTPException(status_code=500, detail="Erro na consulta. Tente novamente.")
 
+@app.post("/api/brain/query/stream")
+@limiter.limit("20/minute")
+async def stream_brain_query(request: Request, body: BrainQueryRequest, user_id: str = Depends(require_token_budget)):
+    agent = get_brain_agent(user_id=user_id)
+    if not agent:
+        return {"response": "Base de Conhecimento não configurada."}
+
+    return await _stream_agent_response(
+        request,
+        agent_name="brain",
+        prompt=body.query,
+        stream_agent=lambda prompt: agent.arun(prompt, stream=True, yield_run_output=True),
+        error_detail="Erro na consulta. Tente novamente.",
+    )
+
 @app.post("/api/chat")
 @limiter.limit("30/minute")
-def chat_interceptor(request: Request, body: AgentRequest, user_id: str = Depends(get_current_user)):
+async def chat_interceptor(request: Request, body: AgentRequest, user_id: str = Depends(require_token_budget)):
     try:
-        from agent import get_agent
-        response = _run_agent_with_resilience(
+        response = await arun_agent_with_resilience(
             agent_name="router",
             prompt=body.message,
             request_id=request.state.request_id,
-            run_agent=lambda prompt: get_agent(user_id=user_id).run(prompt),
+            user_id=user_id,
+            run_agent=lambda prompt: router_agent.get_agent(user_id=user_id).arun(prompt),
         )
 
         content = response.content
@@ -743,9 +635,24 @@ def chat_interceptor(request: Request, body: AgentRequest, user_id: str = Depend
             pass
 
         return {"response": content}
+    except ExecutorSaturatedError:
+        logger.warning("Agent executor saturated")
+        raise HTTPException(status_code=503, detail="Serviço sobrecarregado. Tente novamente em instantes.")
     except TimeoutError:
         logger.exception("Chat interceptor timeout")
         raise HTTPException(status_code=504, detail="Tempo de resposta excedido. Tente novamente.")
     except Exception:
         logger.exception("Chat interceptor error")
         raise HTTPException(status_code=500, detail="Erro no chat. Tente novamente.")
+
+@app.post("/api/chat/stream")
+@limiter.limit("30/minute")
+async def stream_chat(request: Request, body: AgentRequest, user_id: str = Depends(require_token_budget)):
+    return await _stream_agent_response(
+        request,
+        agent_name="router",
+        prompt=body.message,
+        stream_agent=lambda prompt: router_agent.get_agent(user_id=user_id).arun(prompt, stream=True, yield_run_output=True),
+        error_detail="Erro no chat. Tente novamente.",
+        parse_action=True,
+    )
@@ -0,0 +1,631 @@
+"""
+Precomputed admin metrics summary.
+
+Requests, agent calls, response-cache lookups and LLM usage (usage.py) are
+recorded here as they happen. Recording only appends the event to a pending
+list under a short lock; the background refresh folds pending events into
+per-series rolling buckets (one per minute for the last hour and one per hour
+for the last day, plus a since-start total) that only it touches, so merging
+windows never makes a request wait. The refresh rebuilds the summary (top
+paths, averages, percentiles, alerts) every METRICS_SUMMARY_REFRESH_SECONDS,
+so /api/admin/metrics-summary returns a prebuilt snapshot instead of walking
+the Prometheus registry per call.
+
+With several workers (METRICS_SUMMARY_SHARED_DIR, by default the
+PROMETHEUS_MULTIPROC_DIR), each refresh also writes this worker's already
+merged views (since-start total and one entry per window, not the buckets
+behind them) to summary_<pid>.json there and builds the snapshot by adding up
+every worker's views, so any worker answers with the fleet-wide view. Recording
+never touches the files; only the background refresh does, in a worker thread,
+so neither the file I/O nor the merge runs on the event loop. A worker's window
+counts until that window has passed since its last export, so a worker that
+exited fades out of the windows like its buckets would have. Files a worker
+stopped refreshing METRICS_SUMMARY_STALE_SECONDS ago are deleted, dropping its
+since-start totals with it.
+
+Users are the one unbounded key: a user's usage series is dropped once it
+had no activity for a whole day, and at most METRICS_SUMMARY_MAX_USERS are
+kept, so per-user "since start" totals cover the users active in the last day.
+
+Latency percentiles come from a LatencySketch per bucket, merged per window,
+so p95/p99 are accurate to about 1% instead of being rounded up to the next
+Prometheus bucket bound. Alerts are evaluated on the 5-minute window and
+remember since when they fire.
+"""
+
+import asyncio
+import glob
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Hashable
+
+from latency_sketch import LatencySketch
+
+logger = logging.getLogger(__name__)
+
+METRICS_SUMMARY_REFRESH_SECONDS = float(os.getenv("METRICS_SUMMARY_REFRESH_SECONDS", "5"))
+METRICS_SUMMARY_TOP_PATHS = int(os.getenv("METRICS_SUMMARY_TOP_PATHS", "20"))
+METRICS_SUMMARY_TOP_USERS = int(os.getenv("METRICS_SUMMARY_TOP_USERS", "20"))
+# Per-user usage series kept in memory; the least recently active go first past the cap.
+METRICS_SUMMARY_MAX_USERS = int(os.getenv("METRICS_SUMMARY_MAX_USERS", "5000"))
+# Directory shared by all workers of this host; empty keeps the summary per process.
+METRICS_SUMMARY_SHARED_DIR = os.getenv("METRICS_SUMMARY_SHARED_DIR", os.getenv("PROMETHEUS_MULTIPROC_DIR", ""))
+METRICS_SUMMARY_STALE_SECONDS = float(os.getenv("METRICS_SUMMARY_STALE_SECONDS", str(24 * 60 * 60)))
+
+HTTP_ERROR_RATE_WARNING = float(os.getenv("HTTP_ERROR_RATE_WARNING", "0.05"))
+HTTP_ERROR_RATE_CRITICAL = float(os.getenv("HTTP_ERROR_RATE_CRITICAL", "0.10"))
+HTTP_P95_WARNING_MS = float(os.getenv("HTTP_P95_WARNING_MS", "1200"))
+HTTP_P95_CRITICAL_MS = float(os.getenv("HTTP_P95_CRITICAL_MS", "2500"))
+AGENT_ERROR_RATE_WARNING = float(os.getenv("AGENT_ERROR_RATE_WARNING", "0.08"))
+AGENT_ERROR_RATE_CRITICAL = float(os.getenv("AGENT_ERROR_RATE_CRITICAL", "0.15"))
+AGENT_P95_WARNING_MS = float(os.getenv("AGENT_P95_WARNING_MS", "5000"))
+AGENT_P95_CRITICAL_MS = float(os.getenv("AGENT_P95_CRITICAL_MS", "9000"))
+
+# Window name -> length in seconds; windows up to an hour use minute buckets, longer ones hour buckets.
+WINDOWS = {"5m": 5 * 60, "1h": 60 * 60, "24h": 24 * 60 * 60}
+ALERT_WINDOW = "5m"
+
+SERIES_KINDS = ("http", "agents", "caches", "usage_users", "usage_endpoints", "usage_models")
+# Events recorded while no refresh ran; past this, the recorder folds them itself.
+_MAX_PENDING_EVENTS = 100_000
+
+
+def alert_thresholds() -> dict[str, float]:
+    return {
+        "http_error_rate_warning": HTTP_ERROR_RATE_WARNING,
+        "http_error_rate_critical": HTTP_ERROR_RATE_CRITICAL,
+        "http_p95_warning_ms": HTTP_P95_WARNING_MS,
+        "http_p95_critical_ms": HTTP_P95_CRITICAL_MS,
+        "agent_error_rate_warning": AGENT_ERROR_RATE_WARNING,
+        "agent_error_rate_critical": AGENT_ERROR_RATE_CRITICAL,
+        "agent_p95_warning_ms": AGENT_P95_WARNING_MS,
+        "agent_p95_critical_ms": AGENT_P95_CRITICAL_MS,
+    }
+
+
+class _Stats:
+    """Mergeable counts, summed values, latency sum and latency sketch for one series over some span."""
+
+    __slots__ = ("count", "sum_seconds", "sketch", "statuses", "values")
+
+    def __init__(self):
+        self.count = 0
+        self.sum_seconds = 0.0
+        self.sketch = LatencySketch()
+        self.statuses: dict[str, int] = defaultdict(int)
+        self.values: dict[str, float] = defaultdict(float)
+
+    def add(self, status: str, duration_seconds: float | None, values: dict[str, float] | None = None) -> None:
+        self.statuses[status] += 1
+        for name, value in (values or {}).items():
+            self.values[name] += value
+        if duration_seconds is None:
+            return
+        self.count += 1
+        self.sum_seconds += duration_seconds
+        self.sketch.add(duration_seconds)
+
+    def merge(self, other: "_Stats") -> None:
+        self.count += other.count
+        self.sum_seconds += other.sum_seconds
+        self.sketch.merge(other.sketch)
+        for status, value in other.statuses.items():
+            self.statuses[status] += value
+        for name, value in other.values.items():
+            self.values[name] += value
+
+    def quantile_seconds(self, quantile: float) -> float | None:
+        return self.sketch.quantile(quantile)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum_seconds": self.sum_seconds,
+            "sketch": self.sketch.to_dict(),
+            "statuses": dict(self.statuses),
+            "values": dict(self.values),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "_Stats":
+        stats = cls()
+        stats.count = data["count"]
+        stats.sum_seconds = data["sum_seconds"]
+        stats.sketch = LatencySketch.from_dict(data["sketch"])
+        stats.statuses.update(data["statuses"])
+        stats.values.update(data.get("values", {}))
+        return stats
+
+
+class _RollingSeries:
+    __slots__ = ("minutes", "hours", "total")
+
+    def __init__(self):
+        self.minutes: dict[int, _Stats] = {}
+        self.hours: dict[int, _Stats] = {}
+        self.total = _Stats()
+
+    def add(self, now: float, status: str, duration_seconds: float | None, values: dict[str, float] | None = None) -> None:
+        minute, hour = int(now // 60), int(now // 3600)
+        if minute not in self.minutes:
+            self.minutes[minute] = _Stats()
+            for stale in [key for key in self.minutes if key <= minute - 60]:
+                del self.minutes[stale]
+        if hour not in self.hours:
+            self.hours[hour] = _Stats()
+            for stale in [key for key in self.hours if key <= hour - 24]:
+                del self.hours[stale]
+        self.minutes[minute].add(status, duration_seconds, values)
+        self.hours[hour].add(status, duration_seconds, values)
+        self.total.add(status, duration_seconds, values)
+
+    def last_active_hour(self) -> int | None:
+        return max(self.hours) if self.hours else None
+
+    def window(self, now: float, seconds: int) -> _Stats:
+        merged = _Stats()
+        if seconds <= 3600:
+            first = int(now // 60) - seconds // 60
+            buckets = (stats for minute, stats in self.minutes.items() if minute > first)
+        else:
+            first = int(now // 3600) - seconds // 3600
+            buckets = (stats for hour, stats in self.hours.items() if hour > first)
+        for stats in buckets:
+            merged.merge(stats)
+        return merged
+
+
+
+def _ms(seconds: float | None) -> float | None:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def _severity(value: float, warning: float, critical: float) -> str | None:
+    if value >= critical:
+        return "critical"
+    if value >= warning:
+        return "warning"
+    return None
+
+
+def _http_sections(http: dict[tuple[str, str], _Stats]) -> dict[str, list]:
+    by_status = (
+        ((method, path, status), count)
+        for (method, path), stats in http.items()
+        for status, count in stats.statuses.items()
+    )
+    top_paths = heapq.nlargest(METRICS_SUMMARY_TOP_PATHS, by_status, key=lambda item: item[1])
+    timed = [(key, stats) for key, stats in http.items() if stats.count > 0]
+    return {
+        "http_requests_total": [
+            {"method": method, "path": path, "status": status, "count": count}
+            for (method, path, status), count in top_paths
+        ],
+        "http_duration_ms_avg": [
+            {
+                "method": method,
+                "path": path,
+                "avg_ms": round((stats.sum_seconds / stats.count) * 1000, 2),
+                "count": stats.count,
+            }
+            for (method, path), stats in timed
+        ],
+        "http_duration_ms_percentiles": [
+            {
+                "method": method,
+                "path": path,
+                "p95_ms": _ms(stats.quantile_seconds(0.95)),
+                "p99_ms": _ms(stats.quantile_seconds(0.99)),
+                "count": stats.count,
+            }
+            for (method, path), stats in timed
+        ],
+    }
+
+
+def _agent_sections(agents: dict[str, _Stats]) -> dict[str, list]:
+    calls = [
+        ((agent, status), count)
+        for agent, stats in agents.items()
+        for status, count in stats.statuses.items()
+    ]
+    timed = [(agent, stats) for agent, stats in agents.items() if stats.count > 0]
+    return {
+        "agent_calls_total": [
+            {"agent": agent, "status": status, "count": count}
+            for (agent, status), count in sorted(calls, key=lambda item: item[1], reverse=True)
+        ],
+        "agent_duration_ms_avg": [
+            {
+                "agent": agent,
+                "avg_ms": round((stats.sum_seconds / stats.count) * 1000, 2),
+                "count": stats.count,
+            }
+            for agent, stats in timed
+        ],
+        "agent_duration_ms_percentiles": [
+            {
+                "agent": agent,
+                "p95_ms": _ms(stats.quantile_seconds(0.95)),
+                "p99_ms": _ms(stats.quantile_seconds(0.99)),
+                "count": stats.count,
+            }
+            for agent, stats in timed
+        ],
+    }
+
+
+def _cache_section(caches: dict[str, _Stats]) -> list[dict]:
+    section = []
+    for agent, stats in sorted(caches.items()):
+        results = stats.statuses
+        hits = results["exact_hit"] + results["similar_hit"]
+        lookups = hits + results["miss"]
+        section.append(
+            {
+                "agent": agent,
+                "exact_hits": results["exact_hit"],
+                "similar_hits": results["similar_hit"],
+                "misses": results["miss"],
+                "bypasses": results["bypass"],
+                "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            }
+        )
+    return section
+
+
+def _usage_rows(series: dict, key_names: tuple[str, ...], limit: int | None = None) -> list[dict]:
+    ranked = sorted(series.items(), key=lambda item: item[1].values["cost_usd"], reverse=True)
+    rows = []
+    for key, stats in ranked[:limit]:
+        key = key if isinstance(key, tuple) else (key,)
+        rows.append(
+            {
+                **dict(zip(key_names, key)),
+                "calls": sum(stats.statuses.values()),
+                "prompt_tokens": int(stats.values["prompt_tokens"]),
+                "completion_tokens": int(stats.values["completion_tokens"]),
+                "cached_tokens": int(stats.values["cached_tokens"]),
+                "total_tokens": int(stats.values["total_tokens"]),
+                "cost_usd": round(stats.values["cost_usd"], 6),
+                "avg_ms": round((stats.sum_seconds / stats.count) * 1000, 2) if stats.count else None,
+                "p95_ms": _ms(stats.quantile_seconds(0.95)),
+            }
+        )
+    return rows
+
+
+def _usage_section(users: dict, endpoints: dict, models: dict) -> dict[str, list]:
+    return {
+        "by_user": _usage_rows(users, ("user_id",), METRICS_SUMMARY_TOP_USERS),
+        "by_endpoint": _usage_rows(endpoints, ("endpoint",)),
+        "by_agent_model": _usage_rows(models, ("agent", "model")),
+    }
+
+
+def _alerts(http: dict[tuple[str, str], _Stats], agents: dict[str, _Stats]) -> list[dict]:
+    alerts = []
+
+    for (method, path), stats in http.items():
+        total = sum(stats.statuses.values())
+        if total > 0:
+            errors = sum(count for status, count in stats.statuses.items() if status.startswith("5"))
+            error_rate = errors / total
+            severity = _severity(error_rate, HTTP_ERROR_RATE_WARNING, HTTP_ERROR_RATE_CRITICAL)
+            if severity:
+                alerts.append(
+                    {
+                        "category": "http_error_rate",
+                        "severity": severity,
+                        "target": {"method": method, "path": path},
+                        "value": round(error_rate, 4),
+                        "threshold": HTTP_ERROR_RATE_CRITICAL if severity == "critical" else HTTP_ERROR_RATE_WARNING,
+                        "message": f"Taxa de erro HTTP elevada em {method} {path}",
+                    }
+                )
+
+        p95 = _ms(stats.quantile_seconds(0.95))
+        severity = _severity(p95, HTTP_P95_WARNING_MS, HTTP_P95_CRITICAL_MS) if p95 is not None else None
+        if severity:
+            alerts.append(
+                {
+                    "category": "http_latency_p95",
+                    "severity": severity,
+                    "target": {"method": method, "path": path},
+                    "value": p95,
+                    "threshold": HTTP_P95_CRITICAL_MS if severity == "critical" else HTTP_P95_WARNING_MS,
+                    "message": f"Latência HTTP p95 elevada em {method} {path}",
+                }
+            )
+
+    for agent, stats in agents.items():
+        total = sum(stats.statuses.values())
+        if total > 0:
+            error_rate = stats.statuses.get("error", 0) / total
+            severity = _severity(error_rate, AGENT_ERROR_RATE_WARNING, AGENT_ERROR_RATE_CRITICAL)
+            if severity:
+                alerts.append(
+                    {
+                        "category": "agent_error_rate",
+                        "severity": severity,
+                        "target": {"agent": agent},
+                        "value": round(error_rate, 4),
+                        "threshold": AGENT_ERROR_RATE_CRITICAL if severity == "critical" else AGENT_ERROR_RATE_WARNING,
+                        "message": f"Taxa de erro elevada no agente {agent}",
+                    }
+                )
+
+        p95 = _ms(stats.quantile_seconds(0.95))
+        severity = _severity(p95, AGENT_P95_WARNING_MS, AGENT_P95_CRITICAL_MS) if p95 is not None else None
+        if severity:
+            alerts.append(
+                {
+                    "category": "agent_latency_p95",
+                    "severity": severity,
+                    "target": {"agent": agent},
+                    "value": p95,
+                    "threshold": AGENT_P95_CRITICAL_MS if severity == "critical" else AGENT_P95_WARNING_MS,
+                    "message": f"Latência p95 elevada no agente {agent}",
+                }
+            )
+
+    alerts.sort(key=lambda item: (item["severity"] != "critical", item["category"], item["message"]))
+    return alerts
+
+
+class MetricsAggregator:
+    def __init__(
+        self,
+        refresh_seconds: float = METRICS_SUMMARY_REFRESH_SECONDS,
+        clock: Callable[[], float] = time.time,
+        shared_dir: str = METRICS_SUMMARY_SHARED_DIR,
+        worker_id: str | None = None,
+    ):
+        self.refresh_seconds = refresh_seconds
+        self.shared_dir = shared_dir
+        self.worker_id = worker_id or str(os.getpid())
+        self._clock = clock
+        # _lock only guards _pending; _refresh_lock owns the rolling series and alert state.
+        self._lock = threading.Lock()
+        self._pending: list[tuple] = []
+        self._refresh_lock = threading.Lock()
+        self._http: dict[tuple[str, str], _RollingSeries] = defaultdict(_RollingSeries)
+        self._agents: dict[str, _RollingSeries] = defaultdict(_RollingSeries)
+        self._caches: dict[str, _RollingSeries] = defaultdict(_RollingSeries)
+        self._usage_users: dict[str, _RollingSeries] = defaultdict(_RollingSeries)
+        self._usage_endpoints: dict[str, _RollingSeries] = defaultdict(_RollingSeries)
+        self._usage_models: dict[tuple[str, str], _RollingSeries] = defaultdict(_RollingSeries)
+        self._alert_since: dict[str, float] = {}
+        self._snapshot: dict[str, Any] | None = None
+        self._task: asyncio.Task | None = None
+
+    def _enqueue(self, events: list[tuple]) -> None:
+        with self._lock:
+            self._pending.extend(events)
+            backlog = len(self._pending)
+        # Without a background refresh nothing drains the list; fold here so it stays bounded.
+        if backlog >= _MAX_PENDING_EVENTS and self._task is None and self._refresh_lock.acquire(blocking=False):
+            try:
+                self._fold()
+            finally:
+                self._refresh_lock.release()
+
+    def _fold(self) -> None:
+        """Apply pending events to the rolling series; the caller holds _refresh_lock."""
+        with self._lock:
+            events, self._pending = self._pending, []
+        for series, key, now, status, duration, values in events:
+            series[key].add(now, status, duration, values)
+
+    def _record(self, series: dict[Hashable, _RollingSeries], key: Hashable, status: str, duration: float | None) -> None:
+        self._enqueue([(series, key, self._clock(), status, duration, None)])
+
+    def record_http(self, method: str, path: str, status: str, duration_seconds: float) -> None:
+        self._record(self._http, (method, path), status, duration_seconds)
+
+    def record_agent(self, agent: str, status: str, duration_seconds: float) -> None:
+        self._record(self._agents, agent, status, duration_seconds)
+
+    def record_cache_lookup(self, agent: str, result: str) -> None:
+        self._record(self._caches, agent, result, None)
+
+    def record_usage(
+        self,
+        user: str,
+        endpoint: str,
+        agent: str,
+        model: str,
+        values: dict[str, float],
+        duration_seconds: float | None = None,
+    ) -> None:
+        now = self._clock()
+        self._enqueue(
+            [
+                (self._usage_users, user, now, "call", duration_seconds, values),
+                (self._usage_endpoints, endpoint, now, "call", duration_seconds, values),
+                (self._usage_models, (agent, model), now, "call", duration_seconds, values),
+            ]
+        )
+
+    def _series_sets(self) -> tuple[dict, ...]:
+        # Order matches SERIES_KINDS.
+        return (
+            self._http,
+            self._agents,
+            self._caches,
+            self._usage_users,
+            self._usage_endpoints,
+            self._usage_models,
+        )
+
+    def _evict_idle_users(self, now: float) -> None:
+        oldest_kept_hour = int(now // 3600) - 23
+        active = sorted(
+            (hour, user)
+            for user, series in self._usage_users.items()
+            if (hour := series.last_active_hour()) is not None and hour >= oldest_kept_hour
+        )
+        keep = {user for _, user in active[-METRICS_SUMMARY_MAX_USERS:]}
+        for user in [user for user in self._usage_users if user not in keep]:
+            del self._usage_users[user]
+
+    def _views(self, now: float) -> dict[str, tuple[dict, ...]]:
+        """This worker's since-start totals ("total") and one merged view per window."""
+        series_sets = self._series_sets()
+        views = {"total": self._collect(now, None, series_sets)}
+        for name, seconds in WINDOWS.items():
+            views[name] = self._collect(now, seconds, series_sets)
+        return views
+
+    def _export(self, views: dict[str, tuple[dict, ...]], now: float) -> None:
+        payload = {
+            "exported_at": now,
+            "views": {
+                name: {
+                    kind: [
+                        [list(key) if isinstance(key, tuple) else key, stats.to_dict()]
+                        for key, stats in view.items()
+                        if stats.statuses
+                    ]
+                    for kind, view in zip(SERIES_KINDS, view_sets)
+                }
+                for name, view_sets in views.items()
+            },
+        }
+        os.makedirs(self.shared_dir, exist_ok=True)
+        path = os.path.join(self.shared_dir, f"summary_{self.worker_id}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as handle:
+            json.dump(payload, handle, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+
+    def _load_fleet(self, views: dict[str, tuple[dict, ...]], now: float) -> dict[str, tuple[dict, ...]]:
+        fleet = {name: tuple(defaultdict(_Stats) for _ in SERIES_KINDS) for name in views}
+        for name, view_sets in views.items():
+            for merged, view in zip(fleet[name], view_sets):
+                for key, stats in view.items():
+                    merged[key].merge(stats)
+
+        own_path = os.path.join(self.shared_dir, f"summary_{self.worker_id}.json")
+        # File times are wall-clock, whatever clock the aggregator runs on.
+        stale_before = time.time() - METRICS_SUMMARY_STALE_SECONDS
+        for path in glob.glob(os.path.join(self.shared_dir, "summary_*.json")):
+            if path == own_path:
+                continue
+            try:
+                if os.path.getmtime(path) < stale_before:
+                    os.remove(path)
+                    logger.info("Resumo de métricas de worker inativo removido: %s", path)
+                    continue
+                with open(path, encoding="utf-8") as handle:
+                    payload = json.load(handle)
+            except (OSError, ValueError):
+                logger.exception("Resumo de métricas ilegível em %s", path)
+                continue
+            exported_at = payload.get("exported_at", 0)
+            for name, kinds in payload.get("views", {}).items():
+                if name not in fleet or (name in WINDOWS and exported_at <= now - WINDOWS[name]):
+                    continue
+                for merged, kind in zip(fleet[name], SERIES_KINDS):
+                    for key, data in kinds.get(kind, []):
+                        key = tuple(key) if isinstance(key, list) else key
+                        merged[key].merge(_Stats.from_dict(data))
+        return fleet
+
+    @staticmethod
+    def _collect(now: float, seconds: int | None, series_sets) -> tuple[dict, ...]:
+        def view(series: dict) -> dict:
+            if seconds is None:
+                return {key: rolling.total for key, rolling in series.items()}
+            return {key: rolling.window(now, seconds) for key, rolling in series.items()}
+
+        return tuple(view(series) for series in series_sets)
+
+    def _track_alerts(self, alerts: list[dict], now: float) -> None:
+        firing = {}
+        for alert in alerts:
+            key = json.dumps([alert["category"], alert["target"]], sort_keys=True)
+            firing[key] = self._alert_since.get(key, now)
+            alert["since"] = int(firing[key])
+        self._alert_since = firing
+
+    def refresh(self) -> dict[str, Any]:
+        """Fold pending events and rebuild the summary snapshot from the rolling series."""
+        with self._refresh_lock:
+            return self._rebuild()
+
+    def _rebuild(self) -> dict[str, Any]:
+        now = self._clock()
+        self._fold()
+        self._evict_idle_users(now)
+        views = self._views(now)
+        if self.shared_dir:
+            self._export(views, now)
+            views = self._load_fleet(views, now)
+        http, agents, caches, *usage = views["total"]
+        snapshot: dict[str, Any] = {
+            **_http_sections(http),
+            **_agent_sections(agents),
+            "response_cache_hit_ratio": _cache_section(caches),
+            "llm_usage": _usage_section(*usage),
+            "windows": {},
+        }
+        for name in WINDOWS:
+            http, agents, caches, *usage = views[name]
+            window = {
+                **_http_sections(http),
+                **_agent_sections(agents),
+                "response_cache_hit_ratio": _cache_section(caches),
+                "llm_usage": _usage_section(*usage),
+                "alerts": _alerts(http, agents),
+            }
+            if name == ALERT_WINDOW:
+                self._track_alerts(window["alerts"], now)
+                snapshot["alerts"] = window["alerts"]
+            snapshot["windows"][name] = window
+        snapshot["generated_at"] = int(now)
+        self._snapshot = snapshot
+        return snapshot
+
+    def snapshot(self) -> dict[str, Any]:
+        """Latest prebuilt summary; built on the spot only when no refresher is running."""
+        if self._snapshot is None or self._task is None:
+            return self.refresh()
+        return self._snapshot
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                logger.exception("Falha ao atualizar o resumo de métricas")
+            await asyncio.sleep(self.refresh_seconds)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+_aggregator_lock = threading.Lock()
+_metrics_aggregator: MetricsAggregator | None = None
+
+
+def get_metrics_aggregator() -> MetricsAggregator:
+    global _metrics_aggregator
+
+    if _metrics_aggregator is None:
+        with _aggregator_lock:
+            if _metrics_aggregator is None:
+                _metrics_aggregator = MetricsAggregator()
+    return _metrics_aggregator
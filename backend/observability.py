@@ -0,0 +1,129 @@
+"""
+HTTP request metrics with bounded label cardinality.
+
+Requests are labeled by the route template they matched ("/api/brain/jobs/{job_id}"),
+never by the raw URL, so path parameters and scanners probing random URLs do
+not mint new series. Paths no route matched share one bucket, unknown methods
+share another, and a hard cap (HTTP_METRICS_MAX_SERIES) on distinct
+(method, route) pairs guards against anything that still slips through.
+
+With several workers, set PROMETHEUS_MULTIPROC_DIR (an empty directory,
+cleared on every deploy) in the environment before the app starts: each
+worker then writes its samples to mmap'd files there and /metrics merges all
+of them, so the scrape shows the whole fleet whichever worker answers it.
+"""
+
+import contextvars
+import os
+import threading
+
+from fastapi import Request
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+from metrics_summary import get_metrics_aggregator
+
+HTTP_METRICS_MAX_SERIES = int(os.getenv("HTTP_METRICS_MAX_SERIES", "500"))
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+UNMATCHED_ROUTE_LABEL = "__unmatched__"
+OVERFLOW_ROUTE_LABEL = "__overflow__"
+OTHER_METHOD_LABEL = "OTHER"
+KNOWN_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+HTTP_REQUESTS_TOTAL = Counter(
+    "umbra_http_requests_total",
+    "Total HTTP requests",
+    ["method", "path", "status"],
+)
+HTTP_REQUEST_DURATION_SECONDS = Histogram(
+    "umbra_http_request_duration_seconds",
+    "HTTP request duration in seconds",
+    ["method", "path"],
+)
+HTTP_METRICS_OVERFLOW_TOTAL = Counter(
+    "umbra_http_metrics_overflow_total",
+    "Requests recorded under the overflow route label because the series cap was reached",
+)
+
+
+# ASGI scope of the request being served; routing fills in its route later, in place.
+_request_scope: contextvars.ContextVar[dict | None] = contextvars.ContextVar("http_request_scope", default=None)
+BACKGROUND_ENDPOINT_LABEL = "__background__"
+
+
+def _scope_route_label(scope: dict) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path_format", None) or getattr(route, "path", None)
+    return path or UNMATCHED_ROUTE_LABEL
+
+
+def route_label(request: Request) -> str:
+    """Template of the route that handled ``request``, or the unmatched bucket."""
+    return _scope_route_label(request.scope)
+
+
+def bind_request(request: Request) -> contextvars.Token:
+    return _request_scope.set(request.scope)
+
+
+def unbind_request(token: contextvars.Token) -> None:
+    _request_scope.reset(token)
+
+
+def current_endpoint() -> str:
+    """Route template of the request this code runs for, or the background label outside requests."""
+    scope = _request_scope.get()
+    if scope is None:
+        return BACKGROUND_ENDPOINT_LABEL
+    return _scope_route_label(scope)
+
+
+def method_label(method: str) -> str:
+    method = method.upper()
+    return method if method in KNOWN_METHODS else OTHER_METHOD_LABEL
+
+
+class SeriesGuard:
+    """Admits at most ``max_series`` distinct (method, route) pairs; the rest share the overflow label."""
+
+    def __init__(self, max_series: int = HTTP_METRICS_MAX_SERIES):
+        self.max_series = max(max_series, 1)
+        self._lock = threading.Lock()
+        self._seen: set[tuple[str, str]] = set()
+
+    def admit(self, method: str, route: str) -> str:
+        key = (method, route)
+        if key in self._seen:
+            return route
+        with self._lock:
+            if key in self._seen or len(self._seen) < self.max_series:
+                self._seen.add(key)
+                return route
+        HTTP_METRICS_OVERFLOW_TOTAL.inc()
+        return OVERFLOW_ROUTE_LABEL
+
+
+http_series_guard = SeriesGuard()
+
+
+def observe_http_request(request: Request, status_code: int, duration_seconds: float) -> None:
+    method = method_label(request.method)
+    route = http_series_guard.admit(method, route_label(request))
+    HTTP_REQUESTS_TOTAL.labels(method=method, path=route, status=str(status_code)).inc()
+    HTTP_REQUEST_DURATION_SECONDS.labels(method=method, path=route).observe(duration_seconds)
+    get_metrics_aggregator().record_http(method, route, str(status_code), duration_seconds)
+
+
+def metrics_payload() -> bytes:
+    """Prometheus exposition for this worker, or for all workers in multiprocess mode."""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=PROMETHEUS_MULTIPROC_DIR)
+    return generate_latest(registry)
+
+
+def mark_worker_dead() -> None:
+    """Drop this worker's live gauges from the multiprocess view on shutdown."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid(), path=PROMETHEUS_MULTIPROC_DIR)
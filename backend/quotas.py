@@ -0,0 +1,138 @@
+"""
+Per-user rate limiting and daily token budgets.
+
+Both live in a shared store (RATE_LIMIT_STORAGE_URI, any backend supported by
+the ``limits`` library, e.g. redis://host:6379) so every uvicorn worker sees
+the same counters; memory:// keeps them per process for tests and single-worker
+runs. Limits are keyed by the authenticated user, falling back to the client
+IP only for unauthenticated routes.
+
+The token budget charges the tokens each agent run actually used (see
+resilience.py) against TOKEN_BUDGET_PER_DAY, so expensive endpoints are
+throttled by cost rather than by hits. It uses the same synchronous ``limits``
+storage as slowapi, created on first use and only when the budget is enabled;
+its calls run in a worker thread so a storage round trip never blocks the
+event loop.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from fastapi import Depends, HTTPException, Request, status
+from limits import RateLimitItemPerDay
+from limits.strategies import FixedWindowRateLimiter
+from limits.storage import storage_from_string
+from prometheus_client import Counter
+from slowapi.util import get_remote_address
+
+from auth import get_current_user
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+# Tokens per user per UTC day; 0 disables the budget.
+TOKEN_BUDGET_PER_DAY = int(os.getenv("TOKEN_BUDGET_PER_DAY", "0"))
+
+TOKEN_BUDGET_REJECTED_TOTAL = Counter(
+    "umbra_token_budget_rejected_total",
+    "Requests rejected because the user's daily token budget was used up",
+)
+
+
+def rate_limit_key(request: Request) -> str:
+    """slowapi key: the user set by get_current_user, else the client address."""
+    user_id = getattr(request.state, "user_id", None)
+    if user_id:
+        return f"user:{user_id}"
+    return f"ip:{get_remote_address(request)}"
+
+
+class TokenBudget:
+    def __init__(self, storage_uri: str, tokens_per_day: int):
+        self._storage_uri = storage_uri
+        self._item = RateLimitItemPerDay(tokens_per_day) if tokens_per_day > 0 else None
+        self._limiter: FixedWindowRateLimiter | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._item is not None
+
+    def _get_limiter(self) -> FixedWindowRateLimiter:
+        if self._limiter is None:
+            with self._lock:
+                if self._limiter is None:
+                    self._limiter = FixedWindowRateLimiter(storage_from_string(self._storage_uri))
+        return self._limiter
+
+    def _test(self, user_id: str) -> bool:
+        return self._get_limiter().test(self._item, "tokens", user_id)
+
+    def _window_stats(self, user_id: str):
+        return self._get_limiter().get_window_stats(self._item, "tokens", user_id)
+
+    def _hit(self, user_id: str, tokens: int) -> None:
+        self._get_limiter().hit(self._item, "tokens", user_id, cost=tokens)
+
+    async def exhausted(self, user_id: str) -> bool:
+        return self.enabled and not await asyncio.to_thread(self._test, user_id)
+
+    async def remaining(self, user_id: str) -> int | None:
+        if not self.enabled:
+            return None
+        return (await asyncio.to_thread(self._window_stats, user_id)).remaining
+
+    async def seconds_until_reset(self, user_id: str) -> int:
+        if not self.enabled:
+            return 0
+        reset_at = (await asyncio.to_thread(self._window_stats, user_id)).reset_time
+        return max(int(reset_at - time.time()), 0)
+
+    async def charge(self, user_id: str, tokens: int) -> None:
+        if self.enabled and tokens > 0:
+            await asyncio.to_thread(self._hit, user_id, tokens)
+
+
+_budget_lock = threading.Lock()
+_token_budget: TokenBudget | None = None
+
+
+def get_token_budget() -> TokenBudget:
+    global _token_budget
+
+    if _token_budget is None:
+        with _budget_lock:
+            if _token_budget is None:
+                _token_budget = TokenBudget(RATE_LIMIT_STORAGE_URI, TOKEN_BUDGET_PER_DAY)
+    return _token_budget
+
+
+async def charge_tokens(user_id: str, tokens: int) -> None:
+    """Record tokens used by ``user_id``; failures never break the request that used them."""
+    try:
+        await get_token_budget().charge(user_id, tokens)
+    except Exception:
+        logger.exception("Falha ao registrar consumo de tokens user_id=%s", user_id)
+
+
+async def require_token_budget(user_id: str = Depends(get_current_user)) -> str:
+    """Authenticated user whose daily token budget is not used up yet (429 otherwise)."""
+    try:
+        budget = get_token_budget()
+        if not await budget.exhausted(user_id):
+            return user_id
+        retry_after = await budget.seconds_until_reset(user_id)
+    except Exception:
+        # The shared store being down should not take the product down with it.
+        logger.exception("Falha ao consultar orçamento de tokens")
+        return user_id
+
+    TOKEN_BUDGET_REJECTED_TOTAL.inc()
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Limite diário de uso de IA atingido. Tente novamente amanhã.",
+        headers={"Retry-After": str(retry_after)},
+    )
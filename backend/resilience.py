@@ -0,0 +1,426 @@
+"""
+Resilience layer for agent calls: bounded admission, timeouts, retries, metrics.
+
+Agent calls run on the event loop and hold no thread while waiting on the
+model. AsyncAdmission caps the number of top-level calls in flight: once
+AGENT_MAX_INFLIGHT_ASYNC is reached, new calls are rejected immediately with
+ExecutorSaturatedError instead of queueing forever.
+
+Every agent call, including specialist calls nested inside the router's
+tools, goes through arun/astream_agent_with_resilience. A nested call
+inherits the caller's deadline through a context variable: it gets whatever
+is left of the parent's budget (minus AI_HOP_RESERVE_SECONDS for the parent
+to use the answer), never a fresh AI_TIMEOUT_SECONDS, and its metrics carry
+the calling agent as ``parent_agent``.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import AsyncIterator, Awaitable, Callable
+
+from agno.run.agent import RunEvent, RunOutput
+from prometheus_client import Counter, Gauge, Histogram
+
+from metrics_summary import get_metrics_aggregator
+from quotas import charge_tokens
+from tracing import span, start_span, use_span
+from usage import bill_to, billed_user, record_run_usage
+
+logger = logging.getLogger(__name__)
+
+AGENT_MAX_INFLIGHT_ASYNC = int(os.getenv("AGENT_MAX_INFLIGHT_ASYNC", "256"))
+AI_TIMEOUT_SECONDS = int(os.getenv("AI_TIMEOUT_SECONDS", "45"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+AI_RETRY_BASE_DELAY_SECONDS = float(os.getenv("AI_RETRY_BASE_DELAY_SECONDS", "0.8"))
+AI_HOP_RESERVE_SECONDS = float(os.getenv("AI_HOP_RESERVE_SECONDS", "5"))
+
+AGENT_CALLS_TOTAL = Counter(
+    "umbra_agent_calls_total",
+    "Total calls to AI agents",
+    ["agent", "status", "parent_agent"],
+)
+AGENT_CALL_DURATION_SECONDS = Histogram(
+    "umbra_agent_call_duration_seconds",
+    "Agent call duration in seconds",
+    ["agent", "parent_agent"],
+)
+AGENT_COALESCED_REQUESTS_TOTAL = Counter(
+    "umbra_agent_coalesced_requests_total",
+    "Agent calls that awaited an identical in-flight call instead of running their own",
+    ["agent"],
+)
+
+AGENT_INFLIGHT_ASYNC_CALLS = Gauge(
+    "umbra_agent_inflight_async_calls",
+    "Async agent calls currently awaiting the model",
+    multiprocess_mode="livesum",
+)
+AGENT_EXECUTOR_REJECTED_TOTAL = Counter(
+    "umbra_agent_executor_rejected_total",
+    "Agent calls rejected because the in-flight cap was reached",
+)
+AGENT_ABANDONED_CALLS_TOTAL = Counter(
+    "umbra_agent_abandoned_calls_total",
+    "Admitted agent calls that released their slot without finishing",
+    ["reason"],
+)
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when no agent call slot is free."""
+
+
+class AsyncAdmission:
+    """Caps concurrent async agent calls on the event loop (no threads involved).
+
+    Calls never wait for a slot, so there is no queue time to measure; what is
+    tracked instead is how many admitted calls were abandoned, either because
+    they ran out of time or because the caller went away (cancelled task or
+    closed stream).
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.inflight = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.inflight >= self.limit:
+            AGENT_EXECUTOR_REJECTED_TOTAL.inc()
+            raise ExecutorSaturatedError("Async agent capacity reached")
+
+        self.inflight += 1
+        AGENT_INFLIGHT_ASYNC_CALLS.inc()
+        try:
+            yield
+        except TimeoutError:
+            AGENT_ABANDONED_CALLS_TOTAL.labels(reason="timeout").inc()
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            AGENT_ABANDONED_CALLS_TOTAL.labels(reason="cancelled").inc()
+            raise
+        finally:
+            self.inflight -= 1
+            AGENT_INFLIGHT_ASYNC_CALLS.dec()
+
+
+async_admission = AsyncAdmission(limit=AGENT_MAX_INFLIGHT_ASYNC)
+
+
+# ---------------------------------------------------------------------------
+# Agent call resilience (timeouts, retries, metrics, nested-call budget)
+# ---------------------------------------------------------------------------
+_call_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("agent_call_deadline", default=None)
+_current_agent: contextvars.ContextVar[str] = contextvars.ContextVar("agent_call_name", default="")
+_current_request_id: contextvars.ContextVar[str] = contextvars.ContextVar("agent_call_request_id", default="")
+
+
+def is_retryable_error(exc: Exception) -> bool:
+    message = str(exc).lower()
+    retryable_markers = [
+        "timeout",
+        "timed out",
+        "rate limit",
+        "too many requests",
+        "temporarily",
+        "connection",
+        "unavailable",
+        "overloaded",
+        "429",
+        "502",
+        "503",
+        "504",
+    ]
+    return any(marker in message for marker in retryable_markers)
+
+
+def current_request_id() -> str:
+    return _current_request_id.get()
+
+
+def hop_timeout() -> float:
+    """Time a call may take from here: AI_TIMEOUT_SECONDS at the top level,
+    otherwise what is left of the calling agent's deadline minus AI_HOP_RESERVE_SECONDS.
+    """
+    parent_deadline = _call_deadline.get()
+    if parent_deadline is None:
+        return AI_TIMEOUT_SECONDS
+    return min(AI_TIMEOUT_SECONDS, parent_deadline - time.monotonic() - AI_HOP_RESERVE_SECONDS)
+
+
+@contextmanager
+def _agent_scope(agent_name: str, request_id: str, deadline: float):
+    tokens = (
+        _call_deadline.set(deadline),
+        _current_agent.set(agent_name),
+        _current_request_id.set(request_id),
+    )
+    try:
+        yield
+    finally:
+        _current_request_id.reset(tokens[2])
+        _current_agent.reset(tokens[1])
+        _call_deadline.reset(tokens[0])
+
+
+def _observe(agent_name: str, parent_agent: str, status: str, started_at: float) -> None:
+    duration = time.perf_counter() - started_at
+    AGENT_CALLS_TOTAL.labels(agent=agent_name, status=status, parent_agent=parent_agent).inc()
+    AGENT_CALL_DURATION_SECONDS.labels(agent=agent_name, parent_agent=parent_agent).observe(duration)
+    get_metrics_aggregator().record_agent(agent_name, status, duration)
+
+
+async def _account_usage(agent_name: str, run_output: object, started_at: float) -> None:
+    """Export the run's token usage and charge it to the billed user's daily budget."""
+    try:
+        tokens = record_run_usage(agent_name, run_output, time.perf_counter() - started_at)
+    except Exception:
+        logger.exception("Falha ao registrar uso de tokens do agente %s", agent_name)
+        return
+    user_id = billed_user()
+    if user_id and tokens > 0:
+        await charge_tokens(user_id, tokens)
+
+
+def _attempt_timeout(agent_name: str) -> float:
+    timeout = hop_timeout()
+    if timeout <= 0:
+        raise TimeoutError(f"No time budget left for {agent_name}")
+    return timeout
+
+
+class SingleFlight:
+    """Coalesces identical concurrent async calls onto one in-flight task.
+
+    The shared call runs as its own task, so a caller that goes away (client
+    disconnect) does not cancel it for the others still waiting.
+    """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def do(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[object]],
+        on_join: Callable[[], None] | None = None,
+    ) -> object:
+        """Run ``func`` for ``key``, or await the call already in flight for it (calling ``on_join``)."""
+        task = self._inflight.get(key)
+        if task is not None and not task.done():
+            if on_join is not None:
+                on_join()
+        else:
+            task = asyncio.create_task(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+agent_singleflight = SingleFlight()
+
+
+def singleflight_key(user_id: str, agent_name: str, prompt: str) -> str:
+    return hashlib.sha256(f"{user_id}\0{agent_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+async def arun_agent_with_resilience(
+    agent_name: str,
+    prompt: str,
+    request_id: str,
+    run_agent: Callable[[str], Awaitable[object]],
+    user_id: str | None = None,
+):
+    """Agent call with timeout, retries and metrics; no thread is held while waiting on the model.
+
+    With ``user_id``, a call identical to one already in flight for the same
+    user and agent awaits that call's result instead of issuing its own.
+    """
+    if user_id is None or _current_agent.get():
+        return await _arun_agent_with_retries(agent_name, prompt, request_id, run_agent)
+
+    def on_join():
+        AGENT_COALESCED_REQUESTS_TOTAL.labels(agent=agent_name).inc()
+        logger.info("agent_call_coalesced request_id=%s agent=%s", request_id, agent_name)
+
+    # The shared task copies this context, so the user is charged once, by the call that ran.
+    with bill_to(user_id):
+        return await agent_singleflight.do(
+            singleflight_key(user_id, agent_name, prompt),
+            lambda: _arun_agent_with_retries(agent_name, prompt, request_id, run_agent),
+            on_join=on_join,
+        )
+
+
+async def _arun_agent_with_retries(
+    agent_name: str,
+    prompt: str,
+    request_id: str,
+    run_agent: Callable[[str], Awaitable[object]],
+):
+    parent_agent = _current_agent.get()
+    attempts = AI_MAX_RETRIES + 1
+    # Nested calls run inside an already admitted request and must not take a second slot.
+    async with (nullcontext() if parent_agent else async_admission.slot()):
+        for attempt in range(1, attempts + 1):
+            started_at = time.perf_counter()
+            try:
+                timeout = _attempt_timeout(agent_name)
+                with (
+                    span("agent.run", agent=agent_name, parent_agent=parent_agent, attempt=attempt),
+                    _agent_scope(agent_name, request_id, time.monotonic() + timeout),
+                ):
+                    try:
+                        response = await asyncio.wait_for(run_agent(prompt), timeout=timeout)
+                    except asyncio.TimeoutError as exc:
+                        raise TimeoutError(f"Agent timeout after {timeout:g}s") from exc
+                _observe(agent_name, parent_agent, "success", started_at)
+                await _account_usage(agent_name, response, started_at)
+                return response
+            except Exception as exc:
+                _observe(agent_name, parent_agent, "error", started_at)
+
+                should_retry = attempt < attempts and is_retryable_error(exc)
+                logger.warning(
+                    "agent_call_failed request_id=%s agent=%s parent_agent=%s attempt=%s/%s retry=%s error=%s",
+                    request_id,
+                    agent_name,
+                    parent_agent,
+                    attempt,
+                    attempts,
+                    should_retry,
+                    exc,
+                )
+                if not should_retry:
+                    raise
+
+                backoff_seconds = AI_RETRY_BASE_DELAY_SECONDS * (2 ** (attempt - 1))
+                await asyncio.sleep(backoff_seconds)
+
+    raise RuntimeError(f"{agent_name} failed after retries")
+
+
+def is_run_result(event: object) -> bool:
+    """True for the item of a streamed run that carries its metrics: the final RunOutput
+    (``yield_run_output=True``) or the RunCompleted event (``stream_events=True``).
+    """
+    return isinstance(event, RunOutput) or getattr(event, "event", None) == RunEvent.run_completed.value
+
+
+def stream_chunk_text(event: object) -> str | None:
+    """Return the text delta carried by a streamed run event, if any."""
+    if isinstance(event, RunOutput):
+        return None
+    if getattr(event, "event", RunEvent.run_content.value) != RunEvent.run_content.value:
+        return None
+    content = getattr(event, "content", None)
+    return content if isinstance(content, str) and content else None
+
+
+async def astream_agent_with_resilience(
+    agent_name: str,
+    prompt: str,
+    request_id: str,
+    stream_agent: Callable[[str], AsyncIterator[object]],
+    user_id: str | None = None,
+) -> AsyncIterator[str]:
+    """Yield text deltas from a streamed agent run.
+
+    Each attempt gets the hop timeout in total. Retries only happen while
+    nothing was sent yet; once the first delta is out, failures end the stream.
+    ``stream_agent`` must start the run with ``yield_run_output=True``: plain
+    ``stream=True`` runs yield content only, and the token usage of the final
+    RunOutput is what gets recorded and charged to ``user_id``.
+    """
+    parent_agent = _current_agent.get()
+    user_id = user_id or billed_user()
+    attempts = AI_MAX_RETRIES + 1
+    async with (nullcontext() if parent_agent else async_admission.slot()):
+        for attempt in range(1, attempts + 1):
+            started_at = time.perf_counter()
+            emitted = False
+            accounted = False
+            events = None
+            stream_span = start_span("agent.stream", agent=agent_name, parent_agent=parent_agent, attempt=attempt)
+            try:
+                timeout = _attempt_timeout(agent_name)
+                deadline = time.monotonic() + timeout
+                events = stream_agent(prompt)
+                while True:
+                    remaining = max(deadline - time.monotonic(), 0)
+                    # Scope only the awaits: this generator yields to the caller's context in between.
+                    with _agent_scope(agent_name, request_id, deadline), bill_to(user_id), use_span(stream_span):
+                        try:
+                            event = await asyncio.wait_for(events.__anext__(), timeout=remaining)
+                        except StopAsyncIteration:
+                            break
+                        except asyncio.TimeoutError as exc:
+                            raise TimeoutError(f"Agent timeout after {timeout:g}s") from exc
+
+                    if is_run_result(event):
+                        if not accounted:
+                            accounted = True
+                            with bill_to(user_id):
+                                await _account_usage(agent_name, event, started_at)
+                        continue
+
+                    chunk = stream_chunk_text(event)
+                    if chunk:
+                        if not emitted:
+                            first_chunk_ms = (time.perf_counter() - started_at) * 1000
+                            stream_span.set_attribute("first_chunk_ms", round(first_chunk_ms, 3))
+                        emitted = True
+                        yield chunk
+
+                if not accounted:
+                    logger.warning(
+                        "agent_stream_usage_missing request_id=%s agent=%s: run ended without its RunOutput",
+                        request_id,
+                        agent_name,
+                    )
+                _observe(agent_name, parent_agent, "success", started_at)
+                stream_span.end()
+                return
+            except (GeneratorExit, asyncio.CancelledError):
+                # The client went away: the consumer closed the stream or its task was cancelled.
+                _observe(agent_name, parent_agent, "disconnected", started_at)
+                raise
+            except Exception as exc:
+                _observe(agent_name, parent_agent, "error", started_at)
+                stream_span.end(exc)
+
+                should_retry = not emitted and attempt < attempts and is_retryable_error(exc)
+                logger.warning(
+                    "agent_stream_failed request_id=%s agent=%s parent_agent=%s attempt=%s/%s emitted=%s retry=%s error=%s",
+                    request_id,
+                    agent_name,
+                    parent_agent,
+                    attempt,
+                    attempts,
+                    emitted,
+                    should_retry,
+                    exc,
+                )
+                if not should_retry:
+                    raise
+
+                backoff_seconds = AI_RETRY_BASE_DELAY_SECONDS * (2 ** (attempt - 1))
+                await asyncio.sleep(backoff_seconds)
+            finally:
+                # Also ends the span when the client went away mid-stream.
+                stream_span.end()
+                aclose = getattr(events, "aclose", None)
+                if aclose is not None:
+                    await aclose()
@@ -0,0 +1,242 @@
+"""
+Per-user cache of generated responses for the structured generation endpoints.
+
+Entries are keyed by user, agent, the agent template version (model, prompt
+library instructions, tools) and a hash of the normalized request model, so
+resubmitting the same form returns the previous answer without an LLM call,
+and any prompt change invalidates old answers automatically.
+
+An optional similarity tier (RESPONSE_CACHE_SIMILARITY_THRESHOLD > 0) embeds
+the normalized request and also serves near-identical inputs from the same
+user, agent and version. Vectors are indexed by that scope and stored
+unit-normalized, so a lookup only takes dot products against the scope's own
+entries, in a worker thread. Request embeddings are cached in their own file
+(RESPONSE_CACHE_EMBEDDING_PATH), apart from the knowledge-base chunks.
+Eviction is TTL + LRU over all users.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import operator
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from agno.knowledge.embedder.openai import OpenAIEmbedder
+from prometheus_client import Counter
+from pydantic import BaseModel
+
+from knowledge_base.embedding_cache import embed_with_cache
+from metrics_summary import get_metrics_aggregator
+from usage import bill_to
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+# Cosine similarity needed for a near-match; 0 disables the similarity tier.
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD", "0"))
+RESPONSE_CACHE_EMBEDDING_PATH = os.getenv("RESPONSE_CACHE_EMBEDDING_PATH", ".cache/request_embeddings.sqlite3")
+
+RESPONSE_CACHE_LOOKUPS_TOTAL = Counter(
+    "umbra_response_cache_lookups_total",
+    "Generation response cache lookups by agent and result (exact_hit, similar_hit, miss, bypass)",
+    ["agent", "result"],
+)
+
+Embed = Callable[[str], Awaitable[list[float] | None]]
+
+
+def normalize_request(body: BaseModel) -> str:
+    """Canonical text for a request model: collapsed whitespace, case-folded, stable field order."""
+    fields = {
+        name: " ".join(value.split()).casefold() if isinstance(value, str) else value
+        for name, value in body.model_dump().items()
+    }
+    return json.dumps(fields, sort_keys=True, ensure_ascii=False)
+
+
+def no_cache_requested(cache_control: str | None) -> bool:
+    directives = {part.strip().lower() for part in (cache_control or "").split(",")}
+    return "no-cache" in directives or "no-store" in directives
+
+
+def _count_lookup(agent_name: str, result: str) -> None:
+    RESPONSE_CACHE_LOOKUPS_TOTAL.labels(agent=agent_name, result=result).inc()
+    get_metrics_aggregator().record_cache_lookup(agent_name, result)
+
+
+def _unit(vector: list[float]) -> list[float] | None:
+    norm = math.sqrt(sum(map(operator.mul, vector, vector)))
+    return [value / norm for value in vector] if norm else None
+
+
+def _dot(a: list[float], b: list[float]) -> float:
+    return sum(map(operator.mul, a, b))
+
+
+@dataclass
+class _Entry:
+    expires_at: float
+    scope: tuple[str, str, str]
+    response: Any
+    vector: list[float] | None = None
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        similarity_threshold: float = RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+        embed: Embed | None = None,
+    ):
+        self.max_entries = max(max_entries, 1)
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._embed = embed
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        # scope -> keys of its entries that carry a vector
+        self._by_scope: dict[tuple[str, str, str], set[str]] = {}
+
+    @property
+    def similarity_enabled(self) -> bool:
+        return self.similarity_threshold > 0 and self._embed is not None
+
+    @staticmethod
+    def _key(scope: tuple[str, str, str], normalized: str) -> str:
+        return hashlib.sha256(json.dumps([*scope, normalized]).encode("utf-8")).hexdigest()
+
+    def _get_exact(self, key: str) -> _Entry | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        keys = self._by_scope.get(entry.scope)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_scope[entry.scope]
+
+    def _get_similar(self, scope: tuple[str, str, str], vector: list[float]) -> _Entry | None:
+        """Closest unexpired entry of ``scope`` to the unit vector ``vector``, if similar enough."""
+        now = time.monotonic()
+        best: tuple[float, str] | None = None
+        with self._lock:
+            for key in list(self._by_scope.get(scope, ())):
+                entry = self._entries[key]
+                if entry.expires_at <= now:
+                    self._drop(key)
+                    continue
+                score = _dot(vector, entry.vector)
+                if score >= self.similarity_threshold and (best is None or score > best[0]):
+                    best = (score, key)
+            if best is None:
+                return None
+            self._entries.move_to_end(best[1])
+            return self._entries[best[1]]
+
+    def _put(self, key: str, entry: _Entry) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            if entry.vector is not None:
+                self._by_scope.setdefault(entry.scope, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    async def _vector(self, normalized: str) -> list[float] | None:
+        try:
+            vector = await self._embed(normalized)
+        except Exception:
+            logger.exception("Falha ao gerar embedding para o cache de respostas")
+            return None
+        return _unit(vector) if vector else None
+
+    async def get_or_generate(
+        self,
+        user_id: str,
+        agent_name: str,
+        version: str,
+        body: BaseModel,
+        generate: Callable[[], Awaitable[Any]],
+        bypass: bool = False,
+    ) -> tuple[Any, str]:
+        """Return ``(response, result)`` where result is exact_hit, similar_hit, miss or bypass.
+
+        ``bypass`` skips the lookup but still stores the fresh response.
+        """
+        scope = (user_id, agent_name, version)
+        normalized = normalize_request(body)
+        key = self._key(scope, normalized)
+        vector = None
+
+        if not bypass:
+            entry = self._get_exact(key)
+            if entry is not None:
+                _count_lookup(agent_name, "exact_hit")
+                return entry.response, "exact_hit"
+            if self.similarity_enabled:
+                with bill_to(user_id):
+                    vector = await self._vector(normalized)
+                entry = await asyncio.to_thread(self._get_similar, scope, vector) if vector else None
+                if entry is not None:
+                    _count_lookup(agent_name, "similar_hit")
+                    return entry.response, "similar_hit"
+
+        result = "bypass" if bypass else "miss"
+        _count_lookup(agent_name, result)
+        response = await generate()
+
+        if self.similarity_enabled and vector is None:
+            with bill_to(user_id):
+                vector = await self._vector(normalized)
+        self._put(key, _Entry(time.monotonic() + self.ttl_seconds, scope, response, vector))
+        return response, result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_scope.clear()
+
+
+class _RequestEmbedder:
+    """Embeds normalized requests with the knowledge-base embedding model, cached in RESPONSE_CACHE_EMBEDDING_PATH."""
+
+    def __init__(self):
+        self.embedder = OpenAIEmbedder(id="text-embedding-3-small")
+
+    async def __call__(self, text: str) -> list[float] | None:
+        embeddings, _ = await embed_with_cache(self.embedder, [text], cache_path=RESPONSE_CACHE_EMBEDDING_PATH)
+        return embeddings[0]
+
+
+_cache_lock = threading.Lock()
+_response_cache: ResponseCache | None = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+
+    if _response_cache is None:
+        with _cache_lock:
+            if _response_cache is None:
+                embed = _RequestEmbedder() if RESPONSE_CACHE_SIMILARITY_THRESHOLD > 0 else None
+                _response_cache = ResponseCache(embed=embed)
+    return _response_cache
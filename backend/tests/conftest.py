@@ -1,7 +1,12 @@
 import time
+from dataclasses import dataclass
 
 import jwt
 import pytest
+from agno.agent import Agent
+from agno.metrics import MessageMetrics
+from agno.models.base import Model
+from agno.models.response import ModelResponse
 from fastapi.testclient import TestClient
 
 import auth
@@ -23,6 +28,149 @@ class DummyAgent:
     def run(self, _message: str):
         return DummyResponse(self._content)
 
+    def arun(self, _message: str, stream: bool = False, **_options):
+        if stream:
+            return self._stream()
+        return self._respond()
+
+    async def _respond(self):
+        return DummyResponse(self._content)
+
+    async def _stream(self):
+        for word in self._content.split(" "):
+            yield DummyResponse(word)
+
+
+@dataclass
+class ScriptedModel(Model):
+    """Offline agno model: streams ``chunks`` and reports ``usage`` on the last delta, like OpenAI does."""
+
+    id: str = "gpt-4o-mini"
+    name: str = "ScriptedModel"
+    provider: str = "OpenAI"
+    chunks: tuple[str, ...] = ("ok",)
+    usage: tuple[int, int] = (0, 0)
+
+    def _metrics(self) -> MessageMetrics:
+        prompt_tokens, completion_tokens = self.usage
+        return MessageMetrics(
+            input_tokens=prompt_tokens,
+            output_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        )
+
+    def _deltas(self):
+        for index, chunk in enumerate(self.chunks):
+            last = index == len(self.chunks) - 1
+            yield ModelResponse(role="assistant", content=chunk, response_usage=self._metrics() if last else None)
+
+    def invoke(self, *_args, **_kwargs) -> ModelResponse:
+        return ModelResponse(role="assistant", content="".join(self.chunks), response_usage=self._metrics())
+
+    async def ainvoke(self, *_args, **_kwargs) -> ModelResponse:
+        return self.invoke()
+
+    def invoke_stream(self, *_args, **_kwargs):
+        yield from self._deltas()
+
+    async def ainvoke_stream(self, *_args, **_kwargs):
+        for delta in self._deltas():
+            yield delta
+
+    def _parse_provider_response(self, response, **_kwargs) -> ModelResponse:
+        return response
+
+    def _parse_provider_response_delta(self, response) -> ModelResponse:
+        return response
+
+
+def build_scripted_agent(chunks: tuple[str, ...], usage: tuple[int, int]) -> Agent:
+    """A real agno Agent over ScriptedModel, so streamed runs emit agno's own event objects."""
+    return Agent(model=ScriptedModel(chunks=chunks, usage=usage), telemetry=False)
+
+
+@pytest.fixture(autouse=True)
+def isolated_embedding_cache(monkeypatch, tmp_path):
+    from knowledge_base import embedding_cache
+
+    monkeypatch.setattr(embedding_cache, "KB_EMBEDDING_CACHE_PATH", str(tmp_path / "embeddings.sqlite3"))
+
+
+@pytest.fixture(autouse=True)
+def isolated_search_cache(monkeypatch):
+    from agents import search_cache
+
+    cache = search_cache.SearchCache(path="")
+    monkeypatch.setattr(search_cache, "_search_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_response_cache(monkeypatch):
+    import response_cache
+
+    cache = response_cache.ResponseCache(similarity_threshold=0)
+    monkeypatch.setattr(response_cache, "_response_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_token_cache(monkeypatch):
+    cache = auth.VerifiedTokenCache()
+    monkeypatch.setattr(auth, "_token_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_metrics_aggregator(monkeypatch):
+    import metrics_summary
+
+    aggregator = metrics_summary.MetricsAggregator(shared_dir="")
+    monkeypatch.setattr(metrics_summary, "_metrics_aggregator", aggregator)
+    return aggregator
+
+
+@pytest.fixture(autouse=True)
+def isolated_tracer(monkeypatch):
+    import tracing
+
+    tracer = tracing.Tracer(sample_rate=0)
+    monkeypatch.setattr(tracing, "_tracer", tracer)
+    return tracer
+
+
+@pytest.fixture(autouse=True)
+def isolated_token_budget(monkeypatch):
+    import quotas
+
+    budget = quotas.TokenBudget("memory://", 0)
+    monkeypatch.setattr(quotas, "_token_budget", budget)
+    return budget
+
+
+@pytest.fixture(autouse=True)
+def thread_extraction_pool(monkeypatch):
+    from knowledge_base import extraction
+
+    monkeypatch.setattr(extraction, "KB_PARSE_PROCESSES", 0)
+    monkeypatch.setattr(extraction, "_extraction_pool", None)
+    yield
+    extraction.shutdown_extraction_pool()
+
+
+@pytest.fixture(autouse=True)
+def isolated_ingestion_queue(monkeypatch, tmp_path):
+    from knowledge_base import jobs
+
+    queue = jobs.IngestionQueue(
+        jobs.JobStore(str(tmp_path / "jobs.sqlite3")),
+        spool_dir=str(tmp_path / "uploads"),
+        retry_delay_seconds=0,
+    )
+    monkeypatch.setattr(jobs, "_ingestion_queue", queue)
+    yield queue
+    queue.store.close()
+
 
 @pytest.fixture
 def auth_secret(monkeypatch):
@@ -59,4 +207,5 @@ def admin_auth_headers(auth_secret):
 
 @pytest.fixture
 def client(auth_secret):
+    app.state.limiter.reset()
     return TestClient(app)
@@ -1,3 +1,10 @@
+import time
+
+import pytest
+
+import metrics_summary
+
+
 def test_admin_metrics_requires_super_admin(client, auth_headers):
     response = client.get("/api/admin/metrics-summary", headers=auth_headers)
     assert response.status_code == 403
@@ -17,3 +24,98 @@ def test_admin_metrics_allows_super_admin(client, admin_auth_headers):
     assert "alert_thresholds" in payload
     assert "alerts" in payload
     assert isinstance(payload["alerts"], list)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_800_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _window_paths(snapshot: dict, window: str) -> set:
+    return {item["path"] for item in snapshot["windows"][window]["http_requests_total"]}
+
+
+def test_summary_reports_rolling_windows_and_since_start_totals():
+    clock = FakeClock()
+    aggregator = metrics_summary.MetricsAggregator(clock=clock)
+    aggregator.record_http("GET", "/old", "200", 0.01)
+    clock.now += 2 * 3600
+    aggregator.record_http("GET", "/recent", "200", 0.01)
+    clock.now += 10 * 60
+    aggregator.record_http("GET", "/now", "200", 0.01)
+
+    snapshot = aggregator.refresh()
+
+    assert _window_paths(snapshot, "5m") == {"/now"}
+    assert _window_paths(snapshot, "1h") == {"/now", "/recent"}
+    assert _window_paths(snapshot, "24h") == {"/now", "/recent", "/old"}
+    assert {item["path"] for item in snapshot["http_requests_total"]} == {"/now", "/recent", "/old"}
+
+
+def test_alerts_use_recent_window_and_keep_their_start_time():
+    clock = FakeClock()
+    aggregator = metrics_summary.MetricsAggregator(clock=clock)
+    for _ in range(5):
+        aggregator.record_agent("email", "error", 0.5)
+    started = int(clock.now)
+
+    clock.now += 60
+    aggregator.record_agent("email", "error", 0.5)
+    alerts = aggregator.refresh()["alerts"]
+    assert alerts[0]["category"] == "agent_error_rate"
+    assert alerts[0]["since"] == int(clock.now)
+
+    clock.now += 60
+    assert aggregator.refresh()["alerts"][0]["since"] == started + 60
+
+    clock.now += 10 * 60
+    assert aggregator.refresh()["alerts"] == []
+
+
+def test_endpoint_serves_prebuilt_snapshot_when_refresher_runs(client, admin_auth_headers, isolated_metrics_aggregator, monkeypatch):
+    prebuilt = isolated_metrics_aggregator.refresh()
+    monkeypatch.setattr(isolated_metrics_aggregator, "_task", object())
+    monkeypatch.setattr(isolated_metrics_aggregator, "refresh", lambda: pytest.fail("rebuilt on the request path"))
+
+    response = client.get("/api/admin/metrics-summary", headers=admin_auth_headers)
+
+    assert response.status_code == 200
+    assert response.json()["generated_at"] == prebuilt["generated_at"]
+    assert set(response.json()["windows"]) == {"5m", "1h", "24h"}
+
+
+def test_recording_does_not_wait_for_a_concurrent_refresh():
+    import threading
+
+    aggregator = metrics_summary.MetricsAggregator(shared_dir="")
+    for index in range(3000):
+        aggregator.record_http("GET", f"/path-{index}", "200", 0.01)
+    aggregator.refresh()
+    stop = threading.Event()
+    refreshes = []
+
+    def refresh_loop():
+        while not stop.is_set():
+            refreshes.append(aggregator.refresh())
+
+    refresher = threading.Thread(target=refresh_loop)
+    refresher.start()
+    worst = 0.0
+    try:
+        for _ in range(200):
+            started = time.perf_counter()
+            aggregator.record_http("GET", "/live", "200", 0.01)
+            worst = max(worst, time.perf_counter() - started)
+            time.sleep(0.001)
+    finally:
+        stop.set()
+        refresher.join()
+
+    assert refreshes
+    # A window merge over 3000 series takes far longer than this; recording must not wait for it.
+    assert worst < 0.01
+    live = [item for item in aggregator.refresh()["http_requests_total"] if item["path"] == "/live"]
+    assert live[0]["count"] == 200
@@ -0,0 +1,79 @@
+import anyio
+import pytest
+from agno.agent import Agent
+from agno.tools.function import Function, FunctionCall
+
+import agent as router_agent
+from agents import registry
+from agents.research_tools import search_web
+from tests.conftest import ScriptedModel
+
+
+@pytest.fixture
+def isolated_registry(monkeypatch):
+    """Templates registered by a test disappear with it; the real ones are untouched."""
+    monkeypatch.setattr(registry, "_builders", dict(registry._builders))
+    monkeypatch.setattr(registry, "_templates", {})
+
+
+def _build_fake_agent() -> Agent:
+    return Agent(model=ScriptedModel(), tools=[search_web], telemetry=False)
+
+
+def test_bind_agent_builds_template_once_and_copies(isolated_registry):
+    builds = {"count": 0}
+
+    def build():
+        builds["count"] += 1
+        return _build_fake_agent()
+
+    registry.register_agent("fake", build)
+
+    first = registry.bind_agent("fake", user_id="user-a")
+    second = registry.bind_agent("fake", user_id="user-b")
+
+    assert builds["count"] == 1
+    assert first is not second
+    assert first.user_id == "user-a"
+    assert second.user_id == "user-b"
+    assert first.model is second.model
+    assert first.tools is not second.tools
+    assert registry.get_template("fake").user_id is None
+
+
+def test_template_is_rebuilt_when_cache_key_changes(isolated_registry):
+    state = {"key": "2026-01-01", "builds": 0}
+
+    def build():
+        state["builds"] += 1
+        return _build_fake_agent()
+
+    registry.register_agent("fake_dated", build, cache_key=lambda: state["key"])
+
+    registry.bind_agent("fake_dated")
+    registry.bind_agent("fake_dated")
+    state["key"] = "2026-01-02"
+    registry.bind_agent("fake_dated")
+
+    assert state["builds"] == 2
+
+
+def test_router_comes_from_the_registry_and_its_tools_use_the_bound_user(monkeypatch):
+    seen = []
+
+    async def fake_dispatch(tasks, user_id):
+        seen.append(user_id)
+        return []
+
+    monkeypatch.setattr(router_agent, "dispatch_specialist_tasks", fake_dispatch)
+
+    first = router_agent.get_agent(user_id="user-a")
+    second = router_agent.get_agent(user_id="user-b")
+    dispatch = Function.from_callable(router_agent.dispatch_specialists)
+    dispatch._agent = second
+    result = anyio.run(FunctionCall(function=dispatch, arguments={"tasks": []}).aexecute)
+
+    assert first.model is second.model is registry.get_template("router").model
+    assert "agent" not in dispatch.parameters["properties"]
+    assert result.result == "[]"
+    assert seen == ["user-b"]
@@ -0,0 +1,78 @@
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+import auth
+from tests.conftest import build_auth_headers
+
+
+@pytest.fixture
+def counted_decode(monkeypatch):
+    calls = []
+    real_decode = jwt.decode
+
+    def decode(*args, **kwargs):
+        calls.append(args[0])
+        return real_decode(*args, **kwargs)
+
+    monkeypatch.setattr(auth.jwt, "decode", decode)
+    return calls
+
+
+def _token(headers: dict) -> str:
+    return headers["Authorization"].removeprefix("Bearer ")
+
+
+def test_repeated_token_is_verified_once(auth_secret, counted_decode):
+    token = _token(build_auth_headers(auth_secret=auth_secret, user_id="user-a"))
+
+    first = auth._decode_token(token)
+    second = auth._decode_token(token)
+
+    assert first["sub"] == second["sub"] == "user-a"
+    assert len(counted_decode) == 1
+
+
+def test_cached_token_still_expires_at_its_exp(auth_secret, counted_decode):
+    exp = int(time.time()) + 1
+    token = jwt.encode({"sub": "user-a", "aud": "authenticated", "exp": exp}, auth_secret, algorithm="HS256")
+    auth._decode_token(token)
+
+    time.sleep(max(exp - time.time(), 0) + 0.1)
+
+    with pytest.raises(HTTPException) as exc:
+        auth._decode_token(token)
+    assert exc.value.status_code == 401
+    assert exc.value.detail == "Token expired"
+    assert len(counted_decode) == 2
+
+
+def test_secret_rotation_invalidates_cached_payloads(auth_secret, monkeypatch):
+    token = _token(build_auth_headers(auth_secret=auth_secret, user_id="user-a"))
+    auth._decode_token(token)
+
+    monkeypatch.setattr(auth, "SUPABASE_JWT_SECRET", "rotated-supabase-jwt-secret-32-bytes")
+
+    with pytest.raises(HTTPException) as exc:
+        auth._decode_token(token)
+    assert exc.value.detail == "Invalid token"
+
+
+def test_cache_is_bounded():
+    cache = auth.VerifiedTokenCache(max_entries=2, ttl_seconds=60)
+    for index in range(3):
+        cache.set(f"token-{index}", "secret", {"sub": str(index)})
+
+    assert cache.get("token-0", "secret") is None
+    assert cache.get("token-2", "secret") == {"sub": "2"}
+
+
+def test_admin_request_verifies_token_once(client, admin_auth_headers, counted_decode, monkeypatch):
+    monkeypatch.setattr(auth, "_token_cache", auth.VerifiedTokenCache(ttl_seconds=0))
+
+    response = client.get("/api/admin/metrics-summary", headers=admin_auth_headers)
+
+    assert response.status_code == 200
+    assert len(counted_decode) == 1
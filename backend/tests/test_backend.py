@@ -1,3 +1,5 @@
+import resilience
+
 from tests.conftest import DummyAgent
 
 
@@ -20,3 +22,20 @@ def test_chat_endpoint_with_auth(client, auth_headers, monkeypatch):
     response = client.post("/api/chat", json={"message": "ping"}, headers=auth_headers)
     assert response.status_code == 200
     assert response.json() == {"response": "pong"}
+
+
+def test_hung_agent_times_out_without_blocking(client, auth_headers, monkeypatch):
+    import asyncio
+
+    import main
+
+    class HungAgent:
+        async def arun(self, _message: str):
+            await asyncio.sleep(30)
+
+    monkeypatch.setattr(resilience, "AI_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(resilience, "AI_MAX_RETRIES", 0)
+    monkeypatch.setattr(main, "get_analytics_agent", lambda: HungAgent())
+
+    response = client.post("/api/analytics", json={"message": "ping"}, headers=auth_headers)
+    assert response.status_code == 504
@@ -0,0 +1,75 @@
+import anyio
+
+from knowledge_base.chunking import chunk_document, chunk_fixed, chunk_pages, chunk_structured
+
+
+def test_fixed_chunks_overlap_and_keep_offsets():
+    text = " ".join(f"palavra{i}" for i in range(200))
+
+    chunks = chunk_fixed(text, size=200, overlap=50)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk.text) <= 200
+        assert text[chunk.start:chunk.end].strip() == chunk.text
+    assert chunks[1].start < chunks[0].end
+
+
+def test_structured_chunks_follow_markdown_headings():
+    text = "# Oferta\n\nPreco especial.\n\nBonus.\n\n## Garantia\n\nSete dias.\n"
+
+    chunks = chunk_structured(text, size=500, overlap=50)
+
+    assert [chunk.section for chunk in chunks] == ["Oferta", "Garantia"]
+    assert "Sete dias." in chunks[1].text
+    assert "Preco especial." not in chunks[1].text
+
+
+def test_pdf_chunks_carry_page_numbers():
+    pages = ["primeira pagina", "segunda pagina"]
+
+    chunks = chunk_pages(pages, size=500, overlap=50)
+    joined = "\n".join(pages)
+
+    assert [chunk.page for chunk in chunks] == [1, 2]
+    assert joined[chunks[1].start:chunks[1].end] == "segunda pagina"
+    assert chunk_document(joined, "pdf", pages=pages) == chunks
+
+
+def test_ingestion_job_embeds_chunks_in_one_batch_and_stores_them(client, auth_headers, isolated_ingestion_queue, monkeypatch):
+    from knowledge_base import ingestion, jobs
+
+    monkeypatch.setattr(ingestion, "chunk_document", lambda content, file_type, pages=None: chunk_fixed(content, size=20, overlap=0))
+    batches: list[list[str]] = []
+    upserted = []
+
+    class FakeEmbedder:
+        async def async_get_embeddings_batch_and_usage(self, texts):
+            batches.append(texts)
+            return [[0.1, 0.2] for _ in texts], [None for _ in texts]
+
+    class FakeVectorDb:
+        embedder = FakeEmbedder()
+
+        def upsert(self, content_hash, documents):
+            upserted.extend(documents)
+
+    class FakeKnowledgeBase:
+        vector_db = FakeVectorDb()
+
+    monkeypatch.setattr(jobs, "get_knowledge_base", lambda: FakeKnowledgeBase())
+
+    text = "linha de manual " * 10
+    response = client.post("/api/brain/upload", files={"file": ("manual.txt", text.encode("utf-8"), "text/plain")}, headers=auth_headers)
+    job_id = response.json()["job_id"]
+    anyio.run(isolated_ingestion_queue.run_job, job_id)
+
+    job = isolated_ingestion_queue.store.get(job_id)
+    assert job["status"] == "succeeded"
+    assert len(batches) == 1
+    assert len(upserted) == len(batches[0]) == job["chunks_total"] > 1
+    assert [doc.content for doc in upserted] == [chunk.text for chunk in chunk_fixed(text, size=20, overlap=0)]
+    assert all(doc.embedding == [0.1, 0.2] for doc in upserted)
+    assert [doc.meta_data["chunk_index"] for doc in upserted] == list(range(len(upserted)))
+    assert upserted[0].meta_data["user_id"] == "user-test-123"
+    assert "start_offset" in upserted[0].meta_data
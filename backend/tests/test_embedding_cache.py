@@ -0,0 +1,122 @@
+import anyio
+
+from knowledge_base.embedding_cache import embed_with_cache, embedding_key
+
+
+class CountingEmbedder:
+    id = "text-embedding-3-small"
+
+    def __init__(self):
+        self.calls: list[list[str]] = []
+
+    async def async_get_embeddings_batch_and_usage(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 0.5] for text in texts], [{"total_tokens": 1} for _ in texts]
+
+
+def test_embedding_key_normalizes_whitespace_and_includes_model():
+    assert embedding_key("ola  mundo\n", "m1") == embedding_key("ola mundo", "m1")
+    assert embedding_key("ola mundo", "m1") != embedding_key("ola mundo", "m2")
+
+
+def test_only_new_texts_reach_the_embedder():
+    embedder = CountingEmbedder()
+
+    first, _ = anyio.run(embed_with_cache, embedder, ["a", "bb"])
+    second, usage = anyio.run(embed_with_cache, embedder, ["a", "bb", "ccc"])
+
+    assert embedder.calls == [["a", "bb"], ["ccc"]]
+    assert second[:2] == first
+    assert second[2] == [3.0, 0.5]
+    assert usage[:2] == [None, None]
+
+
+def test_unchanged_reupload_skips_embedding_and_upsert(client, auth_headers, isolated_ingestion_queue, monkeypatch):
+    from knowledge_base import jobs
+
+    embedder = CountingEmbedder()
+    upserts: list[str] = []
+
+    class FakeVectorDb:
+        def __init__(self):
+            self.embedder = embedder
+
+        def upsert(self, content_hash, documents):
+            upserts.append(content_hash)
+
+        def content_hash_exists(self, content_hash):
+            return content_hash in upserts
+
+    class FakeKnowledgeBase:
+        vector_db = FakeVectorDb()
+
+    monkeypatch.setattr(jobs, "get_knowledge_base", lambda: FakeKnowledgeBase())
+
+    def upload(data: bytes) -> dict:
+        response = client.post("/api/brain/upload", files={"file": ("manual.txt", data, "text/plain")}, headers=auth_headers)
+        job_id = response.json()["job_id"]
+        anyio.run(isolated_ingestion_queue.run_job, job_id)
+        return jobs.public_job(isolated_ingestion_queue.store.get(job_id))
+
+    first = upload(b"versao um")
+    unchanged = upload(b"versao um")
+    changed = upload(b"versao dois")
+
+    assert first["status"] == unchanged["status"] == changed["status"] == "succeeded"
+    assert first["result"]["unchanged"] is False
+    assert unchanged["result"]["unchanged"] is True
+    assert changed["result"]["unchanged"] is False
+    assert len(upserts) == 2
+    assert embedder.calls == [["versao um"], ["versao dois"]]
+
+
+def test_unreadable_cache_falls_back_to_the_embedder(monkeypatch, tmp_path):
+    import sqlite3
+
+    from knowledge_base import embedding_cache
+
+    class LockedCache(embedding_cache.EmbeddingCache):
+        def get_many(self, keys):
+            raise sqlite3.OperationalError("database is locked")
+
+        def put_many(self, items):
+            raise sqlite3.OperationalError("database is locked")
+
+    cache = LockedCache(str(tmp_path / "locked.sqlite3"))
+    monkeypatch.setattr(embedding_cache, "get_embedding_cache", lambda path=None: cache)
+    embedder = CountingEmbedder()
+
+    embeddings, _ = anyio.run(embed_with_cache, embedder, ["a", "bb"])
+
+    assert embeddings == [[1.0, 0.5], [2.0, 0.5]]
+    assert embedder.calls == [["a", "bb"]]
+
+
+def test_cache_reads_and_writes_run_off_the_event_loop(monkeypatch, tmp_path):
+    import threading
+
+    from knowledge_base import embedding_cache
+
+    threads: list[tuple[str, int]] = []
+
+    class RecordingCache(embedding_cache.EmbeddingCache):
+        def get_many(self, keys):
+            threads.append(("get_many", threading.get_ident()))
+            return super().get_many(keys)
+
+        def put_many(self, items):
+            threads.append(("put_many", threading.get_ident()))
+            super().put_many(items)
+
+    cache = RecordingCache(str(tmp_path / "recording.sqlite3"))
+    monkeypatch.setattr(embedding_cache, "get_embedding_cache", lambda path=None: cache)
+
+    async def embed():
+        loop_thread = threading.get_ident()
+        await embed_with_cache(CountingEmbedder(), ["a", "bb"])
+        return loop_thread
+
+    loop_thread = anyio.run(embed)
+
+    assert [name for name, _ in threads] == ["get_many", "put_many"]
+    assert all(thread != loop_thread for _, thread in threads)
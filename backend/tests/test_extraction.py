@@ -0,0 +1,82 @@
+import anyio
+from prometheus_client import REGISTRY
+
+from knowledge_base import extraction
+
+
+def _make_pdf(page_texts: list[str]) -> bytes:
+    """Minimal PDF with one line of Helvetica text per page."""
+    count = len(page_texts)
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(count))
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {count} >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(page_texts):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def _extraction_count(file_type: str) -> float:
+    return REGISTRY.get_sample_value(
+        "umbra_document_extraction_duration_seconds_count", {"file_type": file_type}
+    ) or 0.0
+
+
+def test_pdf_is_extracted_in_page_shards_preserving_order(monkeypatch, tmp_path):
+    monkeypatch.setattr(extraction, "KB_PDF_PAGES_PER_SHARD", 2)
+    texts = [f"pagina {i}" for i in range(5)]
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(_make_pdf(texts))
+
+    shards = []
+    original = extraction.extract_pdf_pages
+
+    def recording_extract(file_path, start, end):
+        shards.append((start, end))
+        return original(file_path, start, end)
+
+    monkeypatch.setattr(extraction, "extract_pdf_pages", recording_extract)
+    progress = []
+    before = _extraction_count("pdf")
+
+    async def record_progress(done, total):
+        progress.append((done, total))
+
+    content, pages = anyio.run(lambda: extraction.extract_file("pdf", str(path), on_progress=record_progress))
+
+    assert [page.strip() for page in pages] == texts
+    assert content == "\n".join(pages)
+    assert sorted(shards) == [(0, 2), (2, 4), (4, 5)]
+    assert progress[0] == (0, 5)
+    assert progress[-1] == (5, 5)
+    assert _extraction_count("pdf") == before + 1
+
+
+def test_text_files_are_extracted_off_the_event_loop(tmp_path):
+    path = tmp_path / "notes.md"
+    path.write_text("# Título\n\nconteúdo", encoding="utf-8")
+    before = _extraction_count("md")
+
+    content, pages = anyio.run(extraction.extract_file, "md", str(path))
+
+    assert content == "# Título\n\nconteúdo"
+    assert pages is None
+    assert _extraction_count("md") == before + 1
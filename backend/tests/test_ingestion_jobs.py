@@ -0,0 +1,124 @@
+import os
+
+import anyio
+
+from knowledge_base import jobs
+from tests.conftest import build_auth_headers
+
+
+class FakeEmbedder:
+    id = "fake-embedder"
+
+    async def async_get_embeddings_batch_and_usage(self, texts):
+        return [[0.1, 0.2] for _ in texts], [None for _ in texts]
+
+
+class FlakyVectorDb:
+    def __init__(self, failures: int):
+        self.embedder = FakeEmbedder()
+        self.failures = failures
+        self.upserts: list[int] = []
+
+    def upsert(self, content_hash, documents):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("connection reset")
+        self.upserts.append(len(documents))
+
+    def content_hash_exists(self, content_hash):
+        return bool(self.upserts)
+
+
+def _upload(client, headers, filename: str, body: bytes) -> str:
+    response = client.post("/api/brain/upload", files={"file": (filename, body, "text/plain")}, headers=headers)
+    assert response.status_code == 202
+    return response.json()["job_id"]
+
+
+def _fake_kb(vector_db):
+    class FakeKnowledgeBase:
+        pass
+
+    kb = FakeKnowledgeBase()
+    kb.vector_db = vector_db
+    return kb
+
+
+def test_uploaded_job_runs_all_stages_and_removes_its_files(client, auth_headers, isolated_ingestion_queue, monkeypatch):
+    vector_db = FlakyVectorDb(failures=0)
+    monkeypatch.setattr(jobs, "get_knowledge_base", lambda: _fake_kb(vector_db))
+    queue = isolated_ingestion_queue
+
+    job_id = _upload(client, auth_headers, "manual.md", b"# Titulo\n\nconteudo do manual")
+    anyio.run(queue.run_job, job_id)
+
+    done = jobs.public_job(queue.store.get(job_id))
+    assert done["status"] == "succeeded"
+    assert done["stage"] == "done"
+    assert done["progress"]["chunks_embedded"] == done["progress"]["chunks_total"] == 1
+    assert vector_db.upserts == [1]
+    assert os.listdir(queue.spool_dir) == []
+
+
+def test_failed_store_stage_resumes_without_reparsing(client, auth_headers, isolated_ingestion_queue, monkeypatch):
+    vector_db = FlakyVectorDb(failures=1)
+    monkeypatch.setattr(jobs, "get_knowledge_base", lambda: _fake_kb(vector_db))
+    queue = isolated_ingestion_queue
+    queue.max_attempts = 1
+
+    job_id = _upload(client, auth_headers, "manual.txt", b"conteudo")
+    anyio.run(queue.run_job, job_id)
+
+    failed = queue.store.get(job_id)
+    assert failed["status"] == "failed"
+    assert failed["stage"] == "store"
+    assert "connection reset" in failed["error"]
+
+    parses = {"count": 0}
+    original_parse = queue._parse
+
+    async def counting_parse(job):
+        parses["count"] += 1
+        await original_parse(job)
+
+    monkeypatch.setattr(queue, "_parse", counting_parse)
+    assert client.post(f"/api/brain/jobs/{job_id}/retry", headers=auth_headers).status_code == 200
+    anyio.run(queue.run_job, job_id)
+
+    assert queue.store.get(job_id)["status"] == "succeeded"
+    assert parses["count"] == 0
+
+
+def test_failed_jobs_are_swept_with_their_files_after_the_ttl(client, auth_headers, isolated_ingestion_queue, monkeypatch):
+    monkeypatch.setattr(jobs, "get_knowledge_base", lambda: None)
+    queue = isolated_ingestion_queue
+    queue.max_attempts = 1
+
+    kept_id = _upload(client, auth_headers, "recente.txt", b"conteudo")
+    expired_id = _upload(client, auth_headers, "antigo.txt", b"conteudo")
+    for job_id in (kept_id, expired_id):
+        anyio.run(queue.run_job, job_id)
+        assert queue.store.get(job_id)["status"] == "failed"
+    queue.store.update(expired_id, updated_at=0)
+
+    assert anyio.run(queue.sweep_failed) == 1
+    assert queue.store.get(expired_id) is None
+    assert client.get(f"/api/brain/jobs/{expired_id}", headers=auth_headers).status_code == 404
+    assert sorted(os.listdir(queue.spool_dir)) == [kept_id, f"{kept_id}.extracted.json"]
+
+
+def test_jobs_are_scoped_to_their_owner(client, auth_secret, auth_headers):
+    job_id = _upload(client, auth_headers, "manual.txt", b"conteudo")
+    other_headers = build_auth_headers(auth_secret=auth_secret, user_id="someone-else")
+
+    assert client.get(f"/api/brain/jobs/{job_id}", headers=auth_headers).status_code == 200
+    assert client.get(f"/api/brain/jobs/{job_id}", headers=other_headers).status_code == 404
+    assert client.post(f"/api/brain/jobs/{job_id}/retry", headers=auth_headers).status_code == 409
+
+
+def test_unfinished_jobs_are_recovered_on_start(client, auth_headers, isolated_ingestion_queue):
+    queue = isolated_ingestion_queue
+    job_id = _upload(client, auth_headers, "manual.txt", b"conteudo")
+    queue.store.update(job_id, status=jobs.STATUS_RUNNING, updated_at=0)
+
+    assert queue.store.recover_unfinished(stale_after_seconds=60) == [job_id]
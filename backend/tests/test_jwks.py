@@ -0,0 +1,143 @@
+import json
+import time
+
+import anyio
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from fastapi import HTTPException
+
+import auth
+import jwks
+
+
+def _jwk(private_key, kid: str, algorithm: str) -> dict:
+    public_jwk = json.loads(jwt.get_algorithm_by_name(algorithm).to_jwk(private_key.public_key()))
+    return {**public_jwk, "kid": kid, "alg": algorithm, "use": "sig"}
+
+
+def _token(private_key, kid: str, algorithm: str, user_id: str = "user-a") -> str:
+    payload = {"sub": user_id, "aud": "authenticated", "exp": int(time.time()) + 3600}
+    return jwt.encode(payload, private_key, algorithm=algorithm, headers={"kid": kid})
+
+
+@pytest.fixture
+def signing_keys():
+    return {
+        "rsa-1": (rsa.generate_private_key(public_exponent=65537, key_size=2048), "RS256"),
+        "ec-1": (ec.generate_private_key(ec.SECP256R1()), "ES256"),
+    }
+
+
+@pytest.fixture
+def jwks_file(tmp_path, signing_keys):
+    path = tmp_path / "jwks.json"
+
+    def publish(kids):
+        keys = [_jwk(signing_keys[kid][0], kid, signing_keys[kid][1]) for kid in kids]
+        path.write_text(json.dumps({"keys": keys}))
+
+    publish(signing_keys)
+    return path, publish
+
+
+@pytest.fixture
+def key_set(monkeypatch, jwks_file):
+    # HS256 is left unconfigured so only the JWKS path can verify.
+    monkeypatch.setattr(auth, "SUPABASE_JWT_SECRET", "")
+    key_set = jwks.JwksKeySet(str(jwks_file[0]), refresh_seconds=0.05, jitter_seconds=0)
+    key_set.load()
+    monkeypatch.setattr(jwks, "_jwks", key_set)
+    return key_set
+
+
+@pytest.mark.parametrize("kid", ["rsa-1", "ec-1"])
+def test_asymmetric_tokens_verify_against_jwks(key_set, signing_keys, kid):
+    private_key, algorithm = signing_keys[kid]
+
+    assert auth._decode_token(_token(private_key, kid, algorithm))["sub"] == "user-a"
+
+
+def test_unknown_kid_is_rejected_without_fetching(key_set, signing_keys, monkeypatch):
+    monkeypatch.setattr(key_set, "_read_document", lambda: pytest.fail("fetched on the request path"))
+    private_key, algorithm = signing_keys["rsa-1"]
+
+    with pytest.raises(HTTPException) as exc:
+        auth._decode_token(_token(private_key, "rsa-unknown", algorithm))
+    assert exc.value.status_code == 401
+
+
+def test_hs256_token_is_rejected_when_only_jwks_is_configured(key_set):
+    token = jwt.encode({"sub": "user-a", "aud": "authenticated"}, "guessed-secret-guessed-secret-32b", algorithm="HS256")
+
+    with pytest.raises(HTTPException) as exc:
+        auth._decode_token(token)
+    assert exc.value.status_code == 401
+
+
+def test_background_refresh_picks_up_rotated_keys(key_set, jwks_file, signing_keys):
+    _, publish = jwks_file
+    token = _token(signing_keys["rsa-1"][0], "rsa-1", "RS256")
+    auth._decode_token(token)
+
+    async def rotate():
+        await key_set.start()
+        try:
+            publish(["ec-1"])
+            with anyio.fail_after(2):
+                while key_set.get("rsa-1") is not None:
+                    await anyio.sleep(0.01)
+        finally:
+            await key_set.stop()
+
+    anyio.run(rotate)
+
+    with pytest.raises(HTTPException):
+        auth._decode_token(token)
+    assert key_set.get("ec-1") is not None
+
+
+def test_failed_refresh_keeps_previous_keys(key_set, jwks_file):
+    jwks_file[0].write_text("not json")
+
+    with pytest.raises(ValueError):
+        key_set.load()
+    assert key_set.get("rsa-1") is not None
+
+
+def test_refresh_delay_stays_within_jitter():
+    key_set = jwks.JwksKeySet("unused.json", refresh_seconds=600, jitter_seconds=60)
+
+    delays = [key_set.next_refresh_delay() for _ in range(50)]
+
+    assert all(540 <= delay <= 660 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_failed_first_load_is_retried_before_the_refresh_interval(tmp_path, jwks_file):
+    path, _ = jwks_file
+    missing = tmp_path / "late-jwks.json"
+    key_set = jwks.JwksKeySet(str(missing), refresh_seconds=600, jitter_seconds=0, retry_base_seconds=0.02)
+
+    async def start_then_publish():
+        await key_set.start()
+        try:
+            assert key_set.get("rsa-1") is None
+            missing.write_bytes(path.read_bytes())
+            with anyio.fail_after(2):
+                while key_set.get("rsa-1") is None:
+                    await anyio.sleep(0.01)
+        finally:
+            await key_set.stop()
+
+    anyio.run(start_then_publish)
+
+    assert key_set.next_refresh_delay(failures=3) >= 540
+
+
+def test_retry_backoff_doubles_up_to_the_refresh_interval():
+    key_set = jwks.JwksKeySet("unused.json", refresh_seconds=10, jitter_seconds=0, retry_base_seconds=1)
+
+    assert 0.5 <= key_set.next_refresh_delay(failures=1) <= 1
+    assert 2 <= key_set.next_refresh_delay(failures=3) <= 4
+    assert 5 <= key_set.next_refresh_delay(failures=10) <= 10
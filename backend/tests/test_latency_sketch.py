@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+import metrics_summary
+from latency_sketch import LatencySketch
+
+
+def _exact_quantile(values: list[float], quantile: float) -> float:
+    ordered = sorted(values)
+    return ordered[int(quantile * (len(ordered) - 1))]
+
+
+@pytest.mark.parametrize("quantile", [0.5, 0.95, 0.99])
+def test_quantiles_are_within_relative_accuracy(quantile):
+    rng = random.Random(7)
+    values = [rng.lognormvariate(0, 1.2) for _ in range(20000)]
+    sketch = LatencySketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    expected = _exact_quantile(values, quantile)
+
+    assert sketch.quantile(quantile) == pytest.approx(expected, rel=0.01)
+
+
+def test_merged_sketch_matches_single_sketch():
+    rng = random.Random(11)
+    values = [rng.uniform(0.01, 30) for _ in range(5000)]
+    whole, left, right = LatencySketch(), LatencySketch(), LatencySketch()
+    for index, value in enumerate(values):
+        whole.add(value)
+        (left if index % 2 else right).add(value)
+
+    left.merge(right)
+
+    assert left.count == whole.count
+    assert left.bins == whole.bins
+    assert left.quantile(0.95) == whole.quantile(0.95)
+
+
+def test_bins_stay_bounded_and_high_quantiles_stay_accurate():
+    sketch = LatencySketch(relative_accuracy=0.01, max_bins=64)
+    values = [10 ** (exponent / 1000) for exponent in range(-6000, 2000)]
+    for value in values:
+        sketch.add(value)
+
+    assert len(sketch.bins) <= 64
+    assert sketch.quantile(0.99) == pytest.approx(_exact_quantile(values, 0.99), rel=0.01)
+
+
+def test_agent_p95_is_not_rounded_up_to_bucket_bound():
+    aggregator = metrics_summary.MetricsAggregator()
+    for index in range(100):
+        aggregator.record_agent("content", "success", 5.0 + index * 0.02)
+
+    percentiles = aggregator.refresh()["agent_duration_ms_percentiles"][0]
+
+    assert percentiles["p95_ms"] == pytest.approx(6900, rel=0.01)
+    assert percentiles["p99_ms"] == pytest.approx(6980, rel=0.01)
@@ -0,0 +1,98 @@
+import os
+import subprocess
+import sys
+
+import metrics_summary
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER_SCRIPT = """
+from observability import HTTP_REQUESTS_TOTAL
+HTTP_REQUESTS_TOTAL.labels(method="GET", path="/health", status="200").inc(3)
+"""
+
+SCRAPE_SCRIPT = """
+import sys
+from observability import metrics_payload
+sys.stdout.write(metrics_payload().decode())
+"""
+
+
+def _run(script: str, multiproc_dir: str) -> str:
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": multiproc_dir}
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout
+
+
+def test_metrics_endpoint_merges_all_worker_processes(tmp_path):
+    multiproc_dir = str(tmp_path)
+    _run(WORKER_SCRIPT, multiproc_dir)
+    _run(WORKER_SCRIPT, multiproc_dir)
+
+    scrape = _run(SCRAPE_SCRIPT, multiproc_dir)
+
+    assert 'umbra_http_requests_total{method="GET",path="/health",status="200"} 6.0' in scrape
+
+
+def test_summary_snapshot_covers_every_worker(tmp_path):
+    worker_a = metrics_summary.MetricsAggregator(shared_dir=str(tmp_path), worker_id="a")
+    worker_b = metrics_summary.MetricsAggregator(shared_dir=str(tmp_path), worker_id="b")
+    worker_a.record_agent("email", "success", 1.0)
+    worker_b.record_agent("email", "error", 3.0)
+    worker_b.record_http("GET", "/health", "200", 0.01)
+    worker_b.refresh()
+
+    snapshot = worker_a.refresh()
+
+    calls = {(item["agent"], item["status"]): item["count"] for item in snapshot["agent_calls_total"]}
+    assert calls == {("email", "success"): 1, ("email", "error"): 1}
+    assert snapshot["windows"]["5m"]["http_requests_total"][0]["path"] == "/health"
+    assert snapshot["agent_duration_ms_avg"][0]["avg_ms"] == 2000.0
+
+
+def test_files_of_workers_gone_for_a_day_are_pruned(tmp_path):
+    gone = metrics_summary.MetricsAggregator(shared_dir=str(tmp_path), worker_id="gone")
+    gone.record_agent("email", "error", 3.0)
+    gone.refresh()
+    day_ago = os.path.getmtime(tmp_path / "summary_gone.json") - metrics_summary.METRICS_SUMMARY_STALE_SECONDS - 1
+    os.utime(tmp_path / "summary_gone.json", (day_ago, day_ago))
+    live = metrics_summary.MetricsAggregator(shared_dir=str(tmp_path), worker_id="live")
+    live.record_agent("email", "success", 1.0)
+
+    snapshot = live.refresh()
+
+    assert [item["status"] for item in snapshot["agent_calls_total"]] == ["success"]
+    assert sorted(path.name for path in tmp_path.glob("summary_*")) == ["summary_live.json"]
+
+
+def test_workers_share_merged_views_and_leave_windows_they_no_longer_cover(tmp_path):
+    import json
+
+    exited = metrics_summary.MetricsAggregator(shared_dir=str(tmp_path), worker_id="exited")
+    exited.record_agent("email", "error", 3.0)
+    exited.refresh()
+    path = tmp_path / "summary_exited.json"
+    payload = json.loads(path.read_text())
+    assert set(payload["views"]) == {"total", *metrics_summary.WINDOWS}
+    assert "minutes" not in json.dumps(payload)
+    # Last export ten minutes ago: still inside the 1h and 24h windows, out of the 5m one.
+    payload["exported_at"] -= 10 * 60
+    path.write_text(json.dumps(payload))
+
+    live = metrics_summary.MetricsAggregator(shared_dir=str(tmp_path), worker_id="live")
+    live.record_agent("email", "success", 1.0)
+    snapshot = live.refresh()
+
+    def statuses(section):
+        return sorted(item["status"] for item in section["agent_calls_total"])
+
+    assert statuses(snapshot) == ["error", "success"]
+    assert statuses(snapshot["windows"]["5m"]) == ["success"]
+    assert statuses(snapshot["windows"]["1h"]) == ["error", "success"]
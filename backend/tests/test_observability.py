@@ -1,3 +1,13 @@
+from observability import (
+    HTTP_REQUESTS_TOTAL,
+    OTHER_METHOD_LABEL,
+    OVERFLOW_ROUTE_LABEL,
+    UNMATCHED_ROUTE_LABEL,
+    SeriesGuard,
+    method_label,
+)
+
+
 def test_metrics_endpoint_exposes_prometheus_text(client):
     response = client.get("/metrics")
     assert response.status_code == 200
@@ -16,4 +26,39 @@ def test_request_id_is_generated_when_missing(client):
     assert response.status_code == 200
     request_id = response.headers.get("X-Request-ID")
     assert request_id is not None
-    assert len(request_id) >= 8
\ No newline at end of file
+    assert len(request_id) >= 8
+
+
+def _http_request_paths() -> set[str]:
+    return {
+        sample.labels["path"]
+        for metric in HTTP_REQUESTS_TOTAL.collect()
+        for sample in metric.samples
+        if sample.name == "umbra_http_requests_total"
+    }
+
+
+def test_http_metrics_use_route_templates_and_one_unmatched_bucket(client, auth_headers):
+    client.get("/api/brain/jobs/job-abc", headers=auth_headers)
+    for index in range(20):
+        client.get(f"/wp-admin/probe-{index}.php")
+
+    paths = _http_request_paths()
+
+    assert "/api/brain/jobs/{job_id}" in paths
+    assert UNMATCHED_ROUTE_LABEL in paths
+    assert not any(path.startswith("/wp-admin") or path.endswith("job-abc") for path in paths)
+
+
+def test_series_guard_caps_distinct_labels():
+    guard = SeriesGuard(max_series=2)
+
+    assert guard.admit("GET", "/a") == "/a"
+    assert guard.admit("GET", "/b") == "/b"
+    assert guard.admit("GET", "/c") == OVERFLOW_ROUTE_LABEL
+    assert guard.admit("GET", "/a") == "/a"
+
+
+def test_unknown_methods_share_one_label():
+    assert method_label("get") == "GET"
+    assert method_label("PROPFIND") == OTHER_METHOD_LABEL
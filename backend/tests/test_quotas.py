@@ -0,0 +1,90 @@
+import anyio
+
+import main
+import quotas
+from tests.conftest import DummyAgent, DummyResponse, build_auth_headers, build_scripted_agent
+
+
+class MeteredResponse(DummyResponse):
+    def __init__(self, content: str, total_tokens: int):
+        super().__init__(content)
+        prompt_tokens = total_tokens * 2 // 3
+        self.metrics = type(
+            "Metrics",
+            (),
+            {"input_tokens": prompt_tokens, "output_tokens": total_tokens - prompt_tokens, "total_tokens": total_tokens},
+        )()
+
+
+class MeteredAgent(DummyAgent):
+    def __init__(self, content: str, total_tokens: int):
+        super().__init__(content)
+        self.total_tokens = total_tokens
+
+    async def _respond(self):
+        return MeteredResponse(self._content, self.total_tokens)
+
+
+def _ugc_payload(index: int) -> dict:
+    return {"product_name": f"Produto {index}", "audience_name": "Mães", "expert_name": "Ana", "style": "Depoimento"}
+
+
+def test_rate_limit_is_keyed_by_user_not_address(client, auth_secret, monkeypatch):
+    monkeypatch.setattr(main, "get_ugc_agent", lambda: DummyAgent('{"script": "ok"}'))
+    user_a = build_auth_headers(auth_secret=auth_secret, user_id="user-a")
+    user_b = build_auth_headers(auth_secret=auth_secret, user_id="user-b")
+
+    statuses = [client.post("/api/ugc", json=_ugc_payload(i), headers=user_a).status_code for i in range(11)]
+
+    assert statuses[:10] == [200] * 10
+    assert statuses[10] == 429
+    assert client.post("/api/ugc", json=_ugc_payload(0), headers=user_b).status_code == 200
+
+
+def test_exhausted_token_budget_returns_429_with_retry_after(client, auth_secret, monkeypatch):
+    monkeypatch.setattr(quotas, "_token_budget", quotas.TokenBudget("memory://", 1000))
+    monkeypatch.setattr(main, "get_ugc_agent", lambda: MeteredAgent('{"script": "ok"}', 600))
+    user_a = build_auth_headers(auth_secret=auth_secret, user_id="user-a")
+    user_b = build_auth_headers(auth_secret=auth_secret, user_id="user-b")
+
+    assert client.post("/api/ugc", json=_ugc_payload(1), headers=user_a).status_code == 200
+    assert anyio.run(quotas.get_token_budget().remaining, "user-a") == 400
+    assert client.post("/api/ugc", json=_ugc_payload(2), headers=user_a).status_code == 200
+
+    rejected = client.post("/api/ugc", json=_ugc_payload(3), headers=user_a)
+
+    assert rejected.status_code == 429
+    assert 0 < int(rejected.headers["Retry-After"]) <= 24 * 60 * 60
+    assert client.post("/api/ugc", json=_ugc_payload(1), headers=user_b).status_code == 200
+
+
+def test_streamed_runs_are_charged_to_the_token_budget(client, auth_secret, monkeypatch):
+    monkeypatch.setattr(quotas, "_token_budget", quotas.TokenBudget("memory://", 1000))
+    monkeypatch.setattr(main, "get_content_agent", lambda user_id: build_scripted_agent(("ola",), usage=(700, 300)))
+    user_a = build_auth_headers(auth_secret=auth_secret, user_id="user-a")
+
+    assert client.post("/api/content/stream", json={"message": "oi"}, headers=user_a).status_code == 200
+    assert anyio.run(quotas.get_token_budget().remaining, "user-a") == 0
+    assert client.post("/api/content/stream", json={"message": "oi"}, headers=user_a).status_code == 429
+
+
+def test_redis_budget_storage_is_built_lazily_and_fails_open(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(main, "get_ugc_agent", lambda: DummyAgent('{"script": "ok"}'))
+    built = []
+    real_storage_from_string = quotas.storage_from_string
+
+    def recording_storage_from_string(uri):
+        built.append(uri)
+        return real_storage_from_string(uri)
+
+    monkeypatch.setattr(quotas, "storage_from_string", recording_storage_from_string)
+
+    # Disabled budget: no storage client is created at all.
+    monkeypatch.setattr(quotas, "_token_budget", quotas.TokenBudget("redis://localhost:1", 0))
+    assert client.post("/api/ugc", json=_ugc_payload(1), headers=auth_headers).status_code == 200
+    assert built == []
+
+    # Enabled budget on the sync redis:// storage slowapi uses; an unusable store lets requests through.
+    monkeypatch.setattr(quotas, "_token_budget", quotas.TokenBudget("redis://localhost:1", 1000))
+    assert client.post("/api/ugc", json=_ugc_payload(2), headers=auth_headers).status_code == 200
+    assert built and all(uri == "redis://localhost:1" for uri in built)
@@ -1,29 +1,90 @@
-import io
+import os
 
 import anyio
-from fastapi import UploadFile
 
-from tests.conftest import DummyAgent
+from tests.conftest import DummyAgent, build_auth_headers
 
 
-def test_brain_upload_endpoint_accepts_multipart(client, auth_headers, monkeypatch):
-    import main
+def test_brain_upload_endpoint_accepts_multipart(client, auth_headers):
+    response = client.post(
+        "/api/brain/upload",
+        files={"file": ("manual.md", b"conteudo de teste", "text/markdown")},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 202
+    payload = response.json()
+    assert payload["status"] == "queued"
+    assert "manual.md" in payload["message"]
 
-    async def fake_process_document(file, user_id):
-        return {"status": "success", "message": f"ok:{file.filename}:{user_id}"}
+    job = client.get(f"/api/brain/jobs/{payload['job_id']}", headers=auth_headers)
+    assert job.status_code == 200
+    assert job.json()["status"] == "queued"
+    assert job.json()["filename"] == "manual.md"
 
-    monkeypatch.setattr(main, "process_document", fake_process_document)
 
+def test_brain_upload_rejects_mismatched_file_type(client, auth_headers):
     response = client.post(
         "/api/brain/upload",
-        files={"file": ("manual.md", b"conteudo de teste", "text/markdown")},
+        files={"file": ("manual.pdf", b"not a pdf", "application/pdf")},
         headers=auth_headers,
     )
 
     assert response.status_code == 200
-    payload = response.json()
-    assert payload["status"] == "success"
-    assert payload["message"].startswith("ok:manual.md:user-test-123")
+    assert response.json()["status"] == "error"
+
+
+def test_brain_upload_rejects_oversized_file_without_keeping_it(client, auth_headers, monkeypatch, isolated_ingestion_queue):
+    import main
+
+    monkeypatch.setattr(main, "MAX_UPLOAD_SIZE", 1024)
+
+    response = client.post(
+        "/api/brain/upload",
+        files={"file": ("manual.txt", b"x" * 5000, "text/plain")},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 413
+    assert os.listdir(isolated_ingestion_queue.spool_dir) == []
+
+
+def test_brain_upload_spools_file_part_unchanged(client, auth_headers, isolated_ingestion_queue):
+    body = b"%PDF-1.4\n" + bytes(range(256)) * 400
+
+    response = client.post(
+        "/api/brain/upload",
+        data={"note": "ignored"},
+        files={"file": ("manual.pdf", body, "application/pdf")},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 202
+    job = isolated_ingestion_queue.store.get(response.json()["job_id"])
+    with open(job["file_path"], "rb") as handle:
+        assert handle.read() == body
+
+
+def test_brain_upload_writes_the_spool_file_off_the_event_loop(client, auth_headers, isolated_ingestion_queue, monkeypatch):
+    from knowledge_base import uploads
+
+    offloaded: list[str] = []
+    real_to_thread = uploads.asyncio.to_thread
+
+    async def recording_to_thread(func, *args, **kwargs):
+        offloaded.append(getattr(func, "__name__", repr(func)))
+        return await real_to_thread(func, *args, **kwargs)
+
+    monkeypatch.setattr(uploads.asyncio, "to_thread", recording_to_thread)
+    body = b"%PDF-1.4\n" + bytes(range(256)) * 400
+
+    response = client.post("/api/brain/upload", files={"file": ("manual.pdf", body, "application/pdf")}, headers=auth_headers)
+
+    assert response.status_code == 202
+    spool_io = [name for name in offloaded if name in {"open", "write", "close"}]
+    assert spool_io[0] == "open"
+    assert spool_io[-1] == "close"
+    assert "write" in spool_io
 
 
 def test_brain_query_uses_user_scoped_agent(client, auth_headers, monkeypatch):
@@ -70,8 +131,8 @@ def test_content_endpoint_passes_user_id_to_content_agent(client, auth_headers,
     assert captured["user_id"] == "user-test-123"
 
 
-def test_process_document_generates_user_scoped_hash(monkeypatch):
-    from agents import brain_agent
+def test_ingestion_job_stores_each_users_file_under_its_own_hash(client, auth_secret, auth_headers, isolated_ingestion_queue, monkeypatch):
+    from knowledge_base import jobs
 
     captured_hashes: list[str] = []
 
@@ -82,19 +143,13 @@ def test_process_document_generates_user_scoped_hash(monkeypatch):
     class FakeKnowledgeBase:
         vector_db = FakeVectorDb()
 
-    monkeypatch.setattr(brain_agent, "get_knowledge_base", lambda: FakeKnowledgeBase())
-
-    async def run_case():
-        file_a = UploadFile(filename="manual.txt", file=io.BytesIO(b"hello"))
-        file_b = UploadFile(filename="manual.txt", file=io.BytesIO(b"hello"))
-
-        res_a = await brain_agent.process_document(file_a, user_id="user-a")
-        res_b = await brain_agent.process_document(file_b, user_id="user-b")
-
-        assert res_a["status"] == "success"
-        assert res_b["status"] == "success"
+    monkeypatch.setattr(jobs, "get_knowledge_base", lambda: FakeKnowledgeBase())
 
-    anyio.run(run_case)
+    for headers in (auth_headers, build_auth_headers(auth_secret=auth_secret, user_id="someone-else")):
+        response = client.post("/api/brain/upload", files={"file": ("manual.txt", b"hello", "text/plain")}, headers=headers)
+        job_id = response.json()["job_id"]
+        anyio.run(isolated_ingestion_queue.run_job, job_id)
+        assert isolated_ingestion_queue.store.get(job_id)["status"] == "succeeded"
 
     assert len(captured_hashes) == 2
     assert captured_hashes[0] != captured_hashes[1]
@@ -0,0 +1,130 @@
+import json
+
+from agents import research_tools, search_cache
+
+
+def _fake_search(calls):
+    def run_search(query, max_results, recency, region):
+        calls.append((query, recency))
+        return [{"title": query, "url": f"https://example.com/{len(calls)}", "snippet": "", "source": "web"}]
+
+    return run_search
+
+
+def test_repeated_search_is_served_from_cache(monkeypatch):
+    calls = []
+    monkeypatch.setattr(research_tools, "_run_search", _fake_search(calls))
+
+    first = json.loads(research_tools.search_web("Tendências  Skincare", recency="month"))
+    second = json.loads(research_tools.search_web("tendências skincare", recency="month"))
+    research_tools.search_web("tendências skincare", recency="day")
+
+    assert second["results"] == first["results"]
+    assert [recency for _, recency in calls] == ["month", "day"]
+
+
+def test_cache_entries_expire_by_recency_and_evict_lru(monkeypatch):
+    now = {"t": 1000.0}
+    monkeypatch.setattr(search_cache.time, "monotonic", lambda: now["t"])
+    cache = search_cache.SearchCache(max_entries=2, path="")
+    day = search_cache.search_cache_key("q", "day", "wt-wt", 6)
+    year = search_cache.search_cache_key("q", "year", "wt-wt", 6)
+
+    cache.set(day, [{"url": "a"}], search_cache.search_cache_ttl("day"))
+    cache.set(year, [{"url": "b"}], search_cache.search_cache_ttl("year"))
+    now["t"] += search_cache.search_cache_ttl("day") + 1
+
+    assert cache.get(day) is None
+    assert cache.get(year) == [{"url": "b"}]
+
+    cache.set(search_cache.search_cache_key("other", "year", "wt-wt", 6), [], 60)
+    cache.set(search_cache.search_cache_key("third", "year", "wt-wt", 6), [], 60)
+    assert cache.get(year) is None
+
+
+def test_disk_tier_is_shared_between_cache_instances(tmp_path):
+    path = str(tmp_path / "search.sqlite3")
+    key = search_cache.search_cache_key("q", "week", "wt-wt", 6)
+    writer = search_cache.SearchCache(path=path)
+    writer.set(key, [{"url": "https://example.com"}], 60)
+
+    reader = search_cache.SearchCache(path=path)
+
+    assert reader.get(key) == [{"url": "https://example.com"}]
+    writer.close()
+    reader.close()
+
+
+def test_multi_search_runs_queries_concurrently_and_dedupes_by_url(monkeypatch):
+    import threading
+
+    barrier = threading.Barrier(3, timeout=2)
+
+    def run_search(query, max_results, recency, region):
+        barrier.wait()
+        return [
+            {"title": "shared", "url": "https://Example.com/post/", "snippet": "", "source": "web"},
+            {"title": query, "url": f"https://example.com/{query}", "snippet": "", "source": "web"},
+        ]
+
+    monkeypatch.setattr(research_tools, "_run_search", run_search)
+
+    payload = json.loads(research_tools.search_web_multi(["a", "b", "c", "a"]))
+
+    assert payload["ok"] is True
+    assert [status["query"] for status in payload["queries"]] == ["a", "b", "c"]
+    shared = [item for item in payload["results"] if item["title"] == "shared"]
+    assert len(shared) == 1
+    assert shared[0]["queries"] == ["a", "b", "c"]
+    assert len(payload["results"]) == 4
+
+
+def test_multi_search_returns_partial_results_when_a_query_times_out(monkeypatch):
+    import threading
+
+    release = threading.Event()
+    monkeypatch.setattr(research_tools, "RESEARCH_QUERY_TIMEOUT_SECONDS", 0.2)
+
+    def run_search(query, max_results, recency, region):
+        if query == "slow":
+            release.wait(2)
+        return [{"title": query, "url": f"https://example.com/{query}", "snippet": "", "source": "web"}]
+
+    monkeypatch.setattr(research_tools, "_run_search", run_search)
+
+    payload = json.loads(research_tools.search_web_multi(["fast", "slow"]))
+    release.set()
+
+    assert payload["ok"] is True
+    assert {status["query"]: status["ok"] for status in payload["queries"]} == {"fast": True, "slow": False}
+    assert [item["title"] for item in payload["results"]] == ["fast"]
+
+
+def test_multi_search_reports_a_hung_query_after_its_own_timeout(monkeypatch):
+    import threading
+    import time
+
+    release = threading.Event()
+    monkeypatch.setattr(research_tools, "RESEARCH_QUERY_TIMEOUT_SECONDS", 0.3)
+
+    def run_search(query, max_results, recency, region):
+        if query == "hung":
+            release.wait(2)
+        return [{"title": query, "url": f"https://example.com/{query}", "snippet": "", "source": "web"}]
+
+    monkeypatch.setattr(research_tools, "_run_search", run_search)
+
+    started = time.monotonic()
+    # Five queries make two waves on the four-thread pool; the hung one still only gets its own 0.3s.
+    payload = json.loads(research_tools.search_web_multi(["hung", "a", "b", "c", "d"]))
+    elapsed = time.monotonic() - started
+    release.set()
+
+    assert {status["query"]: status.get("error") for status in payload["queries"]} == {
+        "hung": "timeout",
+        "a": None,
+        "b": None,
+        "c": None,
+        "d": None,
+    }
+    assert elapsed < 0.5
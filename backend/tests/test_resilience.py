@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import anyio
+import pytest
+from prometheus_client import REGISTRY
+
+import agent as router_agent
+import resilience
+from resilience import ExecutorSaturatedError
+from tests.conftest import DummyResponse
+
+
+def test_admission_rejects_top_level_calls_beyond_capacity_but_not_nested_ones(monkeypatch):
+    monkeypatch.setattr(resilience, "async_admission", resilience.AsyncAdmission(limit=1))
+    monkeypatch.setattr(resilience, "AI_MAX_RETRIES", 0)
+    release = asyncio.Event()
+
+    async def slow_call(_prompt):
+        await release.wait()
+        return DummyResponse("ok")
+
+    async def nested_call(_prompt):
+        # Nested calls run inside an admitted call and never take a second slot.
+        return await resilience.arun_agent_with_resilience(
+            "email", "oi", "req-1", lambda p: asyncio.sleep(0, DummyResponse("nested"))
+        )
+
+    async def scenario():
+        first = asyncio.create_task(resilience.arun_agent_with_resilience("ugc", "a", "req-1", slow_call))
+        await asyncio.sleep(0)
+        with pytest.raises(ExecutorSaturatedError):
+            await resilience.arun_agent_with_resilience("ugc", "b", "req-2", slow_call)
+        release.set()
+        await first
+        return await resilience.arun_agent_with_resilience("router", "c", "req-3", nested_call)
+
+    assert anyio.run(scenario).content == "nested"
+
+
+def test_nested_specialist_call_gets_remaining_budget_and_parent_label(monkeypatch):
+    monkeypatch.setattr(resilience, "AI_TIMEOUT_SECONDS", 0.6)
+    monkeypatch.setattr(resilience, "AI_HOP_RESERVE_SECONDS", 0.3)
+    monkeypatch.setattr(resilience, "AI_MAX_RETRIES", 0)
+
+    class HungAgent:
+        async def arun(self, _message):
+            await asyncio.sleep(5)
+
+    monkeypatch.setitem(router_agent.SPECIALISTS, "email", lambda user_id: HungAgent())
+    labels = {"agent": "email", "status": "error", "parent_agent": "router"}
+    errors_before = REGISTRY.get_sample_value("umbra_agent_calls_total", labels) or 0.0
+
+    async def router_turn(_prompt):
+        # What the router's tool loop does when the model calls run_email_agent.
+        content = await router_agent._run_specialist_tool("email", "write it", "user-a")
+        return DummyResponse(content)
+
+    started_at = time.perf_counter()
+    response = anyio.run(
+        lambda: resilience.arun_agent_with_resilience("router", "oi", "req-1", router_turn)
+    )
+    elapsed = time.perf_counter() - started_at
+
+    assert response.content.startswith("Erro: o agente email")
+    assert elapsed < 0.55
+    assert REGISTRY.get_sample_value("umbra_agent_calls_total", labels) == errors_before + 1
+
+
+def test_identical_inflight_calls_are_coalesced_per_user(monkeypatch):
+    calls = []
+
+    async def run_agent(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.05)
+        return DummyResponse(f"answer {len(calls)}")
+
+    labels = {"agent": "ugc"}
+    coalesced_before = REGISTRY.get_sample_value("umbra_agent_coalesced_requests_total", labels) or 0.0
+
+    async def scenario():
+        return await asyncio.gather(
+            resilience.arun_agent_with_resilience("ugc", "roteiro", "req-1", run_agent, user_id="user-a"),
+            resilience.arun_agent_with_resilience("ugc", "roteiro", "req-2", run_agent, user_id="user-a"),
+            resilience.arun_agent_with_resilience("ugc", "roteiro", "req-3", run_agent, user_id="user-b"),
+        )
+
+    first, duplicate, other_user = anyio.run(scenario)
+
+    assert len(calls) == 2
+    assert duplicate is first
+    assert other_user is not first
+    assert REGISTRY.get_sample_value("umbra_agent_coalesced_requests_total", labels) == coalesced_before + 1
+    assert len(resilience.agent_singleflight) == 0
+
+
+def test_admission_counts_calls_abandoned_by_timeout_or_cancellation(monkeypatch):
+    admission = resilience.AsyncAdmission(limit=2)
+    monkeypatch.setattr(resilience, "async_admission", admission)
+    monkeypatch.setattr(resilience, "AI_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(resilience, "AI_MAX_RETRIES", 0)
+
+    def abandoned(reason):
+        return REGISTRY.get_sample_value("umbra_agent_abandoned_calls_total", {"reason": reason}) or 0.0
+
+    timeouts_before, cancelled_before = abandoned("timeout"), abandoned("cancelled")
+
+    async def hung_call(_prompt):
+        await asyncio.sleep(5)
+
+    async def hold_slot():
+        async with admission.slot():
+            await asyncio.sleep(5)
+
+    async def scenario():
+        with pytest.raises(TimeoutError):
+            await resilience.arun_agent_with_resilience("ugc", "a", "req-1", hung_call)
+        task = asyncio.create_task(hold_slot())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    anyio.run(scenario)
+
+    assert abandoned("timeout") == timeouts_before + 1
+    assert abandoned("cancelled") == cancelled_before + 1
+    assert admission.inflight == 0
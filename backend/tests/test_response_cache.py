@@ -0,0 +1,116 @@
+import anyio
+
+import main
+import response_cache
+from main import EmailRequest
+from knowledge_base.embedding_cache import embedding_key
+from tests.conftest import DummyAgent
+
+
+class CountingAgent(DummyAgent):
+    def __init__(self, content: str):
+        super().__init__(content)
+        self.calls = 0
+
+    def arun(self, message: str, stream: bool = False, **options):
+        self.calls += 1
+        return super().arun(message, stream=stream, **options)
+
+
+def _email_payload(objective: str = "Vender o curso") -> dict:
+    return {"product_name": "Curso X", "audience_name": "Iniciantes", "objective": objective}
+
+
+def test_repeated_generation_is_served_from_cache(client, auth_headers, monkeypatch):
+    agent = CountingAgent('{"subject": "Oi", "body": "Texto"}')
+    monkeypatch.setattr(main, "get_email_agent", lambda: agent)
+
+    first = client.post("/api/email", json=_email_payload(), headers=auth_headers)
+    second = client.post("/api/email", json=_email_payload("  vender O curso "), headers=auth_headers)
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "EXACT_HIT"
+    assert second.json() == first.json()
+    assert agent.calls == 1
+
+
+def test_no_cache_header_forces_fresh_generation(client, auth_headers, monkeypatch):
+    agent = CountingAgent('{"subject": "Oi", "body": "Texto"}')
+    monkeypatch.setattr(main, "get_email_agent", lambda: agent)
+
+    client.post("/api/email", json=_email_payload(), headers=auth_headers)
+    response = client.post(
+        "/api/email",
+        json=_email_payload(),
+        headers={**auth_headers, "Cache-Control": "no-cache"},
+    )
+
+    assert response.headers["X-Cache"] == "BYPASS"
+    assert agent.calls == 2
+
+
+def test_similarity_tier_serves_near_identical_request_for_same_user_only():
+    vectors = {"vender o curso": [1.0, 0.0], "vender o curso hoje": [0.99, 0.05], "outra coisa": [0.0, 1.0]}
+
+    async def embed(text):
+        return next(vector for phrase, vector in vectors.items() if f'"objective": "{phrase}"' in text)
+
+    cache = response_cache.ResponseCache(similarity_threshold=0.95, embed=embed)
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        return {"n": len(calls)}
+
+    async def scenario():
+        await cache.get_or_generate("u1", "email", "v1", EmailRequest(**_email_payload("vender o curso")), generate)
+        near = await cache.get_or_generate("u1", "email", "v1", EmailRequest(**_email_payload("vender o curso hoje")), generate)
+        other_user = await cache.get_or_generate("u2", "email", "v1", EmailRequest(**_email_payload("vender o curso")), generate)
+        far = await cache.get_or_generate("u1", "email", "v1", EmailRequest(**_email_payload("outra coisa")), generate)
+        return near, other_user, far
+
+    near, other_user, far = anyio.run(scenario)
+
+    assert near == ({"n": 1}, "similar_hit")
+    assert other_user[1] == "miss"
+    assert far[1] == "miss"
+
+
+def test_similarity_scan_only_visits_entries_of_the_request_scope():
+    async def embed(text):
+        return [1.0, 0.0]
+
+    cache = response_cache.ResponseCache(similarity_threshold=0.95, embed=embed, max_entries=3)
+
+    async def generate():
+        return {"ok": True}
+
+    async def scenario():
+        for user in ("u1", "u2", "u3", "u4"):
+            await cache.get_or_generate(user, "email", "v1", EmailRequest(**_email_payload(user)), generate)
+
+    anyio.run(scenario)
+
+    assert set(cache._by_scope) == {("u2", "email", "v1"), ("u3", "email", "v1"), ("u4", "email", "v1")}
+    assert all(len(keys) == 1 for keys in cache._by_scope.values())
+    assert cache._get_similar(("u1", "email", "v1"), [1.0, 0.0]) is None
+    assert cache._get_similar(("u4", "email", "v1"), [1.0, 0.0]) is not None
+
+
+def test_request_embeddings_use_their_own_cache_file(monkeypatch, tmp_path):
+    from knowledge_base import embedding_cache
+
+    class FakeEmbedder:
+        id = "text-embedding-3-small"
+
+        async def async_get_embeddings_batch_and_usage(self, texts):
+            return [[1.0, 0.0] for _ in texts], [None for _ in texts]
+
+    request_path = tmp_path / "requests.sqlite3"
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_EMBEDDING_PATH", str(request_path))
+    embedder = response_cache._RequestEmbedder()
+    embedder.embedder = FakeEmbedder()
+
+    assert anyio.run(embedder, "um pedido") == [1.0, 0.0]
+    assert request_path.exists()
+    assert embedding_cache.get_embedding_cache().get_many([embedding_key("um pedido", FakeEmbedder.id)]) == {}
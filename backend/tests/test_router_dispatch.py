@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import anyio
+
+import agent as router_agent
+from tests.conftest import DummyResponse
+
+
+class SleepyAgent:
+    def __init__(self, content: str, delay: float):
+        self.content = content
+        self.delay = delay
+
+    async def arun(self, _message: str):
+        await asyncio.sleep(self.delay)
+        return DummyResponse(self.content)
+
+
+def test_dispatch_runs_specialists_concurrently(monkeypatch):
+    monkeypatch.setitem(router_agent.SPECIALISTS, "content", lambda user_id: SleepyAgent(f"post:{user_id}", 0.2))
+    monkeypatch.setitem(router_agent.SPECIALISTS, "email", lambda user_id: SleepyAgent("email", 0.2))
+    monkeypatch.setitem(router_agent.SPECIALISTS, "static_ad", lambda user_id: SleepyAgent("ad", 0.2))
+
+    started = time.perf_counter()
+    results = anyio.run(
+        lambda: router_agent.dispatch_specialist_tasks(
+            [
+                {"agent": "content", "prompt": "post"},
+                {"agent": "email", "prompt": "email"},
+                {"agent": "static_ad", "prompt": "ad"},
+            ],
+            user_id="user-a",
+        )
+    )
+    elapsed = time.perf_counter() - started
+
+    assert [result["content"] for result in results] == ["post:user-a", "email", "ad"]
+    assert elapsed < 0.5
+
+
+def test_dispatch_returns_partial_results_on_deadline(monkeypatch):
+    monkeypatch.setitem(router_agent.SPECIALISTS, "content", lambda user_id: SleepyAgent("post", 0.01))
+    monkeypatch.setitem(router_agent.SPECIALISTS, "email", lambda user_id: SleepyAgent("email", 5))
+
+    results = anyio.run(
+        lambda: router_agent.dispatch_specialist_tasks(
+            [
+                {"agent": "content", "prompt": "post"},
+                {"agent": "email", "prompt": "email"},
+                {"agent": "nope", "prompt": "x"},
+            ],
+            user_id="user-a",
+            timeout_seconds=0.2,
+        )
+    )
+
+    assert [result["status"] for result in results] == ["ok", "timeout", "error"]
+    assert results[0]["content"] == "post"
+
+
+def test_dispatch_reports_tasks_beyond_the_cap_instead_of_dropping_them(monkeypatch):
+    monkeypatch.setitem(router_agent.SPECIALISTS, "email", lambda user_id: SleepyAgent("email", 0))
+    tasks = [{"agent": "email", "prompt": f"email {index}"} for index in range(router_agent.ROUTER_MAX_PARALLEL_TASKS + 2)]
+
+    results = anyio.run(lambda: router_agent.dispatch_specialist_tasks(tasks, user_id="user-a"))
+
+    assert len(results) == len(tasks)
+    assert [result["status"] for result in results] == ["ok"] * router_agent.ROUTER_MAX_PARALLEL_TASKS + ["error"] * 2
+    assert all("not run" in result["error"] for result in results[router_agent.ROUTER_MAX_PARALLEL_TASKS:])
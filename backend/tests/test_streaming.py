@@ -0,0 +1,107 @@
+import json
+
+import resilience
+
+from tests.conftest import DummyAgent
+
+
+def _parse_sse(text: str) -> list[tuple[str | None, dict]]:
+    events = []
+    for block in text.strip().split("\n\n"):
+        event_name = None
+        data = None
+        for line in block.splitlines():
+            if line.startswith("event: "):
+                event_name = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event_name, data))
+    return events
+
+
+def test_content_stream_emits_deltas_and_done(client, auth_headers, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "get_content_agent", lambda user_id: DummyAgent("ola mundo"))
+
+    response = client.post(
+        "/api/content/stream",
+        json={"message": "Crie um post curto"},
+        headers={**auth_headers, "X-Request-ID": "rid-stream-1"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers.get("X-Request-ID") == "rid-stream-1"
+
+    events = _parse_sse(response.text)
+    assert [data["delta"] for name, data in events if name is None] == ["ola", "mundo"]
+    assert events[-1] == ("done", {"request_id": "rid-stream-1"})
+
+
+def test_chat_stream_reports_navigation_action(client, auth_headers, monkeypatch):
+    import agent as router_agent
+
+    action = '{"type":"action","action":"navigate","path":"/dashboard/brain","message":"ok"}'
+    monkeypatch.setattr(router_agent, "get_agent", lambda user_id: DummyAgent(action))
+
+    response = client.post("/api/chat/stream", json={"message": "abrir brain"}, headers=auth_headers)
+
+    assert response.status_code == 200
+    name, done = _parse_sse(response.text)[-1]
+    assert name == "done"
+    assert done["action"]["path"] == "/dashboard/brain"
+
+
+def test_stream_timeout_before_first_delta_returns_504(client, auth_headers, monkeypatch):
+    import asyncio
+
+    import main
+
+    class HungStreamAgent:
+        def arun(self, _message: str, stream: bool = False, **_options):
+            async def events():
+                await asyncio.sleep(30)
+                yield None
+
+            return events()
+
+    monkeypatch.setattr(resilience, "AI_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(resilience, "AI_MAX_RETRIES", 0)
+    monkeypatch.setattr(main, "get_content_agent", lambda user_id: HungStreamAgent())
+
+    response = client.post("/api/content/stream", json={"message": "oi"}, headers=auth_headers)
+    assert response.status_code == 504
+
+
+def test_client_disconnect_mid_stream_is_recorded_as_disconnected(monkeypatch):
+    import asyncio
+
+    import anyio
+    from prometheus_client import REGISTRY
+
+    monkeypatch.setattr(resilience, "AI_MAX_RETRIES", 0)
+
+    def calls(status):
+        labels = {"agent": "content", "status": status, "parent_agent": ""}
+        return REGISTRY.get_sample_value("umbra_agent_calls_total", labels) or 0.0
+
+    class ContentEvent:
+        content = "ola"
+
+    async def endless_events(_prompt):
+        while True:
+            yield ContentEvent()
+            await asyncio.sleep(0)
+
+    disconnected_before, errors_before = calls("disconnected"), calls("error")
+
+    async def read_one_chunk_then_leave():
+        deltas = resilience.astream_agent_with_resilience("content", "oi", "req-1", endless_events)
+        assert await deltas.__anext__() == "ola"
+        await deltas.aclose()
+
+    anyio.run(read_one_chunk_then_leave)
+
+    assert calls("disconnected") == disconnected_before + 1
+    assert calls("error") == errors_before
@@ -0,0 +1,180 @@
+import json
+
+import anyio
+import pytest
+
+import agent as router_agent
+import main
+import resilience
+import tracing
+from agents import research_tools
+from tests.conftest import DummyAgent, DummyResponse
+
+
+@pytest.fixture
+def trace_file(monkeypatch, tmp_path):
+    path = tmp_path / "traces" / "spans.jsonl"
+    tracer = tracing.Tracer(sample_rate=1.0, exporter=tracing.JsonlSpanExporter(str(path)))
+    monkeypatch.setattr(tracing, "_tracer", tracer)
+    return path
+
+
+def _spans(path) -> list[dict]:
+    assert tracing.get_tracer().flush()
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def _by_name(spans: list[dict]) -> dict[str, list[dict]]:
+    grouped: dict[str, list[dict]] = {}
+    for span in spans:
+        grouped.setdefault(span["name"], []).append(span)
+    return grouped
+
+
+def test_request_spans_are_nested_under_the_request_id(client, auth_headers, monkeypatch, trace_file):
+    monkeypatch.setattr(main, "get_email_agent", lambda: DummyAgent('{"subject": "Oi", "body": "Texto"}'))
+
+    response = client.post(
+        "/api/email",
+        json={"product_name": "Curso X", "audience_name": "Iniciantes", "objective": "Vender"},
+        headers={**auth_headers, "X-Request-ID": "req-trace-1"},
+    )
+    spans = _by_name(_spans(trace_file))
+
+    assert response.status_code == 200
+    [root] = spans["http.request"]
+    [agent_run] = spans["agent.run"]
+    [parse] = spans["json.parse"]
+    assert root["parent_span_id"] is None
+    assert root["attributes"] == {"method": "POST", "request_id": "req-trace-1", "route": "/api/email", "status_code": 200}
+    assert agent_run["parent_span_id"] == root["span_id"]
+    assert agent_run["attributes"]["agent"] == "email"
+    assert parse["parent_span_id"] == root["span_id"]
+    assert {span["trace_id"] for group in spans.values() for span in group} == {root["trace_id"]}
+    assert {span["request_id"] for group in spans.values() for span in group} == {"req-trace-1"}
+
+
+def test_specialist_and_parallel_search_spans_nest_under_the_router(monkeypatch, trace_file):
+    monkeypatch.setattr(resilience, "AI_MAX_RETRIES", 0)
+    monkeypatch.setattr(
+        research_tools,
+        "_run_search",
+        lambda query, max_results, recency, region: [{"title": query, "url": f"https://example.com/{query}"}],
+    )
+
+    class ResearchingAgent(DummyAgent):
+        async def _respond(self):
+            return DummyResponse(research_tools.search_web_multi(["a", "b"]))
+
+    monkeypatch.setitem(router_agent.SPECIALISTS, "content", lambda user_id: ResearchingAgent(""))
+
+    async def router_turn(_prompt):
+        return DummyResponse(await router_agent._run_specialist_tool("content", "um post", "user-a"))
+
+    anyio.run(lambda: resilience.arun_agent_with_resilience("router", "oi", "req-2", router_turn))
+    spans = _by_name(_spans(trace_file))
+
+    runs = {span["attributes"]["agent"]: span for span in spans["agent.run"]}
+    [multi] = spans["search_web_multi"]
+    queries = spans["search_web.query"]
+    assert runs["router"]["parent_span_id"] is None
+    assert runs["content"]["parent_span_id"] == runs["router"]["span_id"]
+    assert runs["content"]["attributes"]["parent_agent"] == "router"
+    assert multi["parent_span_id"] == runs["content"]["span_id"]
+    assert len(queries) == 2
+    assert all(query["parent_span_id"] == multi["span_id"] for query in queries)
+    assert all(query["attributes"]["cache_hit"] is False for query in queries)
+
+
+def test_failed_span_records_the_error(trace_file):
+    with pytest.raises(ValueError):
+        with tracing.span("work"):
+            raise ValueError("boom")
+
+    [span] = _spans(trace_file)
+    assert span["status"] == "error"
+    assert span["error"] == "ValueError: boom"
+
+
+def test_unsampled_request_records_nothing(client, monkeypatch, tmp_path):
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(tracing, "_tracer", tracing.Tracer(sample_rate=0.0, exporter=tracing.JsonlSpanExporter(str(path))))
+
+    with tracing.request_span("req-3") as root:
+        with tracing.span("agent.run") as child:
+            pass
+    client.get("/")
+
+    assert root is tracing.NOOP_SPAN
+    assert child is tracing.NOOP_SPAN
+    assert _spans(path) == []
+
+
+def test_sampled_traceparent_forces_a_trace_and_joins_it(client, monkeypatch, tmp_path):
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(tracing, "_tracer", tracing.Tracer(sample_rate=0.0, exporter=tracing.JsonlSpanExporter(str(path))))
+    trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+
+    client.get("/", headers={"traceparent": f"00-{trace_id}-{parent_id}-01", "X-Request-ID": "req-4"})
+    client.get("/", headers={"traceparent": f"00-{trace_id}-{parent_id}-00"})
+    [root] = _spans(path)
+
+    assert root["trace_id"] == trace_id
+    assert root["parent_span_id"] == parent_id
+    assert root["request_id"] == "req-4"
+
+
+def test_otlp_payload_follows_the_json_encoding():
+    record = {
+        "trace_id": "4bf92f3577b34da6a3ce929d0e0e4736",
+        "span_id": "00f067aa0ba902b7",
+        "parent_span_id": None,
+        "request_id": "req-5",
+        "name": "http.request",
+        "start_time_unix_nano": 1_000,
+        "end_time_unix_nano": 2_000,
+        "duration_ms": 0.001,
+        "status": "error",
+        "error": "TimeoutError: late",
+        "attributes": {"status_code": 504, "cache_hit": False, "route": "/api/chat"},
+    }
+
+    payload = tracing.OtlpHttpSpanExporter(service_name="umbra-test").payload([record])
+    resource_spans = payload["resourceSpans"][0]
+    [span] = resource_spans["scopeSpans"][0]["spans"]
+
+    assert resource_spans["resource"]["attributes"] == [{"key": "service.name", "value": {"stringValue": "umbra-test"}}]
+    assert span["traceId"] == record["trace_id"]
+    assert span["parentSpanId"] == ""
+    assert span["kind"] == 2
+    assert span["startTimeUnixNano"] == "1000"
+    assert span["status"] == {"code": 2, "message": "TimeoutError: late"}
+    assert {attribute["key"]: attribute["value"] for attribute in span["attributes"]} == {
+        "status_code": {"intValue": "504"},
+        "cache_hit": {"boolValue": False},
+        "route": {"stringValue": "/api/chat"},
+        "request_id": {"stringValue": "req-5"},
+    }
+
+
+def test_stream_span_covers_the_whole_stream(trace_file):
+    async def consume():
+        chunks = []
+        with tracing.span("http.request"):
+            stream = resilience.astream_agent_with_resilience(
+                "content", "oi", "req-6", lambda prompt: DummyAgent("um dois tres").arun(prompt, stream=True)
+            )
+            async for chunk in stream:
+                chunks.append(chunk)
+        return chunks
+
+    assert anyio.run(consume) == ["um", "dois", "tres"]
+    spans = _by_name(_spans(trace_file))
+
+    [root] = spans["http.request"]
+    [stream_span] = spans["agent.stream"]
+    assert stream_span["parent_span_id"] == root["span_id"]
+    assert stream_span["status"] == "ok"
+    assert "first_chunk_ms" in stream_span["attributes"]
@@ -0,0 +1,170 @@
+import anyio
+import pytest
+from agno.metrics import ModelMetrics, RunMetrics
+from prometheus_client import REGISTRY
+
+import agent as router_agent
+import main
+import resilience
+import usage
+from tests.conftest import DummyAgent, DummyResponse, build_scripted_agent
+from tests.test_streaming import _parse_sse
+
+
+def _run_metrics(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> RunMetrics:
+    model_metrics = ModelMetrics(
+        id=model,
+        provider="OpenAI",
+        input_tokens=prompt_tokens,
+        output_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+        cache_read_tokens=cached_tokens,
+    )
+    return RunMetrics(
+        input_tokens=prompt_tokens,
+        output_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+        cache_read_tokens=cached_tokens,
+        details={"model": [model_metrics]},
+    )
+
+
+class MeteredAgent(DummyAgent):
+    def __init__(self, content: str, metrics: RunMetrics):
+        super().__init__(content)
+        self.metrics = metrics
+
+    async def _respond(self):
+        response = DummyResponse(self._content)
+        response.metrics = self.metrics
+        return response
+
+
+def _tokens(agent: str, model: str, kind: str) -> float:
+    return REGISTRY.get_sample_value("umbra_llm_tokens_total", {"agent": agent, "model": model, "kind": kind}) or 0.0
+
+
+def test_cost_uses_cached_prompt_price():
+    cost = usage.estimate_cost_usd("gpt-4o", prompt_tokens=1_000_000, completion_tokens=100_000, cached_tokens=400_000)
+
+    assert cost == pytest.approx(0.6 * 2.50 + 0.4 * 1.25 + 0.1 * 10.00)
+    assert usage.estimate_cost_usd("some-new-model", 1000, 1000) == 0.0
+
+
+def test_router_and_nested_specialist_usage_is_attributed_to_the_user(monkeypatch, isolated_metrics_aggregator):
+    monkeypatch.setattr(resilience, "AI_MAX_RETRIES", 0)
+    specialist = MeteredAgent("post pronto", _run_metrics("gpt-4o-mini", 300, 200))
+    monkeypatch.setitem(router_agent.SPECIALISTS, "content", lambda user_id: specialist)
+    completion_before = _tokens("content", "gpt-4o-mini", "completion")
+
+    async def router_turn(_prompt):
+        content = await router_agent._run_specialist_tool("content", "um post", "user-a")
+        response = DummyResponse(content)
+        response.metrics = _run_metrics("gpt-4o", 1000, 100, cached_tokens=600)
+        return response
+
+    anyio.run(lambda: resilience.arun_agent_with_resilience("router", "oi", "req-1", router_turn, user_id="user-a"))
+    summary = isolated_metrics_aggregator.refresh()["llm_usage"]
+
+    assert _tokens("content", "gpt-4o-mini", "completion") == completion_before + 200
+    [user] = summary["by_user"]
+    assert user["user_id"] == "user-a"
+    assert user["total_tokens"] == 1600
+    assert user["cached_tokens"] == 600
+    by_agent = {(row["agent"], row["model"]): row for row in summary["by_agent_model"]}
+    assert by_agent[("router", "gpt-4o")]["cost_usd"] == pytest.approx(
+        usage.estimate_cost_usd("gpt-4o", 1000, 100, 600)
+    )
+    assert by_agent[("content", "gpt-4o-mini")]["calls"] == 1
+
+
+def test_endpoint_rollup_uses_route_template(client, auth_headers, monkeypatch, isolated_metrics_aggregator):
+    agent = MeteredAgent('{"subject": "Oi", "body": "Texto"}', _run_metrics("gpt-4o", 500, 250))
+    monkeypatch.setattr(main, "get_email_agent", lambda: agent)
+
+    client.post(
+        "/api/email",
+        json={"product_name": "Curso X", "audience_name": "Iniciantes", "objective": "Vender"},
+        headers=auth_headers,
+    )
+    summary = isolated_metrics_aggregator.refresh()["llm_usage"]
+
+    assert summary["by_endpoint"][0]["endpoint"] == "/api/email"
+    assert summary["by_endpoint"][0]["total_tokens"] == 750
+    assert summary["by_user"][0]["user_id"] == "user-test-123"
+
+
+def test_streamed_run_usage_is_recorded_from_agnos_run_output(client, auth_headers, monkeypatch, isolated_metrics_aggregator):
+    agent = build_scripted_agent(chunks=("ola ", "mundo"), usage=(400, 120))
+    monkeypatch.setattr(main, "get_content_agent", lambda user_id: agent)
+    completion_before = _tokens("content", "gpt-4o-mini", "completion")
+
+    response = client.post("/api/content/stream", json={"message": "Crie um post"}, headers=auth_headers)
+    summary = isolated_metrics_aggregator.refresh()["llm_usage"]
+
+    # The final RunOutput is accounted, never sent as a delta.
+    assert [data["delta"] for name, data in _parse_sse(response.text) if name is None] == ["ola ", "mundo"]
+    assert _tokens("content", "gpt-4o-mini", "completion") == completion_before + 120
+    assert summary["by_endpoint"][0]["endpoint"] == "/api/content/stream"
+    assert summary["by_endpoint"][0]["total_tokens"] == 520
+    assert summary["by_user"][0]["user_id"] == "user-test-123"
+
+
+def test_batched_embedding_usage_is_counted_once_per_request(isolated_metrics_aggregator):
+    batch_usage = {"prompt_tokens": 120, "total_tokens": 120}
+
+    with usage.bill_to("user-b"):
+        total = usage.record_embedding_usage("text-embedding-3-small", [batch_usage, batch_usage, batch_usage, None])
+    summary = isolated_metrics_aggregator.refresh()["llm_usage"]
+
+    assert total == 120
+    assert [row["user_id"] for row in summary["by_user"]] == ["user-b"]
+    assert summary["by_endpoint"][0]["endpoint"] == "__background__"
+    assert summary["by_agent_model"][0]["agent"] == "embedding"
+
+
+def test_retrieval_query_embedding_is_charged_to_the_requesting_user(monkeypatch, isolated_metrics_aggregator):
+    import asyncio
+    from types import SimpleNamespace
+
+    from knowledge_base.core import TracedOpenAIEmbedder
+
+    embedder = TracedOpenAIEmbedder(id="text-embedding-3-small")
+    query_usage = SimpleNamespace(model_dump=lambda: {"prompt_tokens": 7, "total_tokens": 7})
+    monkeypatch.setattr(
+        embedder,
+        "response",
+        lambda text: SimpleNamespace(data=[SimpleNamespace(embedding=[0.1, 0.2])], usage=query_usage),
+    )
+
+    async def search_as_user():
+        # PgVector.async_search embeds the query in a worker thread with the request's context.
+        with usage.bill_to("user-c"):
+            return await asyncio.to_thread(embedder.get_embedding, "qual o playbook?")
+
+    assert anyio.run(search_as_user) == [0.1, 0.2]
+    summary = isolated_metrics_aggregator.refresh()["llm_usage"]
+
+    assert [row["user_id"] for row in summary["by_user"]] == ["user-c"]
+    assert summary["by_agent_model"][0]["agent"] == "embedding"
+    assert summary["by_agent_model"][0]["total_tokens"] == 7
+
+
+def test_user_usage_series_are_evicted_when_idle_for_a_day_or_past_the_cap(monkeypatch):
+    from metrics_summary import MetricsAggregator
+    from tests.test_admin_metrics import FakeClock
+
+    monkeypatch.setattr("metrics_summary.METRICS_SUMMARY_MAX_USERS", 2)
+    clock = FakeClock()
+    aggregator = MetricsAggregator(clock=clock, shared_dir="")
+    values = {"prompt_tokens": 10, "completion_tokens": 0, "cached_tokens": 0, "total_tokens": 10, "cost_usd": 0.0}
+    aggregator.record_usage("idle", "/api/chat", "router", "gpt-4o", values)
+    clock.now += 25 * 3600
+    for user in ("old", "recent", "newest"):
+        aggregator.record_usage(user, "/api/chat", "router", "gpt-4o", values)
+        clock.now += 3600
+
+    by_user = aggregator.refresh()["llm_usage"]["by_user"]
+
+    assert sorted(row["user_id"] for row in by_user) == ["newest", "recent"]
+    assert set(aggregator._usage_users) == {"newest", "recent"}
@@ -0,0 +1,420 @@
+"""
+Lightweight per-request tracing.
+
+Each sampled HTTP request opens a root span tagged with its X-Request-ID;
+everything it does underneath (router and specialist agent runs, research
+tool calls, embeddings, knowledge-base vector search, JSON parsing) opens
+child spans through ``span()``. The current span lives in a context variable,
+so children find their parent across awaits, asyncio tasks and the thread
+pools that copy the context.
+
+The sampling decision is taken once per trace, at its root: TRACE_SAMPLE_RATE
+of the requests are traced (0 disables tracing, 1 traces everything). While
+tracing is enabled, an incoming W3C ``traceparent`` header joins its trace and
+its sampled flag overrides the rate, so a caller can force a trace for one
+request. Unsampled requests only pay a context variable lookup per span.
+
+Finished spans are handed to a background thread and written either as JSON
+lines to TRACE_JSONL_PATH or, with TRACE_EXPORTER=otlp, posted as OTLP/HTTP
+JSON to TRACE_OTLP_ENDPOINT (a local OpenTelemetry collector, Jaeger, Tempo).
+A full export queue drops spans instead of slowing requests down.
+
+Spans opened by a streamed response body can outlive the request's root span;
+they are exported when they end, in the same trace.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from typing import Any, Protocol
+
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "jsonl")
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", ".cache/traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_OTLP_TIMEOUT_SECONDS = float(os.getenv("TRACE_OTLP_TIMEOUT_SECONDS", "2"))
+TRACE_EXPORT_QUEUE_SIZE = int(os.getenv("TRACE_EXPORT_QUEUE_SIZE", "10000"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "umbra-backend")
+
+TRACE_SPANS_TOTAL = Counter(
+    "umbra_trace_spans_total",
+    "Finished trace spans by export outcome (exported, dropped, failed)",
+    ["outcome"],
+)
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_EXPORT_BATCH_SIZE = 512
+
+
+class SpanExporter(Protocol):
+    def export(self, records: list[dict]) -> None: ...
+
+
+class _Trace:
+    """Spans of one trace still waiting for export; flushed whenever no span is open."""
+
+    __slots__ = ("tracer", "trace_id", "request_id", "_lock", "_open", "_finished")
+
+    def __init__(self, tracer: "Tracer", trace_id: str, request_id: str | None):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.request_id = request_id
+        self._lock = threading.Lock()
+        self._open = 0
+        self._finished: list[dict] = []
+
+    def opened(self) -> None:
+        with self._lock:
+            self._open += 1
+
+    def closed(self, record: dict) -> None:
+        with self._lock:
+            self._open -= 1
+            self._finished.append(record)
+            if self._open > 0:
+                return
+            records, self._finished = self._finished, []
+        self.tracer.enqueue(records)
+
+
+class Span:
+    __slots__ = ("name", "trace", "span_id", "parent_span_id", "attributes", "start_ns", "_ended")
+
+    def __init__(self, name: str, trace: _Trace, parent_span_id: str | None, attributes: dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_span_id = parent_span_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self._ended = False
+        trace.opened()
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self, error: BaseException | None = None) -> None:
+        if self._ended:
+            return
+        self._ended = True
+        end_ns = time.time_ns()
+        self.trace.closed(
+            {
+                "trace_id": self.trace.trace_id,
+                "span_id": self.span_id,
+                "parent_span_id": self.parent_span_id,
+                "request_id": self.trace.request_id,
+                "name": self.name,
+                "start_time_unix_nano": self.start_ns,
+                "end_time_unix_nano": end_ns,
+                "duration_ms": round((end_ns - self.start_ns) / 1e6, 3),
+                "status": "error" if error is not None else "ok",
+                "error": f"{type(error).__name__}: {error}" if error is not None else None,
+                "attributes": self.attributes,
+            }
+        )
+
+
+class _NoopSpan:
+    """Stands in for spans of unsampled traces, so children know not to start their own."""
+
+    __slots__ = ()
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def end(self, error: BaseException | None = None) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: contextvars.ContextVar[Span | _NoopSpan | None] = contextvars.ContextVar("trace_current_span", default=None)
+
+
+def _parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    match = _TRACEPARENT_RE.match((header or "").strip().lower())
+    if match is None or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+class Tracer:
+    def __init__(
+        self,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+        exporter: SpanExporter | None = None,
+        queue_size: int = TRACE_EXPORT_QUEUE_SIZE,
+    ):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self._queue: queue.Queue[list[dict] | None] = queue.Queue(maxsize=max(queue_size, 1))
+        self._thread: threading.Thread | None = None
+        self._thread_lock = threading.Lock()
+
+    def start_span(
+        self,
+        name: str,
+        attributes: dict[str, Any],
+        request_id: str | None = None,
+        traceparent: str | None = None,
+    ) -> Span | _NoopSpan:
+        parent = _current_span.get()
+        if isinstance(parent, _NoopSpan):
+            return parent
+        if parent is not None:
+            return Span(name, parent.trace, parent.span_id, attributes)
+
+        upstream = _parse_traceparent(traceparent)
+        if upstream is not None:
+            trace_id, parent_span_id, sampled = upstream
+        else:
+            trace_id, parent_span_id = uuid.uuid4().hex, None
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled or self.exporter is None:
+            return NOOP_SPAN
+        if request_id is not None:
+            attributes["request_id"] = request_id
+        return Span(name, _Trace(self, trace_id, request_id), parent_span_id, attributes)
+
+    def enqueue(self, records: list[dict]) -> None:
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(records)
+        except queue.Full:
+            TRACE_SPANS_TOTAL.labels(outcome="dropped").inc(len(records))
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _export_loop(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch, taken = [], 1
+            while item is not None:
+                batch.extend(item)
+                if len(batch) >= _EXPORT_BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+            stopping = item is None
+            try:
+                if batch:
+                    self.exporter.export(batch)
+                    TRACE_SPANS_TOTAL.labels(outcome="exported").inc(len(batch))
+            except Exception as exc:
+                TRACE_SPANS_TOTAL.labels(outcome="failed").inc(len(batch))
+                logger.warning("Falha ao exportar %s spans de trace: %s", len(batch), exc)
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every enqueued span was exported; False if ``timeout`` ran out first."""
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+
+class JsonlSpanExporter:
+    """Appends one JSON object per span to ``path``."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, records: list[dict]) -> None:
+        lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(lines)
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict[str, Any]) -> list[dict]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class OtlpHttpSpanExporter:
+    """Posts spans as OTLP/HTTP JSON (``/v1/traces``) to an OpenTelemetry collector."""
+
+    def __init__(
+        self,
+        endpoint: str = TRACE_OTLP_ENDPOINT,
+        service_name: str = TRACE_SERVICE_NAME,
+        timeout_seconds: float = TRACE_OTLP_TIMEOUT_SECONDS,
+    ):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout_seconds = timeout_seconds
+
+    def payload(self, records: list[dict]) -> dict:
+        spans = []
+        for record in records:
+            attributes = dict(record["attributes"])
+            if record["request_id"] is not None:
+                attributes.setdefault("request_id", record["request_id"])
+            status = {"code": 1}
+            if record["status"] == "error":
+                status = {"code": 2, "message": record["error"] or ""}
+            spans.append(
+                {
+                    "traceId": record["trace_id"],
+                    "spanId": record["span_id"],
+                    "parentSpanId": record["parent_span_id"] or "",
+                    "name": record["name"],
+                    # SERVER for the request's root, INTERNAL for everything under it.
+                    "kind": 2 if record["name"] == "http.request" else 1,
+                    "startTimeUnixNano": str(record["start_time_unix_nano"]),
+                    "endTimeUnixNano": str(record["end_time_unix_nano"]),
+                    "attributes": _otlp_attributes(attributes),
+                    "status": status,
+                }
+            )
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+                    "scopeSpans": [{"scope": {"name": "umbra.tracing"}, "spans": spans}],
+                }
+            ]
+        }
+
+    def export(self, records: list[dict]) -> None:
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(self.payload(records), default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout_seconds) as response:
+            response.read()
+
+
+def _build_exporter() -> SpanExporter | None:
+    if TRACE_SAMPLE_RATE <= 0:
+        return None
+    if TRACE_EXPORTER == "otlp":
+        return OtlpHttpSpanExporter()
+    if TRACE_EXPORTER == "jsonl":
+        return JsonlSpanExporter(TRACE_JSONL_PATH)
+    logger.warning("TRACE_EXPORTER desconhecido (%s) — tracing desabilitado.", TRACE_EXPORTER)
+    return None
+
+
+_tracer_lock = threading.Lock()
+_tracer: Tracer | None = None
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer(exporter=_build_exporter())
+    return _tracer
+
+
+def start_span(name: str, **attributes: Any) -> Span | _NoopSpan:
+    """Open a span under the current one without making it current; the caller must end() it."""
+    return get_tracer().start_span(name, attributes)
+
+
+@contextmanager
+def use_span(current: Span | _NoopSpan):
+    """Make ``current`` the parent of spans opened inside the block."""
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """Trace the block as a child of the current span (or as a new, sampled root)."""
+    current = get_tracer().start_span(name, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.end(exc)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+@contextmanager
+def request_span(request_id: str, traceparent: str | None = None, **attributes: Any):
+    """Root span of an HTTP request; the sampling decision for its whole trace is taken here."""
+    current = get_tracer().start_span("http.request", attributes, request_id=request_id, traceparent=traceparent)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.end(exc)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def current_trace_id() -> str | None:
+    current = _current_span.get()
+    return current.trace_id if current is not None else None
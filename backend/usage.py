@@ -0,0 +1,180 @@
+"""
+LLM token and cost accounting.
+
+Every agent run (top-level and nested router calls alike, see resilience.py)
+and every embedding request reports its prompt, completion and cached-prompt
+tokens here. They are exported as Prometheus counters and a tokens-per-call
+histogram labeled by agent and model, priced with MODEL_PRICES_USD_PER_MILLION,
+and fed to the admin summary, which rolls them up per user, endpoint and
+agent/model. Users never become Prometheus labels.
+
+The billed user is carried in a context variable (bill_to), so nested calls and
+background ingestion are attributed to the user who started them.
+"""
+
+import contextvars
+import json
+import logging
+import os
+from contextlib import contextmanager
+from typing import Any
+
+from prometheus_client import Counter, Histogram
+
+from metrics_summary import get_metrics_aggregator
+from observability import current_endpoint
+
+logger = logging.getLogger(__name__)
+
+# USD per million tokens: (prompt, cached prompt, completion). MODEL_PRICES_JSON
+# overrides or extends it, e.g. {"gpt-4.1": [2.0, 0.5, 8.0]}.
+MODEL_PRICES_USD_PER_MILLION: dict[str, tuple[float, float, float]] = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.13, 0.0),
+}
+MODEL_PRICES_USD_PER_MILLION.update(
+    {model: tuple(prices) for model, prices in json.loads(os.getenv("MODEL_PRICES_JSON", "{}")).items()}
+)
+
+UNKNOWN_MODEL = "unknown"
+EMBEDDING_AGENT = "embedding"
+
+LLM_TOKENS_TOTAL = Counter(
+    "umbra_llm_tokens_total",
+    "LLM tokens by agent, model and kind (prompt, completion, cached_prompt)",
+    ["agent", "model", "kind"],
+)
+LLM_COST_USD_TOTAL = Counter(
+    "umbra_llm_cost_usd_total",
+    "Estimated LLM spend in USD by agent and model",
+    ["agent", "model"],
+)
+LLM_TOKENS_PER_CALL = Histogram(
+    "umbra_llm_tokens_per_call",
+    "Total tokens per model call by agent and model",
+    ["agent", "model"],
+    buckets=(100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000),
+)
+
+_billed_user: contextvars.ContextVar[str | None] = contextvars.ContextVar("usage_billed_user", default=None)
+
+
+def billed_user() -> str | None:
+    return _billed_user.get()
+
+
+@contextmanager
+def bill_to(user_id: str | None):
+    """Attribute usage inside the block to ``user_id``; None keeps the current user."""
+    if user_id is None:
+        yield
+        return
+    token = _billed_user.set(user_id)
+    try:
+        yield
+    finally:
+        _billed_user.reset(token)
+
+
+def estimate_cost_usd(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    prices = MODEL_PRICES_USD_PER_MILLION.get(model)
+    if prices is None:
+        return 0.0
+    prompt_price, cached_price, completion_price = prices
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (uncached * prompt_price + cached_tokens * cached_price + completion_tokens * completion_price) / 1_000_000
+
+
+def record_usage(
+    agent: str,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int = 0,
+    cached_tokens: int = 0,
+    cost_usd: float | None = None,
+    duration_seconds: float | None = None,
+) -> int:
+    """Record one model call's usage; returns its total tokens."""
+    model = model or UNKNOWN_MODEL
+    total = prompt_tokens + completion_tokens
+    if total <= 0:
+        return 0
+    if cost_usd is None:
+        cost_usd = estimate_cost_usd(model, prompt_tokens, completion_tokens, cached_tokens)
+
+    LLM_TOKENS_TOTAL.labels(agent=agent, model=model, kind="prompt").inc(prompt_tokens)
+    LLM_TOKENS_TOTAL.labels(agent=agent, model=model, kind="completion").inc(completion_tokens)
+    if cached_tokens:
+        LLM_TOKENS_TOTAL.labels(agent=agent, model=model, kind="cached_prompt").inc(cached_tokens)
+    LLM_COST_USD_TOTAL.labels(agent=agent, model=model).inc(cost_usd)
+    LLM_TOKENS_PER_CALL.labels(agent=agent, model=model).observe(total)
+
+    get_metrics_aggregator().record_usage(
+        user=billed_user() or "anonymous",
+        endpoint=current_endpoint(),
+        agent=agent,
+        model=model,
+        values={
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "total_tokens": total,
+            "cost_usd": cost_usd,
+        },
+        duration_seconds=duration_seconds,
+    )
+    return total
+
+
+def _int(value: Any) -> int:
+    return value if isinstance(value, int) else 0
+
+
+def record_run_usage(agent: str, run_output: object, duration_seconds: float | None = None) -> int:
+    """Record the usage of an agent run (RunOutput or RunCompleted event); returns its total tokens.
+
+    Runs that used several models (e.g. a parser model) are split per model
+    from the run metrics' details.
+    """
+    metrics = getattr(run_output, "metrics", None)
+    if metrics is None:
+        return 0
+
+    details = getattr(metrics, "details", None) or {}
+    per_model = [model_metrics for entries in details.values() for model_metrics in entries or []]
+    if not per_model:
+        per_model = [metrics]
+    fallback_model = getattr(run_output, "model", None)
+
+    total = 0
+    for index, model_metrics in enumerate(per_model):
+        cost = getattr(model_metrics, "cost", None)
+        total += record_usage(
+            agent=agent,
+            model=getattr(model_metrics, "id", None) or fallback_model or UNKNOWN_MODEL,
+            prompt_tokens=_int(getattr(model_metrics, "input_tokens", 0)),
+            completion_tokens=_int(getattr(model_metrics, "output_tokens", 0)),
+            cached_tokens=_int(getattr(model_metrics, "cache_read_tokens", 0)),
+            cost_usd=cost if isinstance(cost, (int, float)) else None,
+            # The run's latency belongs to its main model only.
+            duration_seconds=duration_seconds if index == 0 else None,
+        )
+    return total
+
+
+def record_embedding_usage(model: str, usages: list[dict | None]) -> int:
+    """Record embedding usage; batch calls repeat one usage dict per text, so each is counted once."""
+    seen: set[int] = set()
+    total = 0
+    for usage in usages:
+        if not usage or id(usage) in seen:
+            continue
+        seen.add(id(usage))
+        total += record_usage(
+            agent=EMBEDDING_AGENT,
+            model=model,
+            prompt_tokens=_int(usage.get("prompt_tokens") or usage.get("total_tokens")),
+        )
+    return total
@@ -97,7 +97,7 @@ export default function BrainPage() {
             const currentFiles = files || [];
             setFiles([newFile, ...currentFiles]);
 
-            toast.success(`Arquivo processado com sucesso: ${result.message}`);
+            toast.success(result.message);
 
         } catch (error: unknown) {
             console.error(error);